@@ -1,14 +1,71 @@
+from django.conf import settings
 from django.contrib import admin, messages
-from django.urls import reverse
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
 from django.utils.html import format_html
-from .models import User, Book, BookCopy, Reservation, Borrowing
+from .models import (
+    User, Book, BookCopy, Reservation, Borrowing, CirculationPolicy, DailyCirculationStat, Job,
+    ReservationHistory, BorrowingHistory, StockTake, CopyEvent, Branch, TransferRequest, Notification,
+    NotificationDigest,
+)
+from .policies import get_policy
+from .concurrency import ConcurrentUpdateError
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources
 from django import forms
 from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.utils import timezone
+from .admin_changelist import FastChangeListMixin
+from .exports import csv_response, xlsx_response
+from .hold_shelf import confirm_pickups, ready_holds
+from .stocktake import CATEGORIES, apply_corrections, reconcile
+from . import transfers
+from .user_import import read_roster
+from .jobs import enqueue
+from io import TextIOWrapper
+from pathlib import Path
+import uuid
 
 
-class ReservationAdminForm(forms.ModelForm):
+CONFLICT_MESSAGE = (
+    "This record was changed by someone else while you were editing it. "
+    "Reload the page and apply your changes again."
+)
+
+class VersionedModelForm(forms.ModelForm):
+    """
+    Carries the version the editor loaded through the form, so saving over a
+    change made by someone else in the meantime fails instead of overwriting it.
+    """
+    # Not named "version": the admin would then try to put the non-editable model field on the form.
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial['loaded_version'] = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get('loaded_version')
+        if self.instance.pk and version is not None:
+            if version != type(self.instance).objects.filter(pk=self.instance.pk).values_list('version', flat=True).first():
+                raise ValidationError(CONFLICT_MESSAGE)
+            # The save is then conditional on the version the editor saw.
+            self.instance.version = version
+        return cleaned_data
+
+class ConcurrencyAdminMixin:
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConcurrentUpdateError:
+            messages.error(request, CONFLICT_MESSAGE)
+            return redirect(request.path)
+
+class ReservationAdminForm(VersionedModelForm):
     class Meta:
         model = Reservation
         fields = '__all__'
@@ -51,19 +108,20 @@ class BookResource(resources.ModelResource):
 class BookCopyInline(admin.TabularInline):
     model = BookCopy
     extra = 1
-    fields = ('book', 'condition', 'location')
+    fields = ('book', 'barcode', 'condition', 'location')
 
-class BorrowingForm(forms.ModelForm):
+class BorrowingForm(VersionedModelForm):
     class Meta:
         model = Borrowing
         fields = '__all__'
 
     def clean_due_date(self):
         if self.instance.pk:
-            old_instance = Borrowing.objects.get(pk=self.instance.pk)
+            old_instance = Borrowing.objects.select_related('user', 'copy__book').get(pk=self.instance.pk)
             if old_instance.due_date != self.cleaned_data['due_date']:
-                if old_instance.renewal_count >= 2:
-                    raise forms.ValidationError("Cannot extend due date: Maximum number of renewals (2) reached.")
+                max_renewals = get_policy(old_instance.user, old_instance.copy.book).max_renewals
+                if old_instance.renewal_count >= max_renewals:
+                    raise forms.ValidationError(f"Cannot extend due date: Maximum number of renewals ({max_renewals}) reached.")
                 if old_instance.return_date is not None:
                     raise forms.ValidationError("Cannot extend due date: Borrowing has been returned.")
         return self.cleaned_data['due_date']
@@ -82,6 +140,64 @@ class BorrowingForm(forms.ModelForm):
         instance.save()
         return instance
 
+class StreamingExportMixin:
+    """
+    Adds CSV/XLSX export links to the changelist that honour the current
+    filters and search, plus "export selected" actions. Rows are streamed from
+    a values_list iterator, so exports use constant memory.
+    """
+    change_list_template = 'admin/streaming_export_change_list.html'
+    export_columns = ()
+    export_filename = None
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        urls = [
+            path(
+                'export-stream/<str:file_format>/',
+                self.admin_site.admin_view(self.streaming_export_view),
+                name='%s_%s_export_stream' % info,
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        for name, description in (('export_selected_csv', 'Export selected as CSV'),
+                                  ('export_selected_xlsx', 'Export selected as XLSX')):
+            actions[name] = (getattr(type(self), name), name, description)
+        return actions
+
+    def _export(self, request, queryset, file_format):
+        filename = self.export_filename or self.opts.model_name
+        if file_format == 'csv':
+            return csv_response(queryset, self.export_columns, filename)
+        if file_format == 'xlsx':
+            try:
+                return xlsx_response(queryset, self.export_columns, filename)
+            except ImportError:
+                messages.error(request, "XLSX export requires openpyxl to be installed.")
+                return None
+        messages.error(request, f"Unknown export format '{file_format}'.")
+        return None
+
+    def streaming_export_view(self, request, file_format):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        changelist_url = reverse('admin:%s_%s_changelist' % (self.opts.app_label, self.opts.model_name))
+        try:
+            queryset = self.get_changelist_instance(request).queryset
+        except IncorrectLookupParameters:
+            messages.error(request, "Invalid filter parameters for export.")
+            return redirect(changelist_url)
+        return self._export(request, queryset, file_format) or redirect(changelist_url)
+
+    def export_selected_csv(self, request, queryset):
+        return self._export(request, queryset, 'csv')
+
+    def export_selected_xlsx(self, request, queryset):
+        return self._export(request, queryset, 'xlsx')
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'role')
@@ -93,37 +209,134 @@ class UserAdmin(admin.ModelAdmin):
             'fields': ('username', 'email', 'password1', 'password2', 'role')
         }),
     )
+    change_list_template = 'admin/user_changelist.html'
+
+    def get_urls(self):
+        urls = [
+            path('import-users/', self.admin_site.admin_view(self.import_users_view), name='library_user_import'),
+        ]
+        return urls + super().get_urls()
+
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
-        extra_context['import_users_url'] = '/import-users/'
+        extra_context['import_users_url'] = reverse('admin:library_user_import')
         return super().changelist_view(request, extra_context)
 
+    def import_users_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST' and request.FILES.get('roster_file'):
+            upload = request.FILES['roster_file']
+            roster = TextIOWrapper(upload.file, encoding='utf-8-sig')
+            try:
+                read_roster(roster)
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                roster.detach()
+                # Hashing a large roster takes minutes: hand the file to a worker (tasks.import_users).
+                upload_dir = Path(getattr(settings, 'LIBRARY_USER_IMPORT_DIR', None) or Path(settings.BASE_DIR) / 'imports')
+                upload_dir.mkdir(parents=True, exist_ok=True)
+                path = upload_dir / f'users-{uuid.uuid4().hex}.csv'
+                with open(path, 'wb') as destination:
+                    for chunk in upload.chunks():
+                        destination.write(chunk)
+                enqueue('import_users', {
+                    'path': str(path),
+                    'unusable_passwords': bool(request.POST.get('unusable_passwords')),
+                })
+                messages.success(request, "The roster was queued for import; new users appear here once it has run.")
+                return redirect('admin:library_user_changelist')
+        context = dict(self.admin_site.each_context(request), opts=self.opts, title="Import users")
+        return render(request, 'admin/import_users.html', context)
+
 @admin.register(Book)
-class BookAdmin(ImportExportModelAdmin):
+class BookAdmin(StreamingExportMixin, ImportExportModelAdmin):
     resource_class = BookResource
+    export_columns = (
+        ('ID', 'id'), ('Title', 'title'), ('Author', 'author'), ('ISBN', 'isbn'),
+        ('Publisher', 'publisher'), ('Publication Year', 'publication_year'), ('Genre', 'genre'),
+    )
     list_display = ('title', 'author', 'isbn', 'publication_year', 'genre', 'publisher')
     search_fields = ('title', 'author', 'isbn')
     inlines = [BookCopyInline]
 
 @admin.register(BookCopy)
-class BookCopyAdmin(admin.ModelAdmin):
-    list_display = ('book', 'condition', 'location', 'status')
-    list_filter = ('condition', 'status')
-    search_fields = ('book__title', 'location')
+class BookCopyAdmin(FastChangeListMixin, StreamingExportMixin, admin.ModelAdmin):
+    export_columns = (
+        ('ID', 'id'), ('Book', 'book__title'), ('ISBN', 'book__isbn'), ('Barcode', 'barcode'),
+        ('Branch', 'branch__code'), ('Condition', 'condition'), ('Location', 'location'), ('Status', 'status'),
+    )
+    list_display = ('book', 'barcode', 'branch', 'condition', 'location', 'status')
+    list_select_related = ('book', 'branch')
+    list_filter = ('branch', 'condition', 'status')
+    search_fields = ('book__title', 'location', 'barcode')
 
 @admin.register(Reservation)
-class ReservationAdmin(admin.ModelAdmin):
+class ReservationAdmin(FastChangeListMixin, ConcurrencyAdminMixin, StreamingExportMixin, admin.ModelAdmin):
     form = ReservationAdminForm
-    list_display = ('user', 'book', 'copy', 'reservation_date', 'expiration_date', 'status')
-    list_filter = ('status', 'reservation_date')
+    export_columns = (
+        ('ID', 'id'), ('User', 'user__username'), ('Role', 'user__role'), ('Book', 'book__title'),
+        ('Copy Barcode', 'copy__barcode'), ('Reservation Date', 'reservation_date'),
+        ('Expiration Date', 'expiration_date'), ('Status', 'status'), ('Branch', 'branch__code'),
+    )
+    list_display = ('user', 'book', 'branch', 'copy', 'reservation_date', 'expiration_date', 'status')
+    list_select_related = ('user', 'book', 'branch', 'copy__book')
+    list_filter = ('branch', 'status', 'reservation_date')
     search_fields = ('user__username', 'book__title')
-    actions = ['cancel_reservations']
+    actions = ['cancel_reservations', 'confirm_pickups']
+    change_list_template = 'admin/reservation_change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('hold-shelf/', self.admin_site.admin_view(self.hold_shelf_view), name='library_reservation_hold_shelf'),
+        ]
+        return urls + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['hold_shelf_url'] = reverse('admin:library_reservation_hold_shelf')
+        return super().changelist_view(request, extra_context)
+
+    def _confirm_pickups(self, request, reservation_ids):
+        try:
+            borrowings, skipped = confirm_pickups(reservation_ids)
+        except ConcurrentUpdateError:
+            messages.error(request, "Some of these reservations were changed by someone else; nothing was checked out.")
+            return
+        if borrowings:
+            messages.success(request, f"{len(borrowings)} pickup(s) confirmed.")
+        if skipped:
+            messages.warning(request, f"{len(skipped)} reservation(s) skipped because they are not on the hold shelf.")
+
+    def hold_shelf_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST':
+            self._confirm_pickups(request, request.POST.getlist('reservation'))
+            return redirect('admin:library_reservation_hold_shelf')
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.opts,
+            title="Hold shelf",
+            holds=list(ready_holds()),
+            now=timezone.now(),
+        )
+        return render(request, 'admin/hold_shelf.html', context)
+
+    def confirm_pickups(self, request, queryset):
+        self._confirm_pickups(request, queryset.values_list('pk', flat=True))
+    confirm_pickups.short_description = "Confirm pickup of selected reservations"
 
     def cancel_reservations(self, request, queryset):
         canceled_count = 0
         for reservation in queryset:
             if reservation.status != 'canceled':
-                reservation.cancel()
+                try:
+                    reservation.cancel()
+                except ConcurrentUpdateError:
+                    messages.error(request, f"{reservation} was changed by someone else; it was not canceled.")
+                    continue
                 canceled_count += 1
         if canceled_count:
             messages.success(request, f"{canceled_count} reservation(s) canceled successfully.")
@@ -132,8 +345,14 @@ class ReservationAdmin(admin.ModelAdmin):
     cancel_reservations.short_description = "Cancel selected reservations"
 
 @admin.register(Borrowing)
-class BorrowingAdmin(admin.ModelAdmin):
+class BorrowingAdmin(FastChangeListMixin, ConcurrencyAdminMixin, StreamingExportMixin, admin.ModelAdmin):
+    export_columns = (
+        ('ID', 'id'), ('User', 'user__username'), ('Role', 'user__role'), ('Book', 'copy__book__title'),
+        ('Copy Barcode', 'copy__barcode'), ('Borrow Date', 'borrow_date'), ('Due Date', 'due_date'),
+        ('Return Date', 'return_date'), ('Renewal Count', 'renewal_count'), ('Reservation', 'reservation_id'),
+    )
     list_display = ('user', 'copy', 'borrow_date', 'due_date', 'return_date', 'renewal_count')
+    list_select_related = ('user', 'copy__book')
     list_filter = ('return_date',)
     search_fields = ('user__username', 'copy__book__title')
     form = BorrowingForm
@@ -146,7 +365,7 @@ class BorrowingAdmin(admin.ModelAdmin):
             try:
                 borrowing.renew()
                 renewed += 1
-            except ValidationError as e:
+            except (ValidationError, ConcurrentUpdateError) as e:
                 failed += 1
                 messages.error(request, f"Failed to renew {borrowing}: {str(e)}")
         if renewed:
@@ -157,6 +376,249 @@ class BorrowingAdmin(admin.ModelAdmin):
 
     def return_borrowing(self, request, queryset):
         for borrowing in queryset:
-            borrowing.return_book()
+            try:
+                borrowing.return_book()
+            except ConcurrentUpdateError:
+                messages.error(request, f"{borrowing} was changed by someone else; it was not returned.")
+                continue
             messages.success(request, f"Returned {borrowing.copy}.")
-    return_borrowing.short_description = "Return selected borrowings"
\ No newline at end of file
+    return_borrowing.short_description = "Return selected borrowings"
+
+class HistoryAdmin(FastChangeListMixin, admin.ModelAdmin):
+    """Archived rows are looked up, never edited; see library/history.py."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ReservationHistory)
+class ReservationHistoryAdmin(HistoryAdmin):
+    list_display = ('id', 'user', 'book', 'status', 'reservation_date', 'expiration_date', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('user', 'book')
+    search_fields = ('user__username', 'book__title')
+
+@admin.register(BorrowingHistory)
+class BorrowingHistoryAdmin(HistoryAdmin):
+    list_display = ('id', 'user', 'copy', 'borrow_date', 'due_date', 'return_date', 'reservation_id', 'archived_at')
+    list_select_related = ('user', 'copy__book')
+    search_fields = ('user__username', 'copy__barcode', 'copy__book__title')
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'hold_shelf_location')
+    search_fields = ('code', 'name')
+
+@admin.register(TransferRequest)
+class TransferRequestAdmin(admin.ModelAdmin):
+    list_display = ('copy', 'from_branch', 'to_branch', 'status', 'reservation', 'requested_at', 'dispatched_at', 'received_at')
+    list_filter = ('status', 'from_branch', 'to_branch')
+    list_select_related = ('copy__book', 'from_branch', 'to_branch', 'reservation__user', 'reservation__book')
+    search_fields = ('copy__barcode', 'copy__book__title')
+    raw_id_fields = ('copy', 'reservation')
+    fields = ('copy', 'to_branch', 'reservation', 'status', 'from_branch', 'requested_by', 'requested_at', 'dispatched_at', 'received_at')
+    readonly_fields = ('status', 'from_branch', 'requested_by', 'requested_at', 'dispatched_at', 'received_at')
+    actions = ['dispatch_transfers', 'receive_transfers', 'cancel_transfers']
+
+    def has_change_permission(self, request, obj=None):
+        # Transfers move on through the actions only.
+        return obj is None and super().has_change_permission(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        obj.from_branch_id = obj.copy.branch_id
+        obj.requested_by = request.user
+        if obj.from_branch_id == obj.to_branch_id:
+            messages.warning(request, f"{obj.copy} is already at {obj.to_branch}.")
+        super().save_model(request, obj, form, change)
+
+    def dispatch_transfers(self, request, queryset):
+        try:
+            sent, skipped = transfers.dispatch(queryset.values_list('pk', flat=True))
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+            return
+        messages.success(request, f"Dispatched {len(sent)} transfer(s).")
+        if skipped:
+            messages.warning(request, f"{len(skipped)} transfer(s) skipped: not requested or the copy is not on the shelf.")
+    dispatch_transfers.short_description = "Dispatch selected transfers"
+
+    def receive_transfers(self, request, queryset):
+        received, skipped = transfers.receive(queryset.values_list('pk', flat=True))
+        messages.success(request, f"Received {len(received)} transfer(s).")
+        if skipped:
+            messages.warning(request, f"{len(skipped)} transfer(s) skipped because they are not in transit.")
+    receive_transfers.short_description = "Receive selected transfers"
+
+    def cancel_transfers(self, request, queryset):
+        messages.success(request, f"Canceled {transfers.cancel(queryset.values_list('pk', flat=True))} transfer(s).")
+    cancel_transfers.short_description = "Cancel selected transfers"
+
+@admin.register(CopyEvent)
+class CopyEventAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ('timestamp', 'copy', 'kind', 'old_value', 'new_value', 'user_id', 'borrowing_id', 'worsened')
+    list_filter = ('kind', 'worsened')
+    list_select_related = ('copy__book',)
+    search_fields = ('copy__barcode',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class NotificationInline(admin.TabularInline):
+    model = Notification
+    fields = ('created_at', 'reservation', 'subject', 'status')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(NotificationDigest)
+class NotificationDigestAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'subject', 'status', 'attempts', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = (
+        'user', 'subject', 'message', 'status', 'attempts', 'last_error', 'created_at', 'sent_at', 'claimed_until',
+    )
+    inlines = [NotificationInline]
+    actions = ['retry_digests']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Retry sending failed digests")
+    def retry_digests(self, request, queryset):
+        # The send_notifications job picks them up on its next run.
+        count = queryset.filter(status='failed').update(status='queued', attempts=0)
+        self.message_user(request, f"{count} digests queued again.", messages.SUCCESS)
+
+
+@admin.register(Notification)
+class NotificationAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'subject', 'reservation', 'status', 'digest', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockTake)
+class StockTakeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'branch', 'location_prefix', 'status', 'started_by', 'started_at', 'applied_at')
+    list_filter = ('status', 'branch')
+    readonly_fields = ('status', 'started_by', 'started_at', 'applied_at', 'summary', 'discrepancies')
+    actions = ['apply_stock_takes']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.started_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def discrepancies(self, obj):
+        # Scans are loaded with the stocktake management command.
+        if obj.pk is None or obj.status != 'open':
+            return '-'
+        report = reconcile(obj)
+        return format_html(
+            '<br>'.join(['{}: {}'] * len(CATEGORIES)),
+            *(value for category in CATEGORIES for value in (category.replace('_', ' '), len(report[category]))),
+        )
+
+    def apply_stock_takes(self, request, queryset):
+        for stock_take in queryset.filter(status='open'):
+            apply_corrections(stock_take)
+            stock_take.refresh_from_db()
+            messages.success(request, f"{stock_take.name}: corrected {stock_take.summary['corrected']} copies.")
+    apply_stock_takes.short_description = "Apply scanned locations and conditions"
+
+@admin.register(CirculationPolicy)
+class CirculationPolicyAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'role', 'genre', 'book', 'loan_days', 'max_renewals', 'hold_days', 'max_loans', 'max_holds')
+    list_filter = ('role',)
+    search_fields = ('genre', 'book__title')
+    autocomplete_fields = ('book',)
+
+@admin.register(DailyCirculationStat)
+class CirculationReportAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/circulation_report.html'
+    list_display = ('date', 'dimension', 'label', 'borrows', 'returns', 'reservations', 'holds_filled', 'average_hold_wait')
+    list_filter = ('dimension',)
+    search_fields = ('label',)
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        try:
+            queryset = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            return response  # Redirects and error pages have no changelist
+
+        def summary(dimension, order, limit=10):
+            return list(
+                queryset.filter(dimension=dimension)
+                .values('key', 'label')
+                .annotate(
+                    total_borrows=Sum('borrows'),
+                    total_reservations=Sum('reservations'),
+                    total_holds=Sum('holds_filled'),
+                    total_wait=Sum('hold_wait_seconds'),
+                )
+                .order_by(order)[:limit]
+            )
+
+        def with_average_wait(rows):
+            for row in rows:
+                row['average_wait_days'] = (
+                    round(row['total_wait'] / row['total_holds'] / 86400, 1) if row['total_holds'] else None
+                )
+            return rows
+
+        response.context_data.update({
+            'top_books': with_average_wait(summary('book', '-total_borrows')),
+            'genres': with_average_wait(summary('genre', '-total_borrows', limit=None)),
+            'roles': with_average_wait(summary('role', '-total_borrows', limit=None)),
+        })
+        return response
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'priority', 'run_at', 'attempts', 'locked_by', 'lease_expires_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'dedupe_key', 'locked_by')
+    readonly_fields = ('attempts', 'locked_by', 'lease_expires_at', 'heartbeat_at', 'created_at', 'started_at', 'finished_at', 'last_error')
+    actions = ['requeue_jobs']
+
+    def requeue_jobs(self, request, queryset):
+        requeued = queryset.filter(status='failed').update(status='queued', run_at=timezone.now(), attempts=0, last_error='')
+        messages.success(request, f"Requeued {requeued} failed job(s).")
+    requeue_jobs.short_description = "Requeue selected failed jobs"
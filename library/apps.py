@@ -5,4 +5,5 @@ class LibraryConfig(AppConfig):
     name = 'library'
     
     def ready(self):
-        import library.signals  # Ensure signals are loaded
\ No newline at end of file
+        import library.signals  # Ensure signals are loaded
+        import library.audit  # Coalesces Reservation audit entries per transaction
\ No newline at end of file
@@ -0,0 +1,153 @@
+# File: library/audit.py
+import threading
+
+from auditlog import get_logentry_model
+from auditlog.cid import get_cid
+from auditlog.context import auditlog_value
+from auditlog.diff import model_instance_diff
+from auditlog.signals import pre_log
+from django.contrib.contenttypes.models import ContentType
+from django.db import router, transaction
+from django.dispatch import receiver
+
+from .models import Reservation
+
+_state = threading.local()
+
+
+class AuditBatch:
+    """
+    Audit entries collected during one transaction.
+
+    A reservation saved several times by the signal cascade gets a single
+    entry holding the diff between its state before the transaction and its
+    state at commit. Entries are written with one bulk insert after commit.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.entries = {}
+        self.flushed = False
+
+    def add(self, sender, instance, action):
+        LogEntry = get_logentry_model()
+        key = (sender, instance.pk)
+        entry = self.entries.get(key)
+        if entry is None:
+            if action == LogEntry.Action.CREATE:
+                old = None
+            elif action == LogEntry.Action.DELETE:
+                old = instance  # Logged after the row is gone; the instance still has its values
+            else:
+                old = sender._default_manager.using(self.using).filter(pk=instance.pk).first()
+            entry = self.entries[key] = {'old': old, 'deleted': False, 'instance': instance}
+        entry['instance'] = instance
+        entry['deleted'] = action == LogEntry.Action.DELETE
+
+    def add_updates(self, sender, pks, previous=None):
+        """
+        Track rows about to be changed by a queryset update, with one query for
+        their current state. With ``previous`` the rows were already updated:
+        their state before is the current one with these field values put back.
+        """
+        untracked = [pk for pk in pks if (sender, pk) not in self.entries]
+        for pk, old in sender._default_manager.using(self.using).in_bulk(untracked).items():
+            for field, value in (previous or {}).items():
+                setattr(old, field, value)
+            self.entries[(sender, pk)] = {'old': old, 'deleted': False, 'instance': old}
+
+    def flush(self):
+        self.flushed = True
+        LogEntry = get_logentry_model()
+        try:
+            context = auditlog_value.get()
+        except LookupError:
+            context = {}
+        actor = context.get('actor')
+        actor = actor if getattr(actor, 'pk', None) else None
+        cid = get_cid()
+
+        log_entries = []
+        by_model = {}
+        for (sender, pk), entry in self.entries.items():
+            by_model.setdefault(sender, []).append(pk)
+        for sender, pks in by_model.items():
+            content_type = ContentType.objects.db_manager(self.using).get_for_model(sender)
+            current = sender._default_manager.using(self.using).select_related().in_bulk(pks)
+            for pk in pks:
+                entry = self.entries[(sender, pk)]
+                old = entry['old']
+                new = None if entry['deleted'] else current.get(pk)
+                if old is None and new is None:
+                    continue  # Created and deleted inside the same transaction
+                changes = model_instance_diff(old, new)
+                if not changes:
+                    continue
+                if old is None:
+                    action = LogEntry.Action.CREATE
+                elif new is None:
+                    action = LogEntry.Action.DELETE
+                else:
+                    action = LogEntry.Action.UPDATE
+                log_entries.append(LogEntry(
+                    content_type=content_type,
+                    object_pk=str(pk),
+                    object_id=pk if isinstance(pk, int) else None,
+                    object_repr=str(new or old or entry['instance'])[:2000],
+                    action=action,
+                    changes=changes,
+                    actor=actor,
+                    actor_email=getattr(actor, 'email', None),
+                    remote_addr=context.get('remote_addr'),
+                    remote_port=context.get('remote_port'),
+                    cid=cid,
+                ))
+        self.entries = {}
+        if log_entries:
+            LogEntry.objects.using(self.using).bulk_create(log_entries, batch_size=500)
+
+    def is_registered(self, connection):
+        return not self.flushed and any(getattr(func, '__self__', None) is self for _, func, _ in connection.run_on_commit)
+
+
+def current_batch(using):
+    """Return the audit batch of the running transaction, or None in autocommit mode."""
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return None
+    batch = getattr(_state, 'batch', None)
+    # A rolled back transaction drops its on_commit callbacks; start afresh then.
+    if batch is None or batch.using != using or not batch.is_registered(connection):
+        batch = _state.batch = AuditBatch(using)
+        # Robust: the change is committed by then, and a failed flush (logged by Django)
+        # must not make the caller believe it was not and try again.
+        transaction.on_commit(batch.flush, using=using, robust=True)
+    return batch
+
+
+def record_updates(sender, pks, using=None, previous=None):
+    """
+    Audit rows that are about to be changed with ``update()`` or
+    ``bulk_update()``, which auditlog does not see. Call it inside the
+    transaction, before the update; the entries are written at commit
+    together with the coalesced ones.
+
+    A conditional UPDATE that sets known values can be recorded after it
+    matched instead, passing the values it replaced as ``previous``. That
+    keeps the transaction from reading before it writes, which on SQLite
+    makes concurrent callers fail to upgrade their lock.
+    """
+    using = using or router.db_for_write(sender)
+    batch = current_batch(using)
+    if batch is None:
+        raise transaction.TransactionManagementError("record_updates() must be called inside a transaction.")
+    batch.add_updates(sender, list(pks), previous=previous)
+
+
+@receiver(pre_log, sender=Reservation)
+def coalesce_reservation_log(sender, instance, action, **kwargs):
+    batch = current_batch(router.db_for_write(sender, instance=instance))
+    if batch is None:
+        return None  # Outside a transaction auditlog writes the entry itself
+    batch.add(sender, instance, action)
+    return False
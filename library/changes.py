@@ -0,0 +1,174 @@
+# File: library/changes.py
+"""
+Change feed for incremental sync.
+
+Every change to a Book, BookCopy, Reservation or Borrowing adds a
+ChangeRecord, in the same transaction, with a snapshot of the row. Clients
+keep the highest ``seq`` they have seen and ask for what came after it.
+
+Records are inserted without a sequence number. Once the writing
+transaction has committed, a short transaction of its own takes the
+counter row, hands the records the next numbers and commits. Sequencing
+transactions queue on the counter and commit in sequence order, so a
+client can never read seq 11 while seq 10 is still uncommitted and skip it
+for good (auto-increment ids give no such guarantee on PostgreSQL), yet
+the counter is only locked for the few milliseconds of that UPDATE
+instead of for the whole writing transaction. Records left unsequenced
+by a process that stopped right after its commit are picked up by
+``sequence_pending`` (the sequence_changes job, queued every minute).
+
+Compaction drops all but the newest record per object once records are
+older than the retention period; delete records are kept, so a client
+with an old cursor still converges to the current state.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import Book, BookCopy, Borrowing, ChangeRecord, ChangeSequence, Reservation
+
+SEQUENCE_NAME = 'changes'
+
+TRACKED = {
+    Book: ('title', 'author', 'isbn', 'publication_year', 'genre', 'publisher'),
+    BookCopy: ('book_id', 'branch_id', 'barcode', 'condition', 'location', 'status'),
+    Reservation: ('user_id', 'book_id', 'branch_id', 'copy_id', 'reservation_date', 'expiration_date', 'status'),
+    Borrowing: ('user_id', 'copy_id', 'borrow_date', 'due_date', 'return_date', 'renewal_count', 'reservation_id'),
+}
+# Feed names clients see, and the models whose records are visible to everyone.
+MODEL_NAMES = {model: model._meta.model_name for model in TRACKED}
+PUBLIC_MODELS = ('book', 'bookcopy')
+
+
+def _reserve(count):
+    """
+    Increment the counter by ``count`` and return the first number of the
+    block. The counter row stays locked until the calling transaction ends.
+    """
+    if not ChangeSequence.objects.filter(name=SEQUENCE_NAME).update(value=F('value') + count):
+        ChangeSequence.objects.get_or_create(name=SEQUENCE_NAME)
+        ChangeSequence.objects.filter(name=SEQUENCE_NAME).update(value=F('value') + count)
+    last = ChangeSequence.objects.values_list('value', flat=True).get(name=SEQUENCE_NAME)
+    return last - count + 1
+
+
+def _write(model, rows, action):
+    """``rows`` are ``(pk, values)`` pairs for instances of ``model``."""
+    if not rows:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        records = ChangeRecord.objects.bulk_create([
+            ChangeRecord(
+                model=MODEL_NAMES[model],
+                object_id=pk,
+                action=action,
+                user_id=values.get('user_id'),
+                data=values,
+                created_at=now,
+            )
+            for pk, values in rows
+        ])
+        ids = [record.pk for record in records]
+        transaction.on_commit(lambda: _sequence(ids), robust=True)
+    return records
+
+
+def _sequence(ids):
+    """Number the committed, still unsequenced records among ``ids`` in one short transaction."""
+    with transaction.atomic():
+        _reserve(0)  # Take the counter first, so concurrent sequencers number disjoint records
+        pending = list(
+            ChangeRecord.objects.filter(pk__in=ids, seq__isnull=True).order_by('pk').values_list('pk', flat=True)
+        )
+        if not pending:
+            return 0
+        first = _reserve(len(pending))
+        ChangeRecord.objects.bulk_update(
+            [ChangeRecord(pk=pk, seq=first + offset) for offset, pk in enumerate(pending)], ['seq'], batch_size=1000,
+        )
+    return len(pending)
+
+
+def sequence_pending(older_than=timedelta(seconds=30), batch_size=5000):
+    """Number records whose writer stopped before sequencing them. Returns how many were numbered."""
+    ids = list(
+        ChangeRecord.objects.filter(seq__isnull=True, created_at__lt=timezone.now() - older_than)
+        .order_by('pk').values_list('pk', flat=True)[:batch_size]
+    )
+    return _sequence(ids) if ids else 0
+
+
+def record(instances, action='upsert'):
+    """Record the current state of ``instances``, all of the same tracked model."""
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return []
+    model = type(instances[0])._meta.concrete_model
+    fields = TRACKED[model]
+    rows = [(instance.pk, {field: getattr(instance, field) for field in fields}) for instance in instances]
+    return _write(model, rows, action)
+
+
+def record_ids(model, pks):
+    """
+    Record rows changed with ``queryset.update()`` or ``bulk_create``, which
+    bypass the signals. Reads their current state in one query.
+    """
+    pks = list(pks)
+    if not pks:
+        return []
+    fields = TRACKED[model]
+    rows = [
+        (values.pop('pk'), values)
+        for values in model.objects.filter(pk__in=pks).order_by('pk').values('pk', *fields)
+    ]
+    return _write(model, rows, 'upsert')
+
+
+def changes_since(cursor, user=None, limit=500):
+    """
+    Records after ``cursor`` in sequence order, at most ``limit``. Without
+    staff rights a user sees catalog records and only their own circulation
+    records. Returns ``(records, next_cursor, has_more)``.
+    """
+    # Read before the records: everything up to this number is committed
+    # already, so the cursor can skip records hidden from this user safely.
+    committed = latest_seq()
+    queryset = ChangeRecord.objects.filter(seq__gt=cursor).order_by('seq')
+    if user is not None and not user.is_staff:
+        queryset = queryset.filter(Q(model__in=PUBLIC_MODELS) | Q(user_id=user.pk))
+    records = list(queryset.values('seq', 'model', 'object_id', 'action', 'data')[:limit + 1])
+    has_more = len(records) > limit
+    records = records[:limit]
+    next_cursor = records[-1]['seq'] if records else cursor
+    if not has_more:
+        next_cursor = max(next_cursor, committed)
+    return records, next_cursor, has_more
+
+
+def latest_seq():
+    return ChangeSequence.objects.filter(name=SEQUENCE_NAME).values_list('value', flat=True).first() or 0
+
+
+def compact(before, batch_size=5000):
+    """
+    Delete records created before ``before`` that a newer record of the same
+    object supersedes. Works in batches; returns the number deleted.
+    """
+    superseded = ChangeRecord.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), seq__gt=OuterRef('seq'),
+    )
+    deleted = 0
+    while True:
+        batch = list(
+            ChangeRecord.objects.filter(created_at__lt=before)
+            .filter(Exists(superseded))
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+        with transaction.atomic():
+            deleted += ChangeRecord.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,146 @@
+# File: library/circulation.py
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .audit import record_updates
+from .changes import record_ids
+from .copy_events import loan_events, write as write_events
+from .concurrency import ConcurrentUpdateError
+from .jobs import enqueue
+from .matching import assign, plan
+from .models import BookCopy, Borrowing, Reservation
+from .policies import get_policy
+from .waitlist import invalidate as invalidate_waitlist
+
+# The desk endpoints write with queryset.update()/bulk_update() on purpose: the
+# post_save signals on BookCopy and Borrowing rescan the pending queue for every
+# single save, which is exactly what made the admin return path slow.
+
+
+def checkout(barcode, user):
+    """
+    Lend the copy with ``barcode`` to ``user``.
+
+    A copy waiting on the hold shelf can only be checked out by the reader it
+    was assigned to; that reservation is marked picked up in the same
+    transaction, audited and confirmed by e-mail as in ``hold_shelf.pick_up``.
+    """
+    with transaction.atomic():
+        copy = BookCopy.objects.select_for_update().select_related('book').filter(barcode=barcode).first()
+        if copy is None:
+            raise ValidationError(f"Unknown copy barcode {barcode}.")
+        if copy.status == 'borrowed':
+            raise ValidationError(f"{copy} is already checked out.")
+        if copy.status == 'in_transit':
+            raise ValidationError(f"{copy} is in transit to another branch; receive the transfer first.")
+
+        reservation = None
+        if copy.status == 'reserved':
+            reservation = Reservation.objects.filter(copy=copy, status='assigned').first()
+            if reservation is None or reservation.user_id != user.pk:
+                raise ValidationError(f"{copy} is on the hold shelf for another reader.")
+            updated = Reservation.objects.filter(
+                pk=reservation.pk, status='assigned', version=reservation.version
+            ).update(status='picked_up', version=F('version') + 1)
+            if not updated:
+                raise ConcurrentUpdateError(f"Reservation {reservation.pk} was changed while checking out.")
+            record_updates(Reservation, [reservation.pk], previous={'status': 'assigned'})
+            enqueue('notify_reservations', {'reservations': [reservation.pk]})
+            record_ids(Reservation, [reservation.pk])
+
+        policy = get_policy(user, copy.book)
+        if reservation is None:
+            open_loans = Borrowing.objects.filter(user=user, return_date__isnull=True).count()
+            if open_loans >= policy.max_loans:
+                raise ValidationError(f"{user} already has the maximum number of loans ({policy.max_loans}).")
+
+        now = timezone.now()
+        borrowing = Borrowing.objects.create(
+            user=user,
+            copy=copy,
+            borrow_date=now,
+            due_date=now + timedelta(days=policy.loan_days),
+            renewal_count=0,
+            reservation=reservation,
+        )
+        BookCopy.objects.filter(pk=copy.pk).update(status='borrowed')
+        copy.status = 'borrowed'
+        record_ids(BookCopy, [copy.pk])
+        invalidate_waitlist(copy.book_id)
+    return borrowing
+
+
+def checkin(barcodes):
+    """
+    Return every copy in ``barcodes`` in one pass.
+
+    Open loans are closed, and each returned copy either goes back on the shelf
+    or is routed to the hold shelf for a pending reservation of its book, as
+    planned by library/matching.py. Returns ``(results, unknown)`` where
+    ``results`` holds one dict per processed copy and ``unknown`` lists
+    barcodes that matched no copy.
+    """
+    barcodes = list(dict.fromkeys(b.strip() for b in barcodes if b and b.strip()))
+    with transaction.atomic():
+        copies = list(
+            BookCopy.objects.select_for_update().select_related('book').filter(barcode__in=barcodes)
+        )
+        found = {copy.barcode for copy in copies}
+        unknown = [barcode for barcode in barcodes if barcode not in found]
+        if not copies:
+            return [], unknown
+
+        # Copies sitting on the hold shelf are already spoken for, and copies in
+        # transit come back through their transfer; scanning them is a no-op.
+        skipped = {'reserved': 'already_on_hold_shelf', 'in_transit': 'in_transit'}
+        results = [
+            {'barcode': copy.barcode, 'title': copy.book.title, 'location': copy.location,
+             'returned': False, 'action': skipped[copy.status]}
+            for copy in copies if copy.status in skipped
+        ]
+        copies = [copy for copy in copies if copy.status not in skipped]
+        open_loans = {
+            borrowing.copy_id: borrowing
+            for borrowing in Borrowing.objects.filter(copy__in=copies, return_date__isnull=True)
+        }
+        pending = (
+            Reservation.objects.select_for_update().select_related('user', 'book')
+            .filter(
+                book_id__in={copy.book_id for copy in copies}, branch_id__in={copy.branch_id for copy in copies},
+                status='pending', copy__isnull=True,
+            )
+            .order_by('reservation_date', 'pk')
+        )
+        # Several returned copies of one book go to their branch's queue best first.
+        pairs = plan(copies, pending)
+        holds = {copy.pk: reservation for reservation, copy in pairs}
+
+        now = timezone.now()
+        shelved_copies = []
+        for copy in copies:
+            result = {'barcode': copy.barcode, 'title': copy.book.title, 'location': copy.location}
+            result['returned'] = copy.id in open_loans
+            reservation = holds.get(copy.pk)
+            if reservation is not None:
+                result.update(action='hold_shelf', reservation=reservation.id, user=reservation.user.username)
+            else:
+                shelved_copies.append(copy.pk)
+                result.update(action='shelve')
+            results.append(result)
+
+        if open_loans:
+            Borrowing.objects.filter(pk__in=[b.pk for b in open_loans.values()]).update(
+                return_date=now, version=F('version') + 1
+            )
+        if shelved_copies:
+            BookCopy.objects.filter(pk__in=shelved_copies).update(status='available')
+        assign(pairs, now)
+        write_events(loan_events('checkin', open_loans.values(), now))
+        record_ids(Borrowing, [b.pk for b in open_loans.values()])
+        record_ids(BookCopy, shelved_copies)
+        invalidate_waitlist(*(copy.book_id for copy in copies))
+    return results, unknown
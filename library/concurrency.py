@@ -0,0 +1,23 @@
+# File: library/concurrency.py
+from django.db import DatabaseError, transaction
+
+
+class ConcurrentUpdateError(DatabaseError):
+    """Raised when a versioned row was changed by someone else since it was read."""
+
+
+def retry_on_conflict(instance, func, attempts=3):
+    """
+    Call ``func(instance)`` in a transaction, reloading ``instance`` and trying
+    again when a save inside it hits a concurrent update. Each attempt is
+    rolled back as a whole, so no half-applied transition is left behind.
+    Re-raises after ``attempts``.
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return func(instance)
+        except ConcurrentUpdateError:
+            if attempt == attempts - 1:
+                raise
+            instance.refresh_from_db()
@@ -0,0 +1,80 @@
+# File: library/copy_events.py
+"""
+Append-only event log per copy: checkouts, check-ins, condition changes,
+relocations and transfers between branches.
+
+Events are only ever inserted. Single saves are logged from signals in
+library/signals.py; the bulk desk and stock-take paths build their events
+with ``loan_events`` / ``change_events`` and insert them with ``write`` in
+the same transaction as the transition. Rows are indexed by (copy,
+timestamp), so a copy's history is one index range scan. Condition events
+carry a ``worsened`` flag with a partial index, so finding deteriorating
+copies never touches the circulation tables.
+"""
+from django.db.models import Count, Max
+
+from .matching import condition_rank
+from .models import CopyEvent
+
+
+def loan_events(kind, borrowings, timestamp=None):
+    """'checkout' or 'checkin' events for ``borrowings``, at ``timestamp`` or the borrowing's own date."""
+    date_field = 'borrow_date' if kind == 'checkout' else 'return_date'
+    return [
+        CopyEvent(
+            copy_id=borrowing.copy_id,
+            kind=kind,
+            timestamp=timestamp or getattr(borrowing, date_field),
+            user_id=borrowing.user_id,
+            borrowing_id=borrowing.pk,
+        )
+        for borrowing in borrowings
+    ]
+
+
+def change_events(copy_id, old, new, timestamp=None):
+    """Events for the differences between two ``{'condition': ..., 'location': ...}`` states of a copy."""
+    events = []
+    if old['condition'] != new['condition']:
+        events.append(CopyEvent(
+            copy_id=copy_id, kind='condition', old_value=old['condition'], new_value=new['condition'],
+            worsened=condition_rank(new['condition']) > condition_rank(old['condition']),
+        ))
+    if old['location'] != new['location']:
+        events.append(CopyEvent(
+            copy_id=copy_id, kind='relocation', old_value=old['location'], new_value=new['location'],
+        ))
+    if timestamp:
+        for event in events:
+            event.timestamp = timestamp
+    return events
+
+
+def write(events):
+    return CopyEvent.objects.bulk_create(events, batch_size=1000)
+
+
+def copy_history(copy_id, since=None):
+    """Events of one copy, oldest first, as dicts."""
+    events = CopyEvent.objects.filter(copy_id=copy_id)
+    if since is not None:
+        events = events.filter(timestamp__gte=since)
+    return events.order_by('timestamp', 'id').values(
+        'kind', 'timestamp', 'user_id', 'borrowing_id', 'old_value', 'new_value',
+    )
+
+
+def worsening_copies(since=None, min_drops=1):
+    """
+    Copies whose condition got worse (since ``since``), with the number of
+    drops and the latest one, most recent first.
+    """
+    events = CopyEvent.objects.filter(worsened=True)
+    if since is not None:
+        events = events.filter(timestamp__gte=since)
+    return (
+        events.values('copy_id', 'copy__barcode', 'copy__book__title', 'copy__condition', 'copy__location')
+        .annotate(drops=Count('id'), last_drop=Max('timestamp'))
+        .filter(drops__gte=min_drops)
+        .order_by('-last_drop')
+    )
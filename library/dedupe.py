@@ -0,0 +1,132 @@
+# File: library/dedupe.py
+"""
+Duplicate detection for the catalog.
+
+Every Book carries derived keys, set in ``Book.save``:
+
+* ``isbn13``: the ISBN in canonical ISBN-13 form, so the ISBN-10 and
+  ISBN-13 forms of the same edition compare equal;
+* ``title_key`` / ``author_key``: title and author lower-cased, without
+  accents, punctuation, leading articles or word order (for authors);
+* ``block_key``: a short prefix of both. Only books sharing a block are
+  compared with each other, so checking a batch of candidates is one
+  indexed query plus a few fuzzy comparisons per candidate instead of a
+  comparison against every book in the catalog.
+
+``isbn13`` and ``block_key`` are indexed.
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from django.apps import apps
+from django.db.models import Q
+
+ARTICLES = {'the', 'a', 'an', 'der', 'die', 'das', 'le', 'la', 'les', 'el', 'los', 'las'}
+SIMILARITY_THRESHOLD = 0.88
+
+
+def canonical_isbn(value):
+    """ISBN-10 or ISBN-13 (with or without hyphens) as ISBN-13, or None if invalid."""
+    digits = re.sub(r'[^0-9Xx]', '', value or '').upper()
+    if len(digits) == 10 and digits[:9].isdigit():
+        total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+        check = (11 - total % 11) % 11
+        if digits[9] != ('X' if check == 10 else str(check)):
+            return None
+        digits = '978' + digits[:9]
+        return digits + _isbn13_check(digits)
+    if len(digits) == 13 and digits.isdigit():
+        return digits if digits[12] == _isbn13_check(digits[:12]) else None
+    return None
+
+
+def _isbn13_check(first12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def _words(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c)).lower()
+    return re.findall(r'[a-z0-9]+', value.replace('&', ' and '))
+
+
+def title_key(title):
+    words = _words(title)
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return ' '.join(words)
+
+
+def author_key(author):
+    # "Orwell, George" and "George Orwell" give the same key; initials are dropped.
+    return ' '.join(sorted(word for word in _words(author) if len(word) > 1))
+
+
+def block_key(title_key_value, author_key_value):
+    title_part = title_key_value.split(' ', 1)[0][:6]
+    author_words = author_key_value.split()
+    author_part = max(author_words, key=lambda word: (len(word), word))[:6] if author_words else ''
+    return f"{title_part}:{author_part}"
+
+
+def book_keys(title, author, isbn):
+    """The derived key fields of a book, as a dict of field values."""
+    tkey, akey = title_key(title), author_key(author)
+    return {
+        'isbn13': canonical_isbn(isbn),
+        'title_key': tkey[:255],
+        'author_key': akey[:255],
+        'block_key': block_key(tkey, akey),
+    }
+
+
+def _isbn_key(isbn13, isbn):
+    # Unparseable ISBNs can still collide on the raw value (Book.isbn is unique).
+    return isbn13 or (isbn or '').strip() or None
+
+
+def similar(keys, other):
+    return (
+        SequenceMatcher(None, keys['title_key'], other['title_key']).ratio() >= SIMILARITY_THRESHOLD
+        and SequenceMatcher(None, keys['author_key'], other['author_key']).ratio() >= SIMILARITY_THRESHOLD
+    )
+
+
+def find_duplicates(candidates, queryset=None):
+    """
+    Match a batch of ``(title, author, isbn)`` candidates against the catalog
+    and against each other.
+
+    Returns one ``(keys, isbn_match, near_matches)`` tuple per candidate:
+    ``isbn_match`` is the Book (or the earlier candidate index) with the same
+    canonical ISBN, ``near_matches`` the books or earlier candidate indexes
+    whose title and author are near-identical. Runs a single query.
+    """
+    Book = apps.get_model('library', 'Book')
+    queryset = Book.objects.all() if queryset is None else queryset
+    keyed = [book_keys(*candidate) for candidate in candidates]
+    isbn_keys = [_isbn_key(keys['isbn13'], isbn) for keys, (_, _, isbn) in zip(keyed, candidates)]
+    isbns = {isbn for isbn in isbn_keys if isbn}
+    blocks = {keys['block_key'] for keys in keyed}
+    existing = list(queryset.filter(Q(isbn13__in=isbns) | Q(isbn__in=isbns) | Q(block_key__in=blocks)))
+
+    by_isbn, by_block = {}, {}
+    for book in existing:
+        for isbn in {book.isbn13, book.isbn} - {None, ''}:
+            by_isbn.setdefault(isbn, book)
+        by_block.setdefault(book.block_key, []).append(
+            (book, {'title_key': book.title_key, 'author_key': book.author_key})
+        )
+
+    results = []
+    for index, (keys, isbn) in enumerate(zip(keyed, isbn_keys)):
+        isbn_match = by_isbn.get(isbn) if isbn else None
+        near = [match for match, other in by_block.get(keys['block_key'], []) if similar(keys, other)]
+        results.append((keys, isbn_match, near))
+        # Later rows of the same batch are checked against this one too.
+        if isbn:
+            by_isbn.setdefault(isbn, index)
+        by_block.setdefault(keys['block_key'], []).append((index, keys))
+    return results
@@ -0,0 +1,73 @@
+# File: library/exports.py
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime('%Y-%m-%d %H:%M')
+    return '' if value is None else value
+
+
+def export_rows(queryset, columns):
+    """
+    Yield the header, then one row per object of ``queryset``.
+
+    ``columns`` is a sequence of ``(header, lookup)`` pairs. Rows are read with
+    ``values_list`` (foreign keys are joined in the same query) and a server
+    side iterator, so memory does not grow with the number of rows.
+    """
+    yield [header for header, _ in columns]
+    lookups = [lookup for _, lookup in columns]
+    for row in queryset.values_list(*lookups).iterator(chunk_size=CHUNK_SIZE):
+        yield [_cell(value) for value in row]
+
+
+def csv_response(queryset, columns, filename):
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in export_rows(queryset, columns)),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(queryset, columns, filename):
+    """
+    Build an XLSX export with openpyxl's write-only mode.
+
+    The workbook format cannot be streamed as it is generated, so rows are
+    written to a temporary file on disk and the file is streamed afterwards.
+    Raises ImportError when openpyxl is not installed.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=filename[:31])
+    for row in export_rows(queryset, columns):
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
@@ -0,0 +1,118 @@
+# File: library/history.py
+"""
+Archival of closed circulation records.
+
+Canceled, expired and picked-up reservations and returned borrowings are
+moved out of the live tables into ReservationHistory and BorrowingHistory
+once they are older than LIBRARY_CIRCULATION_ARCHIVE_DAYS, so the live
+tables only hold the working set. Archived rows keep their ids.
+
+A returned borrowing is archived together with the reservation it came
+from, and a picked-up reservation stays live while its borrowing does, so
+``Borrowing.reservation`` and ``BorrowingHistory.reservation`` never point
+across the two sides.
+
+Rows are removed with a raw DELETE, so nothing may hold a
+database-enforced foreign key to them. The references to Reservation and
+Borrowing are:
+
+* ``Borrowing.reservation``: archived together with the reservation;
+* ``Notification.reservation`` and ``TransferRequest.reservation``:
+  ``db_constraint=False``, they keep the archived id;
+* ``CopyEvent.borrowing_id``: a plain integer.
+
+A new reference must be added here and either follow the borrowing along
+or be declared without a database constraint.
+
+Each batch is copied and deleted in one transaction, ordered by id, so an
+interrupted run is resumed by running it again. Archiving is not a change
+of the records: nothing is written to the change feed or the audit log.
+
+Reports that span both sides use ``all_reservations`` / ``all_borrowings``,
+which take the same field names and filters on both tables.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Borrowing, BorrowingHistory, Reservation, ReservationHistory
+
+CLOSED_STATUSES = ('canceled', 'expired', 'picked_up')
+RESERVATION_FIELDS = ('id', 'user_id', 'book_id', 'branch_id', 'copy_id', 'reservation_date', 'expiration_date',
+                      'status')
+BORROWING_FIELDS = ('id', 'user_id', 'copy_id', 'borrow_date', 'due_date', 'return_date', 'renewal_count',
+                    'reservation_id')
+
+
+def _move(queryset, history_model, fields, now):
+    rows = list(queryset.order_by('id').select_for_update().values(*fields))
+    if rows:
+        # Two overlapping runs must not fail on each other's rows.
+        history_model.objects.bulk_create(
+            [history_model(archived_at=now, **row) for row in rows], ignore_conflicts=True
+        )
+        # A plain DELETE: the rows are not going away, so the per-object
+        # delete signals (change feed, audit log, waitlist) must not fire.
+        # Only the references listed in the module docstring may point here.
+        queryset.filter(id__in=[row['id'] for row in rows])._raw_delete(queryset.db)
+    return rows
+
+
+def archive_borrowings(before, batch_size=1000):
+    """Archive borrowings returned before ``before``, with their reservations. Yields ``(borrowings, reservations)`` per batch."""
+    last_id = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                Borrowing.objects.filter(return_date__lt=before, id__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return
+            borrowings = _move(
+                Borrowing.objects.filter(id__in=ids, return_date__lt=before), BorrowingHistory, BORROWING_FIELDS, now
+            )
+            reservation_ids = [row['reservation_id'] for row in borrowings if row['reservation_id']]
+            reservations = _move(
+                Reservation.objects.filter(id__in=reservation_ids), ReservationHistory, RESERVATION_FIELDS, now
+            )
+        last_id = ids[-1]
+        yield len(borrowings), len(reservations)
+
+
+def archive_reservations(before, batch_size=1000):
+    """Archive closed reservations that expired before ``before`` and have no live borrowing. Yields the count per batch."""
+    closed = Reservation.objects.filter(status__in=CLOSED_STATUSES, expiration_date__lt=before).exclude(
+        Exists(Borrowing.objects.filter(reservation=OuterRef('pk')))
+    )
+    last_id = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(closed.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            # Re-check inside the transaction: a reservation may have been
+            # picked up or reopened since it was selected.
+            moved = _move(closed.filter(id__in=ids), ReservationHistory, RESERVATION_FIELDS, now)
+        last_id = ids[-1]
+        yield len(moved)
+
+
+def _union(live, archived, fields, filters):
+    return live.filter(**filters).values(*fields).union(archived.filter(**filters).values(*fields), all=True)
+
+
+def all_reservations(*fields, **filters):
+    """
+    Live and archived reservations as one ``values()`` queryset, e.g.
+    ``all_reservations('id', 'book__title', reservation_date__gte=start)``.
+    Filters apply to both sides; only ordering and slicing can follow.
+    """
+    return _union(Reservation.objects.all(), ReservationHistory.objects.all(), fields or RESERVATION_FIELDS, filters)
+
+
+def all_borrowings(*fields, **filters):
+    """Live and archived borrowings as one ``values()`` queryset, see ``all_reservations``."""
+    return _union(Borrowing.objects.all(), BorrowingHistory.objects.all(), fields or BORROWING_FIELDS, filters)
@@ -0,0 +1,152 @@
+# File: library/hold_shelf.py
+"""
+The hold shelf: copies assigned to a reservation and waiting for their reader.
+
+Marking reservations picked up one by one goes through ``handle_picked_up``
+and ``queue_reservation_email`` for every row, each re-saving the copy and
+looking the new borrowing up again. ``confirm_pickups`` does the same
+transition for a whole batch with a fixed number of queries and hands the
+e-mails to a single notification job. ``expire_holds`` clears lapsed holds
+the same way.
+
+``pick_up`` is the single-reservation path for the desk and the API. It is
+idempotent: the status change is a conditional UPDATE that only one caller
+wins, the borrowing is get-or-create on its reservation, and a repeated or
+concurrent call returns the borrowing the first one opened.
+"""
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .audit import record_updates
+from .changes import record_ids
+from .concurrency import ConcurrentUpdateError
+from .copy_events import loan_events, write as write_events
+from .jobs import enqueue
+from .models import BookCopy, Borrowing, Reservation
+from .policies import get_policy
+from .read_models import reservation_rows
+from .waitlist import invalidate as invalidate_waitlist
+
+
+def ready_holds(queryset=None):
+    """
+    Assigned reservations in shelf order, as compact rows from one query, so
+    the desk can walk the shelf top to bottom.
+    """
+    queryset = Reservation.objects.all() if queryset is None else queryset
+    return reservation_rows(
+        queryset.filter(status='assigned', copy__isnull=False).order_by('copy__location', 'expiration_date')
+    )
+
+
+def confirm_pickups(reservation_ids):
+    """
+    Mark the given reservations picked up and lend their copies.
+
+    Borrowings are created with one bulk INSERT, copies and reservations are
+    updated with one UPDATE each, and one job sends the confirmations.
+    Returns ``(borrowings, skipped)`` where ``skipped`` lists the ids that
+    were not waiting on the hold shelf, including values that are not ids
+    at all (``reservation_ids`` may come straight from a form).
+    """
+    reservation_ids = [str(pk) for pk in reservation_ids]
+    skipped = [pk for pk in reservation_ids if not pk.isdigit()]
+    reservation_ids = list(dict.fromkeys(int(pk) for pk in reservation_ids if pk.isdigit()))
+    with transaction.atomic():
+        reservations = list(
+            Reservation.objects.select_for_update().select_related('user', 'book')
+            .filter(pk__in=reservation_ids, status='assigned', copy__isnull=False)
+        )
+        ready = {reservation.pk for reservation in reservations}
+        skipped += [pk for pk in reservation_ids if pk not in ready]
+        if not reservations:
+            return [], skipped
+
+        record_updates(Reservation, ready)
+        # The UPDATE re-checks the status (SQLite ignores the row locks), so a
+        # reservation picked up or canceled in between rolls the batch back.
+        updated = Reservation.objects.filter(
+            pk__in=ready, status='assigned',
+        ).update(status='picked_up', version=F('version') + 1)
+        if updated != len(reservations):
+            raise ConcurrentUpdateError("Some reservations changed while confirming pickups.")
+
+        now = timezone.now()
+        borrowings = Borrowing.objects.bulk_create([
+            Borrowing(
+                user=reservation.user,
+                copy_id=reservation.copy_id,
+                borrow_date=now,
+                due_date=now + timedelta(days=get_policy(reservation.user, reservation.book).loan_days),
+                renewal_count=0,
+                reservation=reservation,
+            )
+            for reservation in reservations
+        ])
+        BookCopy.objects.filter(pk__in=[reservation.copy_id for reservation in reservations]).update(status='borrowed')
+        write_events(loan_events('checkout', borrowings))
+        enqueue('notify_reservations', {'reservations': sorted(ready)})
+        record_ids(Reservation, ready)
+        record_ids(Borrowing, [borrowing.pk for borrowing in borrowings])
+        record_ids(BookCopy, [reservation.copy_id for reservation in reservations])
+        invalidate_waitlist(*(reservation.book_id for reservation in reservations))
+    return borrowings, skipped
+
+
+def pick_up(reservation_id):
+    """
+    Mark one reservation picked up and lend its copy, in one transaction.
+    Returns ``(borrowing, created)``; ``created`` is False when the
+    reservation had already been picked up.
+    """
+    with transaction.atomic():
+        claimed = Reservation.objects.filter(
+            pk=reservation_id, status='assigned', copy__isnull=False,
+        ).update(status='picked_up', version=F('version') + 1)
+        if claimed:
+            record_updates(Reservation, [reservation_id], previous={'status': 'assigned'})
+        reservation = Reservation.objects.select_related('user', 'book', 'copy').get(pk=reservation_id)
+        if not claimed:
+            borrowing = Borrowing.objects.filter(reservation=reservation).first()
+            if borrowing is not None:
+                return borrowing, False
+            # A picked-up reservation without its borrowing is finished below.
+            if reservation.status != 'picked_up' or reservation.copy is None:
+                raise ValidationError(f"Reservation {reservation_id} is not waiting on the hold shelf.")
+        borrowing, created = reservation.open_borrowing()
+        if claimed:
+            enqueue('notify_reservations', {'reservations': [reservation.pk]})
+            record_ids(Reservation, [reservation.pk])
+            invalidate_waitlist(reservation.book_id)
+    return borrowing, created
+
+
+def expire_holds(reservation_ids, now=None):
+    """
+    Expire the given assigned reservations whose pickup window has passed and
+    put their copies back on the shelf, in one transaction. Returns the
+    expired reservations; matching the freed copies is left to the caller.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = Reservation.objects.filter(pk__in=reservation_ids, status='assigned', expiration_date__lt=now)
+        reservations = list(due.select_for_update())
+        if not reservations:
+            return []
+        record_updates(Reservation, [reservation.pk for reservation in reservations])
+        updated = due.filter(pk__in=[reservation.pk for reservation in reservations]).update(
+            status='expired', copy=None, version=F('version') + 1
+        )
+        if updated != len(reservations):
+            raise ConcurrentUpdateError("Some reservations changed while expiring holds.")
+        copy_ids = [reservation.copy_id for reservation in reservations if reservation.copy_id]
+        BookCopy.objects.filter(pk__in=copy_ids, status='reserved').update(status='available')
+        enqueue('notify_reservations', {'reservations': [reservation.pk for reservation in reservations]})
+        record_ids(Reservation, [reservation.pk for reservation in reservations])
+        record_ids(BookCopy, copy_ids)
+        invalidate_waitlist(*(reservation.book_id for reservation in reservations))
+    return reservations
@@ -0,0 +1,280 @@
+# File: library/jobs.py
+"""
+Database-backed job queue.
+
+Jobs are rows in the Job table. A worker claims a job by taking a lease on
+it: on PostgreSQL through ``SELECT ... FOR UPDATE SKIP LOCKED``, elsewhere
+(SQLite) through a conditional UPDATE that only one worker can win. While a
+job runs, the worker renews the lease from a heartbeat thread; a job whose
+lease runs out (the worker crashed) is claimed again by another worker.
+Failed jobs are retried with exponential backoff up to ``max_attempts``.
+
+Kinds listed in LIBRARY_JOB_CONCURRENCY are claimed by an UPDATE that
+counts the running jobs of the kind in the same statement, so two workers
+cannot both take the last free slot. On PostgreSQL, claims of such a kind
+also hold a transaction-level advisory lock on it; under READ COMMITTED the
+count would otherwise not see a claim that is committing at that moment.
+
+A worker whose lease was taken over while its handler ran must not act on
+the job any more. Handlers call ``check_lease()`` before side effects that
+must not happen twice (sending mail, writing a batch); it raises LeaseLost
+once the job belongs to someone else, and the worker then leaves the job to
+its new owner instead of reporting success or failure.
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Job
+
+HANDLERS = {}
+_current = threading.local()
+
+
+class LeaseLost(Exception):
+    """The running job was taken over by another worker."""
+
+
+def job(kind):
+    """Register the decorated function as the handler for jobs of ``kind``."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, run_at=None, priority=0, dedupe_key=None, max_attempts=5):
+    """
+    Queue a job. Inside a transaction the job only becomes visible when the
+    transaction commits. With ``dedupe_key``, returns the job already queued
+    or running under that key instead of adding another one.
+    """
+    fields = dict(
+        kind=kind,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        priority=priority,
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts,
+    )
+    if dedupe_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(**fields)
+    except IntegrityError:
+        existing = Job.objects.filter(dedupe_key=dedupe_key, status__in=['queued', 'running']).first()
+        if existing is None:
+            raise
+        return existing
+
+
+def _concurrency_limits():
+    return getattr(settings, 'LIBRARY_JOB_CONCURRENCY', {})
+
+
+def _claimable(now):
+    # Queued jobs that are due, plus running jobs whose worker stopped renewing the lease.
+    return Q(status='queued', run_at__lte=now) | Q(status='running', lease_expires_at__lt=now)
+
+
+def _within_limit(queryset, kind, limit, now):
+    """Narrow ``queryset`` to nothing while ``limit`` jobs of ``kind`` hold a live lease, in the same statement."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'library.job:{kind}'])
+    running = (
+        Job.objects.filter(kind=OuterRef('kind'), status='running', lease_expires_at__gte=now)
+        .order_by().values('kind').annotate(count=Count('id')).values('count')
+    )
+    return queryset.alias(
+        running=Coalesce(Subquery(running, output_field=IntegerField()), Value(0)),
+    ).filter(running__lt=limit)
+
+
+def claim(worker_id, kinds=None, lease_seconds=60):
+    """Lease the next due job for ``worker_id`` and return it, or None."""
+    now = timezone.now()
+    queryset = Job.objects.filter(_claimable(now))
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+
+    limits = _concurrency_limits()
+    if limits:
+        running = dict(
+            Job.objects.filter(status='running', lease_expires_at__gte=now, kind__in=limits)
+            .values_list('kind').annotate(count=Count('id'))
+        )
+        full = [kind for kind, limit in limits.items() if running.get(kind, 0) >= limit]
+        if full:
+            queryset = queryset.exclude(kind__in=full)
+
+    queryset = queryset.order_by('-priority', 'run_at', 'id')
+    lease = dict(
+        status='running',
+        locked_by=worker_id,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        heartbeat_at=now,
+        started_at=now,
+        attempts=F('attempts') + 1,
+    )
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queryset.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            claimed = Job.objects.filter(pk=job.pk)
+            if job.kind in limits:
+                claimed = _within_limit(claimed, job.kind, limits[job.kind], now)
+            if not claimed.update(**lease):
+                return None  # Another worker took the last slot of this kind
+    else:
+        # Compare-and-swap: the UPDATE re-checks the claim condition, so when
+        # two workers race for the same row only one of them matches it.
+        for candidate, kind in queryset.values_list('pk', 'kind')[:10]:
+            claimed = Job.objects.filter(_claimable(now), pk=candidate)
+            if kind in limits:
+                claimed = _within_limit(claimed, kind, limits[kind], now)
+            if claimed.update(**lease):
+                break
+        else:
+            return None
+        job = Job(pk=candidate)
+    job.refresh_from_db()
+    return job
+
+
+def heartbeat(job, lease_seconds=60):
+    """Extend the lease. Returns False when another worker has taken the job over."""
+    now = timezone.now()
+    return bool(Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds),
+    ))
+
+
+def complete(job):
+    return bool(Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        status='done', finished_at=timezone.now(), lease_expires_at=None, last_error='',
+    ))
+
+
+def fail(job, error):
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        backoff = getattr(settings, 'LIBRARY_JOB_RETRY_BASE_SECONDS', 10) * 2 ** (job.attempts - 1)
+        changes = dict(status='queued', run_at=now + timedelta(seconds=backoff))
+    else:
+        changes = dict(status='failed', finished_at=now)
+    return bool(Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        lease_expires_at=None, last_error=error[-5000:], **changes,
+    ))
+
+
+def check_lease():
+    """
+    Raise LeaseLost if the job running in this thread no longer belongs to
+    this worker. Does nothing outside a job (management commands run by hand).
+    """
+    beat = getattr(_current, 'beat', None)
+    if beat is None:
+        return
+    if not beat.lost:
+        beat.lost = not Job.objects.filter(
+            pk=beat.job.pk, status='running', locked_by=beat.job.locked_by, lease_expires_at__gte=timezone.now(),
+        ).exists()
+    if beat.lost:
+        raise LeaseLost(f"{beat.job} was taken over by another worker")
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of the running job until stopped."""
+
+    def __init__(self, job, lease_seconds):
+        super().__init__(daemon=True)
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not heartbeat(self.job, self.lease_seconds):
+                    self.lost = True
+                    return
+        finally:
+            connection.close()  # Threads get their own connection
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Worker:
+    def __init__(self, worker_id=None, kinds=None, lease_seconds=60, poll_interval=1.0, stdout=None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = kinds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(f"[{self.worker_id}] {message}")
+
+    def run_one(self):
+        """Claim and run a single job. Returns False when nothing was due."""
+        job = claim(self.worker_id, self.kinds, self.lease_seconds)
+        if job is None:
+            return False
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            fail(job, f"No handler registered for job kind '{job.kind}'")
+            self.log(f"Failed {job}: unknown kind")
+            return True
+
+        beat = Heartbeat(job, self.lease_seconds)
+        beat.start()
+        _current.beat = beat
+        started = time.perf_counter()
+        try:
+            handler(job.payload)
+        except LeaseLost:
+            beat.stop()
+            self.log(f"Stopped {job}: another worker took it over")
+        except Exception:
+            beat.stop()
+            if not beat.lost and fail(job, traceback.format_exc()):
+                self.log(f"Failed {job} (attempt {job.attempts}/{job.max_attempts})")
+            else:
+                self.log(f"Lost the lease on {job} before it failed")
+        else:
+            beat.stop()
+            if not beat.lost and complete(job):
+                self.log(f"Finished {job} in {time.perf_counter() - started:.2f}s")
+            else:
+                self.log(f"Lost the lease on {job} before it finished")
+        finally:
+            _current.beat = None
+        return True
+
+    def run(self, max_jobs=None, stop_when_idle=False):
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            if self.run_one():
+                processed += 1
+            elif stop_when_idle:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        return processed
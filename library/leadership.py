@@ -0,0 +1,119 @@
+# File: library/leadership.py
+"""
+Lease-based leader election on the LeaderLease table.
+
+One row per lease name. A process holds the lease until ``expires_at`` and
+has to renew it before then; once it lapses any other process may take it
+over, which increments the fencing token. Work started by a leader carries
+the token it was issued, and ``check_token`` refuses it as soon as a newer
+leader exists, so a paused or partitioned ex-leader cannot keep writing.
+
+Expiry is compared against each host's clock, so hosts must keep their
+clocks in sync to well within the lease length.
+"""
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import LeaderLease
+
+
+class LeadershipLost(Exception):
+    """Raised when work is attempted with a fencing token that has been superseded."""
+
+
+def default_holder():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_seconds():
+    return getattr(settings, 'LIBRARY_LEADER_LEASE_SECONDS', 10)
+
+
+def acquire(name, holder, ttl=None):
+    """
+    Take or renew the lease ``name`` for ``holder``. Returns the fencing
+    token while ``holder`` is the leader, otherwise None.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl or lease_seconds())
+
+    # Renew our own, still valid lease; the token stays the same.
+    if LeaderLease.objects.filter(name=name, holder=holder, expires_at__gt=now).update(
+        expires_at=expires_at, renewed_at=now,
+    ):
+        return LeaderLease.objects.values_list('token', flat=True).get(name=name)
+
+    # Take over a lapsed lease. The UPDATE re-checks the expiry, so of several
+    # contenders exactly one wins, and the new term gets a new token.
+    with transaction.atomic():
+        taken = LeaderLease.objects.filter(name=name, expires_at__lte=now).update(
+            holder=holder, token=F('token') + 1,
+            expires_at=expires_at, acquired_at=now, renewed_at=now,
+        )
+        if taken:
+            return LeaderLease.objects.values_list('token', flat=True).get(name=name)
+
+    if LeaderLease.objects.filter(name=name).exists():
+        return None
+    try:
+        with transaction.atomic():
+            lease = LeaderLease.objects.create(
+                name=name, holder=holder, expires_at=expires_at, acquired_at=now, renewed_at=now,
+            )
+    except IntegrityError:
+        return None  # Someone else created it first
+    return lease.token
+
+
+def release(name, holder):
+    """Give up the lease so another process can take over without waiting for it to expire."""
+    return bool(LeaderLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now()))
+
+
+def check_token(name, token):
+    """Raise LeadershipLost unless ``token`` is still the newest token issued for ``name``."""
+    if not LeaderLease.objects.filter(name=name, token=token).exists():
+        raise LeadershipLost(f"Fencing token {token} for '{name}' has been superseded")
+
+
+class LeaderElector:
+    """Keeps a lease for one process, renewing it a few times per lease period."""
+
+    def __init__(self, name, holder=None, ttl=None):
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl or lease_seconds()
+        self.token = None
+        self.renewed_at = None
+
+    @property
+    def is_leader(self):
+        return self.token is not None
+
+    def ensure(self):
+        """
+        Acquire or renew the lease when due and return the fencing token, or
+        None while another process leads. Cheap to call on every tick.
+        """
+        now = timezone.now()
+        if self.token is not None and now - self.renewed_at < timedelta(seconds=self.ttl / 3):
+            return self.token
+        try:
+            self.token = acquire(self.name, self.holder, self.ttl)
+        except Exception:
+            # Without the database we cannot prove we still lead; step down.
+            self.token = None
+            raise
+        self.renewed_at = now
+        return self.token
+
+    def release(self):
+        if self.token is not None:
+            release(self.name, self.holder)
+            self.token = None
@@ -0,0 +1,92 @@
+# File: library/management/commands/archive_auditlog.py
+import gzip
+import json
+import os
+import re
+from datetime import timedelta
+from pathlib import Path
+
+from auditlog import get_logentry_model
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+# One file per batch, named after the ids it holds: auditlog-<date>-<first id>-<last id>.jsonl.gz
+ARCHIVE_RE = re.compile(r'^auditlog-\d{8}-\d+-(\d+)\.jsonl\.gz$')
+
+
+class Command(BaseCommand):
+    help = 'Move audit log entries older than the retention period to gzip-compressed JSON lines files'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'LIBRARY_AUDIT_RETENTION_DAYS', 365),
+            help='Keep entries from the last N days in the database',
+        )
+        parser.add_argument(
+            '--output-dir', default=getattr(settings, 'LIBRARY_AUDIT_ARCHIVE_DIR', None),
+            help='Directory for the archive files',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        LogEntry = get_logentry_model()
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        output_dir = Path(options['output_dir'] or Path(settings.BASE_DIR) / 'archive')
+        output_dir.mkdir(parents=True, exist_ok=True)
+        recovered = self.finish_interrupted(LogEntry, output_dir)
+        if recovered:
+            self.stdout.write(f"Deleted {recovered} audit entries archived by an interrupted run")
+
+        fields = [
+            'id', 'content_type__app_label', 'content_type__model', 'object_pk', 'object_id',
+            'object_repr', 'action', 'changes', 'changes_text', 'actor_id', 'actor_email',
+            'remote_addr', 'cid', 'timestamp', 'additional_data',
+        ]
+        archived = 0
+        last_id = 0
+        # Each batch goes to its own file, which appears complete or not at all
+        # (written under a temporary name, then renamed), and is deleted from
+        # the database afterwards. A run stopped in between leaves the newest
+        # file's entries behind; finish_interrupted deletes them on the next
+        # run instead of archiving them twice.
+        while True:
+            rows = list(
+                LogEntry.objects.filter(timestamp__lt=cutoff, id__gt=last_id)
+                .order_by('id')
+                .values(*fields)[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            path = output_dir / f"auditlog-{timezone.localdate():%Y%m%d}-{rows[0]['id']}-{last_id}.jsonl.gz"
+            partial = path.with_name(path.name + '.tmp')
+            with gzip.open(partial, 'wt', encoding='utf-8') as archive:
+                for row in rows:
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+            os.replace(partial, path)
+            with transaction.atomic():
+                LogEntry.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            archived += len(rows)
+            self.stdout.write(f"Archived {archived} audit entries so far")
+        self.stdout.write(f"Archived {archived} audit entries older than {cutoff:%Y-%m-%d} to {output_dir}")
+
+    def finish_interrupted(self, LogEntry, output_dir):
+        """Delete the entries of the newest archive file that are still in the database."""
+        archives = [
+            (int(match.group(1)), path) for path in output_dir.iterdir()
+            if (match := ARCHIVE_RE.match(path.name))
+        ]
+        if not archives:
+            return 0
+        # Files are written one after the other, each once the previous one's
+        # entries are deleted, so only the newest can have entries left.
+        _, newest = max(archives)
+        with gzip.open(newest, 'rt', encoding='utf-8') as archive:
+            ids = [json.loads(line)['id'] for line in archive]
+        with transaction.atomic():
+            deleted, _ = LogEntry.objects.filter(id__in=ids).delete()
+        return deleted
@@ -0,0 +1,52 @@
+# File: library/management/commands/benchmark_read_models.py
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from library.models import Borrowing, Reservation
+from library.read_models import borrowing_rows, reservation_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare query count, time and memory of model instances (joined, deferred fields) '
+        'versus read-model rows for list rendering'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows to render per table')
+
+    def measure(self, label, render):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            rows = render()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        per_row = peak / len(rows) if rows else 0
+        self.stdout.write(
+            f"{label:<32} rows={len(rows):<6} queries={len(queries):<6} "
+            f"time={elapsed * 1000:8.1f}ms peak={peak / 1024:9.1f}KiB per_row={per_row:7.0f}B"
+        )
+
+    def handle(self, *args, **options):
+        limit = options['rows']
+        # The instance baselines join and load only what __str__ reads, as a tuned list view would.
+        reservations = Reservation.objects.select_related('user', 'book').only('status', 'user__username', 'book__title')
+        borrowings = Borrowing.objects.select_related('user', 'copy__book').only(
+            'user__username', 'copy__location', 'copy__book__title',
+        )
+        self.measure('Reservation instances', lambda: [str(r) for r in reservations[:limit]])
+        self.measure('Reservation read model', lambda: [str(r) for r in reservation_rows(Reservation.objects.all()[:limit])])
+        self.measure('Borrowing instances', lambda: [str(b) for b in borrowings[:limit]])
+        self.measure('Borrowing read model', lambda: [str(b) for b in borrowing_rows(Borrowing.objects.all()[:limit])])
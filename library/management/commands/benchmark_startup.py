@@ -0,0 +1,68 @@
+# File: library/management/commands/benchmark_startup.py
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What a background process does before its first job.
+STARTUP_CODE = (
+    "import os, sys; sys.path.insert(0, {base!r}); "
+    "os.environ['DJANGO_SETTINGS_MODULE'] = {settings!r}; "
+    "import django; django.setup(); import library.tasks"
+)
+WATCHED = ('django.contrib.admin', 'import_export', 'tablib', 'openpyxl', 'admin_interface', 'colorfield', 'requests')
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start import time of the settings profiles with python -X importtime'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', default='library_project.settings,library_project.settings_worker',
+            help='Comma-separated settings modules to compare',
+        )
+        parser.add_argument('--runs', type=int, default=5, help='Runs per profile; the median is reported')
+        parser.add_argument('--top', type=int, default=10, help='Show the N most expensive top-level packages')
+
+    def handle(self, *args, **options):
+        for profile in [p.strip() for p in options['profiles'].split(',') if p.strip()]:
+            walls, imports, packages, loaded = [], [], None, set()
+            for _ in range(options['runs']):
+                wall, total, by_package, modules = self.measure(profile)
+                walls.append(wall)
+                imports.append(total)
+                packages = packages or by_package
+                loaded = modules
+            self.stdout.write(
+                f"{profile}: {statistics.median(walls) * 1000:.0f} ms wall, "
+                f"{statistics.median(imports) / 1000:.0f} ms importing, {len(loaded)} modules"
+            )
+            for package, micros in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+                self.stdout.write(f"    {micros / 1000:8.1f} ms  {package}")
+            heavy = [name for name in WATCHED if any(m == name or m.startswith(name + '.') for m in loaded)]
+            self.stdout.write(f"    loaded: {', '.join(heavy) if heavy else 'none of ' + ', '.join(WATCHED)}")
+
+    def measure(self, profile):
+        code = STARTUP_CODE.format(base=str(settings.BASE_DIR), settings=profile)
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True,
+        )
+        wall = time.perf_counter() - started
+
+        # Lines look like "import time:  self [us] | cumulative | imported package".
+        total, by_package, modules = 0, defaultdict(int), set()
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            total += int(self_us)
+            by_package[name.split('.')[0]] += int(self_us)
+            modules.add(name)
+        return wall, total, by_package, modules
@@ -0,0 +1,25 @@
+# File: library/management/commands/compact_changes.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.changes import compact
+
+
+class Command(BaseCommand):
+    help = 'Drop change feed records older than the retention period that a newer record of the same object supersedes'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'LIBRARY_CHANGE_RETENTION_DAYS', 30),
+            help='Keep every record from the last N days',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = compact(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(f"Compacted {deleted} change records older than {cutoff:%Y-%m-%d}")
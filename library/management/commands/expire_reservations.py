@@ -1,35 +1,82 @@
 # File: library/management/commands/expire_reservations.py
-from django.core.management.base import BaseCommand
-from library.models import Reservation
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+from library.models import BookCopy, Branch, Reservation
+from library.concurrency import ConcurrentUpdateError
+from library.hold_shelf import expire_holds
+from library.leadership import LeadershipLost, check_token
+from library.matching import match_books
 from django.utils import timezone
 
 class Command(BaseCommand):
-    help = 'Check and expire overdue reservations and assign available copies'
+    help = 'Check and expire overdue reservations and assign available copies, branch by branch'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', help='Only process this branch (code); by default every branch in turn')
+        parser.add_argument('--lease', help='Leader lease the fencing token belongs to')
+        parser.add_argument('--fencing-token', type=int, help='Stop as soon as this token has been superseded')
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations or books per transaction')
 
     def handle(self, *args, **kwargs):
-        self.stdout.write(f"Checking reservations at {timezone.now()}")
-        # Expire overdue reservations
-        reservations = Reservation.objects.filter(status='assigned')
-        expired_count = 0
-        for reservation in reservations:
-            if reservation.check_expiration():
-                expired_count += 1
-                self.stdout.write(f"Expired reservation {reservation.id} for user {reservation.user.username}")
-                # Immediately try to assign the freed copy to a pending reservation
-                pending_reservations = Reservation.objects.filter(status='pending').order_by('reservation_date')
-                for pending_reservation in pending_reservations:
-                    self.stdout.write(f"After expiration: Attempting to assign copy to pending reservation {pending_reservation.id} for user {pending_reservation.user.username}, book: {pending_reservation.book.title}")
-                    if pending_reservation.assign_available_copy():
-                        self.stdout.write(f"After expiration: Assigned freed copy to pending reservation {pending_reservation.id} for user {pending_reservation.user.username}")
-                        break  # Assign to the first eligible pending reservation
-        self.stdout.write(f"Expired {expired_count} reservations")
+        self.lease = kwargs.get('lease')
+        self.fencing_token = kwargs.get('fencing_token')
+        self.batch_size = kwargs.get('batch_size') or 500
+        branches = Branch.objects.order_by('code')
+        if kwargs.get('branch'):
+            branches = branches.filter(code=kwargs['branch'])
+            if not branches:
+                raise CommandError(f"Unknown branch {kwargs['branch']}")
+        try:
+            for branch in branches:
+                self._run(branch)
+        except LeadershipLost as e:
+            self.stderr.write(f"Stopped: {e}")
+
+    def _check_fence(self):
+        if self.lease and self.fencing_token is not None:
+            check_token(self.lease, self.fencing_token)
+
+    def _batches(self, ids):
+        for start in range(0, len(ids), self.batch_size):
+            self._check_fence()
+            yield ids[start:start + self.batch_size]
+
+    def _run(self, branch):
+        self._check_fence()
+        now = timezone.now()
+        self.stdout.write(f"Checking reservations at {branch.code} at {now}")
+        # Expire overdue holds; the freed copies go to the next readers in the
+        # same batch so they never sit on the open shelf in between.
+        overdue = list(
+            Reservation.objects.filter(branch=branch, status='assigned', expiration_date__lt=now)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        expired_count = assigned_count = 0
+        for batch in self._batches(overdue):
+            try:
+                expired = expire_holds(batch, now)
+            except ConcurrentUpdateError as e:
+                self.stderr.write(f"Skipped {len(batch)} reservations: {e}")
+                continue
+            expired_count += len(expired)
+            for reservation in expired:
+                self.stdout.write(f"Expired reservation {reservation.id} for user {reservation.user_id}")
+            assigned_count += self._match({reservation.book_id for reservation in expired}, branch)
+        self.stdout.write(f"Expired {expired_count} reservations at {branch.code}")
 
         # Assign copies to any remaining pending reservations
-        pending_reservations = Reservation.objects.filter(status='pending').order_by('reservation_date')
-        assigned_count = 0
-        for reservation in pending_reservations:
-            self.stdout.write(f"Final check: Processing pending reservation {reservation.id} for user {reservation.user.username}, book: {reservation.book.title}")
-            if reservation.assign_available_copy():
-                assigned_count += 1
-                self.stdout.write(f"Final check: Assigned copy to reservation {reservation.id} for user {reservation.user.username}")
-        self.stdout.write(f"Assigned copies to {assigned_count} reservations")
\ No newline at end of file
+        waiting = list(
+            Reservation.objects.filter(branch=branch, status='pending', copy__isnull=True)
+            .filter(Exists(BookCopy.objects.filter(branch=branch, book=OuterRef('book'), status='available')))
+            .order_by('book_id').values_list('book_id', flat=True).distinct()
+        )
+        for batch in self._batches(waiting):
+            assigned_count += self._match(batch, branch)
+        self.stdout.write(f"Assigned copies to {assigned_count} reservations at {branch.code}")
+
+    def _match(self, book_ids, branch):
+        pairs = match_books(book_ids, branch=branch)
+        for reservation, copy in pairs:
+            self.stdout.write(f"Assigned copy {copy.pk} to reservation {reservation.id} for user {reservation.user.username}")
+        return len(pairs)
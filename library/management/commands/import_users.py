@@ -0,0 +1,32 @@
+# File: library/management/commands/import_users.py
+from django.core.management.base import BaseCommand, CommandError
+
+from library.user_import import import_users, read_roster
+
+
+class Command(BaseCommand):
+    help = 'Create user accounts in bulk from a roster CSV (username, email[, first_name, last_name, role, password])'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='Path to the roster CSV file')
+        parser.add_argument('--unusable-passwords', action='store_true',
+                            help='Ignore the password column (accounts sign in through SSO)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used for password hashing (defaults to the CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['roster'], newline='', encoding='utf-8-sig') as roster:
+                created, skipped, errors = import_users(
+                    read_roster(roster),
+                    batch_size=options['batch_size'],
+                    unusable_passwords=options['unusable_passwords'],
+                    workers=options['workers'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        for line, message in errors:
+            self.stderr.write(f"Line {line}: {message}")
+        self.stdout.write(f"Created {created} users, skipped {skipped} existing or duplicate rows, {len(errors)} errors")
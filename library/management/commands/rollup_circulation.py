@@ -0,0 +1,51 @@
+# File: library/management/commands/rollup_circulation.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from library.models import Borrowing, BorrowingHistory, Reservation, ReservationHistory
+from library.stats import backfill
+
+
+class Command(BaseCommand):
+    help = 'Refresh the daily circulation statistics (yesterday and today by default)'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to recompute (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day to recompute (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--all', action='store_true', help='Backfill from the oldest borrowing or reservation')
+        parser.add_argument('--chunk-days', type=int, default=30, help='Days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            until = date.fromisoformat(options['until']) if options['until'] else today
+            since = date.fromisoformat(options['since']) if options['since'] else today - timedelta(days=1)
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        if options['all']:
+            oldest = [
+                value for value in (
+                    Borrowing.objects.aggregate(first=Min('borrow_date'))['first'],
+                    Reservation.objects.aggregate(first=Min('reservation_date'))['first'],
+                    BorrowingHistory.objects.aggregate(first=Min('borrow_date'))['first'],
+                    ReservationHistory.objects.aggregate(first=Min('reservation_date'))['first'],
+                ) if value
+            ]
+            if not oldest:
+                self.stdout.write("Nothing to backfill")
+                return
+            since = timezone.localtime(min(oldest)).date()
+
+        if since > until:
+            raise CommandError("--since must not be after --until")
+
+        total = 0
+        for chunk_start, chunk_end, rows in backfill(since, until + timedelta(days=1), options['chunk_days']):
+            total += rows
+            self.stdout.write(f"Rolled up {chunk_start} to {chunk_end - timedelta(days=1)}: {rows} rows")
+        self.stdout.write(f"Wrote {total} rollup rows")
@@ -0,0 +1,56 @@
+# File: library/management/commands/run_worker.py
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from library.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers that claim jobs from the database queue'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--kinds', default='', help='Comma-separated job kinds to run (default: all)')
+        parser.add_argument('--lease', type=int, default=60, help='Lease length in seconds')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        import library.tasks  # Registers the job handlers
+
+        kinds = [kind.strip() for kind in options['kinds'].split(',') if kind.strip()] or None
+        if options['processes'] <= 1:
+            self.run_worker(kinds, options)
+            return
+
+        # Children must not share the parent's database connection.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self.run_worker, args=(kinds, options), daemon=False)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+    def run_worker(self, kinds, options):
+        worker = Worker(
+            kinds=kinds,
+            lease_seconds=options['lease'],
+            poll_interval=options['poll_interval'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(f"Worker {worker.worker_id} started")
+        try:
+            processed = worker.run(stop_when_idle=options['burst'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"Worker {worker.worker_id} processed {processed} jobs")
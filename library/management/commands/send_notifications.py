@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from library.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Collect queued reservation notifications into one digest per reader and send the digests that are due'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Readers and digests handled per run')
+        parser.add_argument(
+            '--now', action='store_true', help='Do not wait for the digest window; send everything queued',
+        )
+
+    def handle(self, *args, **options):
+        window = 0 if options['now'] else None
+        sent, failed = send_digests(window=window, batch_size=options['batch_size'])
+        self.stdout.write(f"Sent {sent} digests, {failed} failed")
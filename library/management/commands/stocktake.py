@@ -0,0 +1,64 @@
+# File: library/management/commands/stocktake.py
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from library.models import Branch, StockTake
+from library.stocktake import CATEGORIES, add_scans, apply_corrections, read_scans, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Load shelf scans (barcode, location[, condition]) into a stock-take, report discrepancies and apply corrections'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Scanner exports to add to the stock-take')
+        parser.add_argument('--session', type=int, help='Continue this stock-take instead of starting a new one')
+        parser.add_argument('--name', default='', help='Name of a new stock-take')
+        parser.add_argument('--branch', help='Branch (code) the new stock-take counts; every branch by default')
+        parser.add_argument('--prefix', default='', help='Location prefix the new stock-take covers (e.g. L1-)')
+        parser.add_argument('--apply', action='store_true', help='Write the scanned locations and conditions back')
+        parser.add_argument('--show', type=int, default=20, help='Discrepancies listed per category')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['session']:
+            stock_take = StockTake.objects.filter(pk=options['session']).first()
+            if stock_take is None:
+                raise CommandError(f"Stock-take {options['session']} does not exist")
+        else:
+            branch = None
+            if options['branch']:
+                branch = Branch.objects.filter(code=options['branch']).first()
+                if branch is None:
+                    raise CommandError(f"Unknown branch {options['branch']}")
+            stock_take = StockTake.objects.create(
+                name=options['name'] or f"Stock-take {options['branch'] or ''} {options['prefix'] or 'all'}".replace('  ', ' '),
+                branch=branch, location_prefix=options['prefix'],
+            )
+            self.stdout.write(f"Started stock-take {stock_take.pk}")
+
+        try:
+            for path in options['files']:
+                with open(path, newline='', encoding='utf-8-sig') as scans:
+                    stored, errors = add_scans(stock_take, read_scans(scans), batch_size=options['batch_size'])
+                for line, message in errors:
+                    self.stderr.write(f"{path} line {line}: {message}")
+                self.stdout.write(f"Loaded {stored} scans from {path}, {len(errors)} errors")
+            report = apply_corrections(stock_take) if options['apply'] else reconcile(stock_take)
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        for category in CATEGORIES:
+            rows = report[category]
+            self.stdout.write(f"{category.replace('_', ' ').capitalize()}: {len(rows)}")
+            for row in rows[:options['show']]:
+                change = f" ({row.recorded} -> {row.found})" if row.found else ''
+                self.stdout.write(
+                    f"    {row.barcode}  {row.title}  recorded at {row.recorded_location or '-'}, "
+                    f"found at {row.found_location or '-'}{change}"
+                )
+        if options['apply']:
+            stock_take.refresh_from_db()
+            self.stdout.write(f"Applied stock-take {stock_take.pk}: corrected {stock_take.summary['corrected']} copies")
@@ -0,0 +1,149 @@
+# File: library/matching.py
+"""
+Matching available copies to pending reservations in batches.
+
+``plan`` computes the whole assignment for a set of copies and reservations
+in one pass. Each branch has its own queue per book: a reservation only
+gets copies at its pickup branch. Within a queue reservations are served
+oldest first (FIFO), and the oldest gets the best copy, ranked by condition
+and then by distance from the branch's hold shelf (LIBRARY_HOLD_SHELF_LOCATION
+unless the branch sets its own), so the desk fetches good copies from
+nearby shelves first. ``assign`` applies a plan with one bulk UPDATE per
+table and one notification job; ``match_books`` does both for everything
+matchable among the given books, optionally at one branch only. Branches
+never touch each other's rows, so they can be matched in parallel.
+"""
+import re
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .audit import record_updates
+from .changes import record_ids
+from .jobs import enqueue
+from .models import BookCopy, Branch, Reservation
+from .waitlist import invalidate as invalidate_waitlist
+
+# Best first. BookCopy.condition is free text; anything else ranks with 'fair'.
+CONDITIONS = ('new', 'good', 'fair', 'worn', 'damaged')
+UNKNOWN_CONDITION = CONDITIONS.index('fair')
+# Locations look like "L1-A-12" (room, shelf, position). Another room is
+# always further than any shelf in the same room.
+LOCATION_RE = re.compile(r'^([A-Z0-9]+)-([A-Z])-([0-9]+)$')
+ROOM_DISTANCE = 10000
+SHELF_DISTANCE = 100
+
+
+def condition_rank(condition):
+    condition = (condition or '').strip().lower()
+    return CONDITIONS.index(condition) if condition in CONDITIONS else UNKNOWN_CONDITION
+
+
+def shelf_distance(location, origin):
+    """Rough walking distance between two shelf locations; unparseable ones count as far away."""
+    if not origin:
+        return 0
+    here, there = LOCATION_RE.match(location or ''), LOCATION_RE.match(origin)
+    if not here or not there:
+        return 2 * ROOM_DISTANCE
+    room, shelf, position = here.groups()
+    origin_room, origin_shelf, origin_position = there.groups()
+    if room != origin_room:
+        return ROOM_DISTANCE
+    return SHELF_DISTANCE * abs(ord(shelf) - ord(origin_shelf)) + abs(int(position) - int(origin_position))
+
+
+def copy_preference(copy, origin=None):
+    """Sort key for choosing among copies of the same book, best first."""
+    if origin is None:
+        origin = getattr(settings, 'LIBRARY_HOLD_SHELF_LOCATION', None)
+    return condition_rank(copy.condition), shelf_distance(copy.location, origin), copy.pk
+
+
+def hold_shelf_origins(branch_ids):
+    """The hold shelf location of each branch, falling back to LIBRARY_HOLD_SHELF_LOCATION."""
+    default = getattr(settings, 'LIBRARY_HOLD_SHELF_LOCATION', None)
+    return {
+        pk: location or default
+        for pk, location in Branch.objects.filter(pk__in=set(branch_ids)).values_list('pk', 'hold_shelf_location')
+    }
+
+
+def plan(copies, reservations):
+    """
+    Pair ``reservations`` with ``copies`` of their book at their pickup
+    branch. Returns ``(reservation, copy)`` pairs; reservations without a
+    copy are left out.
+    """
+    shelves = defaultdict(list)
+    for copy in copies:
+        shelves[(copy.book_id, copy.branch_id)].append(copy)
+    origins = hold_shelf_origins(branch_id for _, branch_id in shelves)
+    shelves = {
+        key: deque(sorted(shelf, key=lambda copy: copy_preference(copy, origins.get(key[1]))))
+        for key, shelf in shelves.items()
+    }
+    pairs = []
+    for reservation in sorted(reservations, key=lambda reservation: (reservation.reservation_date, reservation.pk)):
+        shelf = shelves.get((reservation.book_id, reservation.branch_id))
+        if shelf:
+            pairs.append((reservation, shelf.popleft()))
+    return pairs
+
+
+def assign(pairs, now=None):
+    """
+    Apply a plan: reservations become assigned with a fresh hold window and
+    their copies go to the hold shelf. Run inside the transaction that
+    locked the rows. Waitlist caches are left to the caller.
+    """
+    if not pairs:
+        return []
+    now = now or timezone.now()
+    record_updates(Reservation, [reservation.pk for reservation, _ in pairs])
+    reservations = []
+    for reservation, copy in pairs:
+        reservation.copy = copy
+        reservation.status = 'assigned'
+        reservation.expiration_date = reservation.hold_expiration(now)
+        reservation.version += 1
+        reservations.append(reservation)
+    copy_ids = [copy.pk for _, copy in pairs]
+    Reservation.objects.bulk_update(reservations, ['copy', 'status', 'expiration_date', 'version'])
+    BookCopy.objects.filter(pk__in=copy_ids).update(status='reserved')
+    enqueue('notify_reservations', {'reservations': [reservation.pk for reservation in reservations]})
+    record_ids(Reservation, [reservation.pk for reservation in reservations])
+    record_ids(BookCopy, copy_ids)
+    return reservations
+
+
+def match_books(book_ids, now=None, branch=None):
+    """
+    Assign every available copy of ``book_ids`` that a pending reservation is
+    waiting for, at ``branch`` (a Branch or its id) or at every branch.
+    """
+    book_ids = set(book_ids)
+    if not book_ids:
+        return []
+    with transaction.atomic():
+        copies = BookCopy.objects.select_for_update().filter(book_id__in=book_ids, status='available')
+        if branch is not None:
+            copies = copies.filter(branch=branch)
+        copies = list(copies)
+        if not copies:
+            return []
+        reservations = list(
+            Reservation.objects.select_for_update().select_related('user', 'book')
+            .filter(
+                book_id__in={copy.book_id for copy in copies},
+                branch_id__in={copy.branch_id for copy in copies},
+                status='pending', copy__isnull=True,
+            )
+            .order_by('reservation_date', 'pk')
+        )
+        pairs = plan(copies, reservations)
+        assign(pairs, now)
+        invalidate_waitlist(*(reservation.book_id for reservation, _ in pairs))
+    return pairs
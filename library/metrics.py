@@ -0,0 +1,183 @@
+# File: library/metrics.py
+"""
+Operational metrics in the Prometheus text format, for ``GET /metrics``.
+
+Every figure comes from an indexed aggregate over the working set: active
+reservations per branch, open loans, queued/running/failed jobs, queued
+notifications and digests, the last finished job of each kind and the
+timer's leader lease. The aggregates are cached for
+LIBRARY_METRICS_CACHE_SECONDS, so frequent scrapes or several scrapers do
+not add load. Only the database round trip (``library_db_query_seconds``)
+is measured on every scrape.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import tasks  # noqa: F401  Registers the job handlers, whose kinds are reported
+from .jobs import HANDLERS
+from .models import Borrowing, Job, LeaderLease, Notification, NotificationDigest, Reservation
+
+CACHE_KEY = 'library:metrics'
+TIMER_LEASE = 'run_timer'
+
+
+def _family(name, kind, help_text, samples):
+    """One metric family: ``samples`` is a list of ``(labels, value)``."""
+    return name, kind, help_text, samples
+
+
+def _seconds(delta):
+    return delta.total_seconds() if delta is not None else None
+
+
+def ping():
+    """Round-trip a trivial query. Returns the time it took in seconds; raises if the database is unreachable."""
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return time.perf_counter() - started
+
+
+def _circulation(now):
+    horizon = now + timedelta(hours=getattr(settings, 'LIBRARY_METRICS_EXPIRY_HOURS', 24))
+    active = (
+        Reservation.objects.filter(status__in=Reservation.ACTIVE_STATUSES)
+        .values_list('branch__code', 'status').annotate(count=Count('id')).order_by()
+    )
+    expiring = (
+        Reservation.objects.filter(status='assigned', expiration_date__gte=now, expiration_date__lt=horizon)
+        .values_list('branch__code').annotate(count=Count('id')).order_by()
+    )
+    # Holds the expiry run should already have cleared: a growing number means the timer or the workers lag.
+    lapsed = (
+        Reservation.objects.filter(status='assigned', expiration_date__lt=now)
+        .values_list('branch__code').annotate(count=Count('id')).order_by()
+    )
+    overdue = Borrowing.objects.filter(return_date__isnull=True, due_date__lt=now).count()
+    return [
+        _family('library_reservations', 'gauge', 'Active reservations by pickup branch and status.', [
+            ({'branch': branch, 'status': status}, count) for branch, status, count in active
+        ]),
+        _family('library_holds_expiring', 'gauge', 'Assigned holds whose pickup window ends within the horizon.', [
+            ({'branch': branch}, count) for branch, count in expiring
+        ]),
+        _family('library_holds_lapsed', 'gauge', 'Assigned holds past their pickup window, not yet expired.', [
+            ({'branch': branch}, count) for branch, count in lapsed
+        ]),
+        _family('library_loans_overdue', 'gauge', 'Open loans past their due date.', [({}, overdue)]),
+    ]
+
+
+def _jobs(now):
+    depth = (
+        Job.objects.filter(status__in=['queued', 'running', 'failed'])
+        .values_list('kind', 'status').annotate(count=Count('id')).order_by()
+    )
+    oldest = (
+        Job.objects.filter(status='queued', run_at__lte=now)
+        .values_list('kind').annotate(oldest=Min('run_at')).order_by()
+    )
+    durations, successes = [], []
+    for kind in sorted(HANDLERS):
+        last = (
+            Job.objects.filter(kind=kind, status='done').order_by('-finished_at')
+            .values_list('started_at', 'finished_at').first()
+        )
+        if last and last[0] and last[1]:
+            durations.append(({'kind': kind}, _seconds(last[1] - last[0])))
+            successes.append(({'kind': kind}, last[1].timestamp()))
+    return [
+        _family('library_jobs', 'gauge', 'Background jobs by kind and state.', [
+            ({'kind': kind, 'status': status}, count) for kind, status, count in depth
+        ]),
+        _family('library_job_queue_lag_seconds', 'gauge', 'Age of the oldest due job still waiting for a worker.', [
+            ({'kind': kind}, _seconds(now - oldest_run_at)) for kind, oldest_run_at in oldest
+        ]),
+        _family('library_job_duration_seconds', 'gauge', 'Run time of the last successful job of each kind.', durations),
+        _family(
+            'library_job_last_success_timestamp_seconds', 'gauge',
+            'When the last job of each kind finished successfully (Unix time).', successes,
+        ),
+    ]
+
+
+def _notifications(now):
+    pending = Notification.objects.filter(digest__isnull=True).aggregate(count=Count('id'), oldest=Min('created_at'))
+    digests = (
+        NotificationDigest.objects.filter(status__in=['queued', 'sending', 'failed'])
+        .values_list('status').annotate(count=Count('id')).order_by()
+    )
+    return [
+        _family('library_notifications_pending', 'gauge', 'Notifications not yet collected into a digest.', [
+            ({}, pending['count']),
+        ]),
+        _family('library_notifications_pending_age_seconds', 'gauge', 'Age of the oldest uncollected notification.', [
+            ({}, _seconds(now - pending['oldest']) if pending['oldest'] else 0),
+        ]),
+        _family('library_notification_digests', 'gauge', 'E-mail digests waiting to be sent or being sent, by state.', [
+            ({'status': status}, count) for status, count in digests
+        ]),
+    ]
+
+
+def _timer(now):
+    lease = LeaderLease.objects.filter(name=TIMER_LEASE).values('renewed_at', 'expires_at', 'token').first()
+    if lease is None:
+        return []
+    return [
+        _family('library_timer_lease_age_seconds', 'gauge', 'Time since the timer leader last renewed its lease.', [
+            ({}, _seconds(now - lease['renewed_at'])),
+        ]),
+        _family('library_timer_leader', 'gauge', '1 while a timer holds an unexpired lease.', [
+            ({}, int(lease['expires_at'] > now)),
+        ]),
+        _family('library_timer_fencing_token', 'counter', 'Times timer leadership changed hands.', [
+            ({}, lease['token']),
+        ]),
+    ]
+
+
+def collect():
+    """The cached metric families, computed again when the cache entry runs out."""
+    families = cache.get(CACHE_KEY)
+    if families is None:
+        now = timezone.now()
+        started = time.perf_counter()
+        families = _circulation(now) + _jobs(now) + _notifications(now) + _timer(now)
+        families.append(_family(
+            'library_metrics_collect_seconds', 'gauge', 'Time the last computation of these metrics took.',
+            [({}, time.perf_counter() - started)],
+        ))
+        cache.set(CACHE_KEY, families, getattr(settings, 'LIBRARY_METRICS_CACHE_SECONDS', 15))
+    return families
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(families):
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ','.join(f'{key}="{_label_value(label)}"' for key, label in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def exposition():
+    """The full ``/metrics`` response body."""
+    return render(collect() + [
+        _family('library_db_query_seconds', 'gauge', 'Round trip of a trivial database query.', [({}, ping())]),
+    ])
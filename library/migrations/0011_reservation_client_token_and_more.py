@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_remove_reservation_is_completed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='client_token',
+            field=models.CharField(blank=True, help_text='Idempotency key sent by the client that placed the reservation, if any.', max_length=64, null=True, unique=True, verbose_name='Client Token'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'status'], name='reservation_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['book', 'status', 'reservation_date'], name='reservation_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'assigned'])), fields=('user', 'book'), name='unique_active_reservation_per_book'),
+        ),
+    ]
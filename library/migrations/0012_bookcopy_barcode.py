@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_reservation_client_token_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookcopy',
+            name='barcode',
+            field=models.CharField(blank=True, help_text='Identifier printed on the copy label, scanned at the desk', max_length=32, null=True, unique=True, verbose_name='Barcode'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_bookcopy_barcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCirculationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('dimension', models.CharField(choices=[('book', 'Book'), ('genre', 'Genre'), ('role', 'User Role')], max_length=10, verbose_name='Dimension')),
+                ('key', models.CharField(help_text='Book id, genre or role', max_length=255, verbose_name='Key')),
+                ('label', models.CharField(blank=True, max_length=255, verbose_name='Label')),
+                ('borrows', models.PositiveIntegerField(default=0, verbose_name='Borrows')),
+                ('returns', models.PositiveIntegerField(default=0, verbose_name='Returns')),
+                ('reservations', models.PositiveIntegerField(default=0, verbose_name='Reservations')),
+                ('holds_filled', models.PositiveIntegerField(default=0, verbose_name='Holds Picked Up')),
+                ('hold_wait_seconds', models.BigIntegerField(default=0, verbose_name='Total Hold Wait (s)')),
+            ],
+            options={
+                'verbose_name': 'Daily circulation statistic',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['borrow_date'], name='borrowing_borrow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(fields=['return_date'], name='borrowing_return_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['reservation_date'], name='reservation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycirculationstat',
+            index=models.Index(fields=['dimension', 'date'], name='daily_stat_dimension_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycirculationstat',
+            constraint=models.UniqueConstraint(fields=('date', 'dimension', 'key'), name='unique_daily_stat'),
+        ),
+    ]
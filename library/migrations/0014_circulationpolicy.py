@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_dailycirculationstat_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(blank=True, choices=[('student', 'Student'), ('teacher', 'Teacher'), ('admin', 'Admin')], help_text='Leave empty to apply to every role', max_length=10, verbose_name='User Role')),
+                ('genre', models.CharField(blank=True, help_text='Leave empty to apply to every genre', max_length=50, verbose_name='Genre')),
+                ('loan_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='Loan Period (days)')),
+                ('max_renewals', models.PositiveIntegerField(blank=True, null=True, verbose_name='Max Renewals')),
+                ('hold_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='Hold Window (days)')),
+                ('max_loans', models.PositiveIntegerField(blank=True, null=True, verbose_name='Max Concurrent Loans')),
+                ('max_holds', models.PositiveIntegerField(blank=True, null=True, verbose_name='Max Active Reservations')),
+                ('book', models.ForeignKey(blank=True, help_text='Restrict the rule to a single title', null=True, on_delete=django.db.models.deletion.CASCADE, to='library.book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name': 'Circulation policy',
+                'verbose_name_plural': 'Circulation policies',
+                'constraints': [models.UniqueConstraint(fields=('role', 'genre', 'book'), name='unique_policy_scope')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_circulationpolicy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowing',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Version'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Version'),
+        ),
+    ]
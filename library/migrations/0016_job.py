@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_borrowing_version_reservation_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='Kind')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('priority', models.SmallIntegerField(default=0, help_text='Higher runs first', verbose_name='Priority')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run At')),
+                ('dedupe_key', models.CharField(blank=True, help_text='At most one queued or running job may hold this key', max_length=100, null=True, verbose_name='Dedupe Key')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Max Attempts')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Lease Expires At')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Last Heartbeat')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_at'], name='job_claim_idx'), models.Index(fields=['kind', 'status'], name='job_kind_status_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('dedupe_key',), name='unique_active_job_dedupe_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('holder', models.CharField(max_length=100, verbose_name='Holder')),
+                ('token', models.PositiveBigIntegerField(default=1, help_text='Incremented every time leadership changes hands', verbose_name='Fencing Token')),
+                ('expires_at', models.DateTimeField(verbose_name='Expires At')),
+                ('acquired_at', models.DateTimeField(verbose_name='Acquired At')),
+                ('renewed_at', models.DateTimeField(verbose_name='Renewed At')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_leaderlease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['copy', 'due_date'], name='borrowing_open_due_idx'),
+        ),
+    ]
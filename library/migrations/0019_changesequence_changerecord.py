@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:50
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_borrowing_borrowing_open_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='Last Value')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(unique=True, verbose_name='Sequence')),
+                ('model', models.CharField(max_length=20, verbose_name='Model')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Object ID')),
+                ('action', models.CharField(choices=[('upsert', 'Created or Updated'), ('delete', 'Deleted')], max_length=10, verbose_name='Action')),
+                ('user_id', models.PositiveBigIntegerField(blank=True, help_text='Reader the record belongs to; only they and staff see it in the feed', null=True, verbose_name='Owner')),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Data')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created At')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id', 'seq'], name='change_object_idx'), models.Index(fields=['created_at'], name='change_created_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0019_changesequence_changerecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Author Key'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='block_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='Block Key'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='isbn13',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=13, null=True, verbose_name='ISBN-13'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='title_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Title Key'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# A frozen copy of library/dedupe.py as of this migration: later changes to
+# the live normaliser must not change what this backfill writes.
+ARTICLES = {'the', 'a', 'an', 'der', 'die', 'das', 'le', 'la', 'les', 'el', 'los', 'las'}
+
+
+def _isbn13_check(first12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def canonical_isbn(value):
+    digits = re.sub(r'[^0-9Xx]', '', value or '').upper()
+    if len(digits) == 10 and digits[:9].isdigit():
+        total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+        check = (11 - total % 11) % 11
+        if digits[9] != ('X' if check == 10 else str(check)):
+            return None
+        digits = '978' + digits[:9]
+        return digits + _isbn13_check(digits)
+    if len(digits) == 13 and digits.isdigit():
+        return digits if digits[12] == _isbn13_check(digits[:12]) else None
+    return None
+
+
+def _words(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c)).lower()
+    return re.findall(r'[a-z0-9]+', value.replace('&', ' and '))
+
+
+def book_keys(title, author, isbn):
+    title_words = _words(title)
+    if len(title_words) > 1 and title_words[0] in ARTICLES:
+        title_words = title_words[1:]
+    tkey = ' '.join(title_words)
+    akey = ' '.join(sorted(word for word in _words(author) if len(word) > 1))
+    author_words = akey.split()
+    author_part = max(author_words, key=lambda word: (len(word), word))[:6] if author_words else ''
+    return {
+        'isbn13': canonical_isbn(isbn),
+        'title_key': tkey[:255],
+        'author_key': akey[:255],
+        'block_key': f"{tkey.split(' ', 1)[0][:6]}:{author_part}",
+    }
+
+
+def backfill_book_keys(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    batch = []
+    for book in Book.objects.only('id', 'title', 'author', 'isbn').iterator(chunk_size=2000):
+        for field, value in book_keys(book.title, book.author, book.isbn).items():
+            setattr(book, field, value)
+        batch.append(book)
+        if len(batch) >= 2000:
+            Book.objects.bulk_update(batch, ['isbn13', 'title_key', 'author_key', 'block_key'])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ['isbn13', 'title_key', 'author_key', 'block_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0020_book_author_key_book_block_key_book_isbn13_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_book_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0021_backfill_book_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['status', 'id'], name='bookcopy_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['condition', 'id'], name='bookcopy_condition_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowing',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['id'], name='borrowing_open_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'id'], name='reservation_status_id_idx'),
+        ),
+    ]
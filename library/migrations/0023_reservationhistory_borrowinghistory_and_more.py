@@ -0,0 +1,69 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0022_bookcopy_bookcopy_status_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservation_date', models.DateTimeField(verbose_name='Reservation Date')),
+                ('expiration_date', models.DateTimeField(verbose_name='Expiration Date')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('picked_up', 'Picked Up'), ('expired', 'Expired'), ('canceled', 'Canceled')], max_length=10, verbose_name='Status')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archived At')),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.book', verbose_name='Book')),
+                ('copy', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.bookcopy', verbose_name='Copy')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name_plural': 'reservation history',
+            },
+        ),
+        migrations.CreateModel(
+            name='BorrowingHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrow_date', models.DateTimeField(verbose_name='Borrow Date')),
+                ('due_date', models.DateTimeField(verbose_name='Due Date')),
+                ('return_date', models.DateTimeField(verbose_name='Return Date')),
+                ('renewal_count', models.IntegerField(default=0, verbose_name='Renewal Count')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archived At')),
+                ('copy', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.bookcopy', verbose_name='Copy')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('reservation', models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='borrowing', to='library.reservationhistory', verbose_name='Related Reservation')),
+            ],
+            options={
+                'verbose_name_plural': 'borrowing history',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reservationhistory',
+            index=models.Index(fields=['user', 'reservation_date'], name='reservationhist_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservationhistory',
+            index=models.Index(fields=['reservation_date'], name='reservationhist_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowinghistory',
+            index=models.Index(fields=['user', 'borrow_date'], name='borrowinghist_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowinghistory',
+            index=models.Index(fields=['borrow_date'], name='borrowinghist_borrow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowinghistory',
+            index=models.Index(fields=['return_date'], name='borrowinghist_return_date_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0023_reservationhistory_borrowinghistory_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('location_prefix', models.CharField(blank=True, help_text='Only copies whose location starts with this are expected on the shelves (e.g. L1- for one room); leave blank for the whole collection', max_length=50, verbose_name='Location Prefix')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('applied', 'Applied')], default='open', max_length=10, verbose_name='Status')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Started At')),
+                ('applied_at', models.DateTimeField(blank=True, null=True, verbose_name='Applied At')),
+                ('summary', models.JSONField(blank=True, default=dict, verbose_name='Summary')),
+                ('started_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Started By')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockTakeScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=32, verbose_name='Barcode')),
+                ('location', models.CharField(max_length=50, verbose_name='Found At')),
+                ('condition', models.CharField(blank=True, max_length=50, verbose_name='Condition')),
+                ('scanned_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Scanned At')),
+                ('stock_take', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='library.stocktake', verbose_name='Stock-take')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock_take', 'barcode'), name='unique_stocktake_scan')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0024_stocktake_stocktakescan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CopyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('checkout', 'Checked Out'), ('checkin', 'Checked In'), ('condition', 'Condition Changed'), ('relocation', 'Relocated')], max_length=10, verbose_name='Event')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Timestamp')),
+                ('user_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Reader')),
+                ('borrowing_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Borrowing')),
+                ('old_value', models.CharField(blank=True, max_length=50, verbose_name='Old Value')),
+                ('new_value', models.CharField(blank=True, max_length=50, verbose_name='New Value')),
+                ('worsened', models.BooleanField(default=False, verbose_name='Condition Worsened')),
+                ('copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='library.bookcopy', verbose_name='Copy')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['copy', 'timestamp'], name='copyevent_copy_time_idx'), models.Index(condition=models.Q(('worsened', True)), fields=['timestamp'], name='copyevent_worsened_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def backfill_loan_events(apps, schema_editor):
+    CopyEvent = apps.get_model('library', 'CopyEvent')
+    BookCopy = apps.get_model('library', 'BookCopy')
+    batch = []
+    for model_name in ('Borrowing', 'BorrowingHistory'):
+        model = apps.get_model('library', model_name)
+        # Archived loans may point at copies that have since been deleted.
+        rows = model.objects.filter(copy_id__in=BookCopy.objects.values('id')).values_list('id', 'copy_id', 'user_id', 'borrow_date', 'return_date')
+        for pk, copy_id, user_id, borrow_date, return_date in rows.iterator(chunk_size=2000):
+            batch.append(CopyEvent(copy_id=copy_id, kind='checkout', timestamp=borrow_date,
+                                   user_id=user_id, borrowing_id=pk))
+            if return_date:
+                batch.append(CopyEvent(copy_id=copy_id, kind='checkin', timestamp=return_date,
+                                       user_id=user_id, borrowing_id=pk))
+            if len(batch) >= 2000:
+                CopyEvent.objects.bulk_create(batch)
+                batch = []
+    if batch:
+        CopyEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0025_copyevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_loan_events, migrations.RunPython.noop),
+    ]
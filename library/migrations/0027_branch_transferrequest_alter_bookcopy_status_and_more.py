@@ -0,0 +1,143 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:07
+
+import django.db.models.deletion
+import django.utils.timezone
+import library.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_default_branch(apps, schema_editor):
+    # Everything that exists so far belongs to the one library there was.
+    Branch = apps.get_model('library', 'Branch')
+    code = getattr(settings, 'LIBRARY_DEFAULT_BRANCH', 'MAIN')
+    branch, _ = Branch.objects.get_or_create(code=code, defaults={'name': code})
+    for model_name in ('BookCopy', 'Reservation', 'ReservationHistory'):
+        apps.get_model('library', model_name).objects.filter(branch__isnull=True).update(branch=branch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0026_backfill_copy_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10, unique=True, verbose_name='Code')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('hold_shelf_location', models.CharField(blank=True, help_text='Copies nearest to here are assigned first; defaults to LIBRARY_HOLD_SHELF_LOCATION', max_length=50, verbose_name='Hold Shelf Location')),
+            ],
+            options={
+                'verbose_name_plural': 'branches',
+            },
+        ),
+        migrations.CreateModel(
+            name='TransferRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('requested', 'Requested'), ('in_transit', 'In Transit'), ('received', 'Received'), ('canceled', 'Canceled')], default='requested', max_length=10, verbose_name='Status')),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Requested At')),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='Dispatched At')),
+                ('received_at', models.DateTimeField(blank=True, null=True, verbose_name='Received At')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bookcopy',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('reserved', 'Reserved'), ('borrowed', 'Borrowed'), ('in_transit', 'In Transit')], db_index=True, default='available', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='copyevent',
+            name='kind',
+            field=models.CharField(choices=[('checkout', 'Checked Out'), ('checkin', 'Checked In'), ('condition', 'Condition Changed'), ('relocation', 'Relocated'), ('transfer', 'Transferred')], max_length=10, verbose_name='Event'),
+        ),
+        migrations.AddField(
+            model_name='bookcopy',
+            name='branch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='library.branch', verbose_name='Branch'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='branch',
+            field=models.ForeignKey(null=True, help_text='Only copies at this branch are assigned to the reservation', on_delete=django.db.models.deletion.PROTECT, to='library.branch', verbose_name='Pickup Branch'),
+        ),
+        migrations.AddField(
+            model_name='reservationhistory',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='library.branch', verbose_name='Pickup Branch'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='home_branch',
+            field=models.ForeignKey(blank=True, help_text='Where the reader picks up reservations unless they choose another branch', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library.branch', verbose_name='Home Branch'),
+        ),
+        migrations.AddField(
+            model_name='stocktake',
+            name='branch',
+            field=models.ForeignKey(blank=True, help_text='Branch whose shelves are counted; leave blank to count every branch', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='library.branch', verbose_name='Branch'),
+        ),
+        migrations.RunPython(assign_default_branch, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bookcopy',
+            name='branch',
+            field=models.ForeignKey(default=library.models.default_branch_id, on_delete=django.db.models.deletion.PROTECT, to='library.branch', verbose_name='Branch'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='branch',
+            field=models.ForeignKey(default=library.models.default_branch_id, help_text='Only copies at this branch are assigned to the reservation', on_delete=django.db.models.deletion.PROTECT, to='library.branch', verbose_name='Pickup Branch'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['branch', 'book', 'status'], name='bookcopy_branch_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['branch', 'book', 'status', 'reservation_date'], name='reservation_branch_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['branch', 'status', 'expiration_date'], name='reservation_branch_expiry_idx'),
+        ),
+        migrations.AddField(
+            model_name='transferrequest',
+            name='copy',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers', to='library.bookcopy', verbose_name='Copy'),
+        ),
+        migrations.AddField(
+            model_name='transferrequest',
+            name='from_branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='library.branch', verbose_name='From'),
+        ),
+        migrations.AddField(
+            model_name='transferrequest',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Requested By'),
+        ),
+        migrations.AddField(
+            model_name='transferrequest',
+            name='reservation',
+            field=models.ForeignKey(blank=True, help_text='The hold at the receiving branch this copy is meant for, if any', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library.reservation', verbose_name='For Reservation'),
+        ),
+        migrations.AddField(
+            model_name='transferrequest',
+            name='to_branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='library.branch', verbose_name='To'),
+        ),
+        migrations.AddIndex(
+            model_name='transferrequest',
+            index=models.Index(fields=['from_branch', 'status'], name='transfer_from_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferrequest',
+            index=models.Index(fields=['to_branch', 'status'], name='transfer_to_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transferrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['requested', 'in_transit'])), fields=('copy',), name='unique_open_transfer_per_copy'),
+        ),
+    ]
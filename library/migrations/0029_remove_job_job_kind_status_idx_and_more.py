@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0028_notificationdigest_notification_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_kind_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['kind', 'status', 'finished_at'], name='job_kind_finished_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0030_alter_notification_reservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transferrequest',
+            name='reservation',
+            field=models.ForeignKey(blank=True, db_constraint=False, help_text='The hold at the receiving branch this copy is meant for, if any', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='library.reservation', verbose_name='For Reservation'),
+        ),
+    ]
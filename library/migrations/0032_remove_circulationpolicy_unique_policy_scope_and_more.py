@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0031_alter_transferrequest_reservation'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='circulationpolicy',
+            name='unique_policy_scope',
+        ),
+        migrations.AddConstraint(
+            model_name='circulationpolicy',
+            constraint=models.UniqueConstraint(condition=models.Q(('book__isnull', True)), fields=('role', 'genre'), name='unique_policy_scope'),
+        ),
+        migrations.AddConstraint(
+            model_name='circulationpolicy',
+            constraint=models.UniqueConstraint(condition=models.Q(('book__isnull', False)), fields=('role', 'genre', 'book'), name='unique_book_policy_scope'),
+        ),
+    ]
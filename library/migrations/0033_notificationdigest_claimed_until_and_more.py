@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0032_remove_circulationpolicy_unique_policy_scope_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationdigest',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Claimed Until'),
+        ),
+        migrations.AlterField(
+            model_name='notificationdigest',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status'),
+        ),
+    ]
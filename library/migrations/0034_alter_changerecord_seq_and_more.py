@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0033_notificationdigest_claimed_until_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changerecord',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True, unique=True, verbose_name='Sequence'),
+        ),
+        migrations.AddIndex(
+            model_name='changerecord',
+            index=models.Index(condition=models.Q(('seq__isnull', True)), fields=['id'], name='change_unsequenced_idx'),
+        ),
+    ]
@@ -1,24 +1,114 @@
 # File: library/models.py
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 from datetime import timedelta
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from auditlog.registry import auditlog
+from .policies import genre_key, get_policy
+from .concurrency import ConcurrentUpdateError
+from .dedupe import book_keys
 
 # User Model (unchanged)
 class User(AbstractUser):
     ROLE_CHOICES = (('student', 'Student'), ('teacher', 'Teacher'), ('admin', 'Admin'))
     email = models.EmailField(unique=True, verbose_name="Email Address")
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name="User Role")
+    home_branch = models.ForeignKey(
+        'Branch', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Home Branch",
+        help_text="Where the reader picks up reservations unless they choose another branch"
+    )
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Roster imports match existing addresses case-insensitively (library/user_import.py).
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
 
     def __str__(self):
         return self.username
 
+# Library branches sharing this deployment
+class Branch(models.Model):
+    code = models.CharField(max_length=10, unique=True, verbose_name="Code")
+    name = models.CharField(max_length=255, verbose_name="Name")
+    hold_shelf_location = models.CharField(
+        max_length=50, blank=True, verbose_name="Hold Shelf Location",
+        help_text="Copies nearest to here are assigned first; defaults to LIBRARY_HOLD_SHELF_LOCATION"
+    )
+
+    class Meta:
+        verbose_name_plural = "branches"
+
+    def __str__(self):
+        return self.name
+
+
+_default_branch_ids = {}
+
+
+def default_branch_id():
+    """
+    The branch copies and reservations belong to unless one is given
+    (LIBRARY_DEFAULT_BRANCH). Resolved once per process: migrations create
+    the branch, and ``reset_default_branch`` runs after every migrate/flush.
+    """
+    code = getattr(settings, 'LIBRARY_DEFAULT_BRANCH', 'MAIN')
+    if code not in _default_branch_ids:
+        _default_branch_ids[code] = Branch.objects.get_or_create(code=code, defaults={'name': code})[0].pk
+    return _default_branch_ids[code]
+
+
+def reset_default_branch():
+    """Forget the resolved default branch, e.g. after it was deleted."""
+    _default_branch_ids.clear()
+
+# Optimistic concurrency control
+class VersionedModel(models.Model):
+    """
+    Saves are conditional on the version that was read: the UPDATE only
+    matches ``WHERE version = n`` and bumps it to ``n + 1``. If another writer
+    got there first the save raises ConcurrentUpdateError instead of silently
+    overwriting their change. Queryset ``update()`` calls must bump the
+    version themselves (``version=F('version') + 1``).
+    """
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Version")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'version' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'version']
+        # The row and everything its post_save handlers write (a pickup's
+        # borrowing and copy status) commit or roll back together.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        version_field = self._meta.get_field('version')
+        expected = self.version
+        values = [
+            (field, model, expected + 1 if field is version_field else value)
+            for field, model, value in values
+        ]
+        if base_qs.filter(pk=pk_val, version=expected)._update(values) > 0:
+            self.version = expected + 1
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise ConcurrentUpdateError(
+                f"{self._meta.verbose_name.capitalize()} {pk_val} was changed by someone else (expected version {expected})."
+            )
+        return False
+
 # Book Model (unchanged)
 class Book(models.Model):
     title = models.CharField(max_length=255, verbose_name="Book Title")
@@ -36,18 +126,36 @@ class Book(models.Model):
     publisher = models.CharField(
         max_length=255, null=True, blank=True, verbose_name="Publisher", help_text="e.g., Penguin Books"
     )
+    # Duplicate detection keys, derived from the fields above on save (see library/dedupe.py)
+    isbn13 = models.CharField(max_length=13, null=True, blank=True, editable=False, db_index=True, verbose_name="ISBN-13")
+    title_key = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Title Key")
+    author_key = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Author Key")
+    block_key = models.CharField(max_length=20, blank=True, editable=False, db_index=True, verbose_name="Block Key")
 
     def __str__(self):
         return self.title
 
+    def update_keys(self):
+        for field, value in book_keys(self.title, self.author, self.isbn).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        self.update_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'isbn13', 'title_key', 'author_key', 'block_key'}
+        super().save(*args, **kwargs)
+
 # BookCopy Model (unchanged)
 class BookCopy(models.Model):
     STATUS_CHOICES = (
         ('available', 'Available'),
         ('reserved', 'Reserved'),
         ('borrowed', 'Borrowed'),
+        ('in_transit', 'In Transit'),
     )
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name="Book")
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, default=default_branch_id, verbose_name="Branch")
     condition = models.CharField(
         max_length=50, default='good', verbose_name="Condition", help_text="e.g., good, damaged"
     )
@@ -60,12 +168,25 @@ class BookCopy(models.Model):
     status = models.CharField(
         max_length=20, choices=STATUS_CHOICES, default='available', verbose_name="Status", db_index=True
     )
+    barcode = models.CharField(
+        max_length=32, unique=True, null=True, blank=True,
+        verbose_name="Barcode", help_text="Identifier printed on the copy label, scanned at the desk"
+    )
+
+    class Meta:
+        indexes = [
+            # Admin changelist filters, paged by primary key.
+            models.Index(fields=['status', 'id'], name='bookcopy_status_id_idx'),
+            models.Index(fields=['condition', 'id'], name='bookcopy_condition_id_idx'),
+            # Available copies of a book at one branch, for matching.
+            models.Index(fields=['branch', 'book', 'status'], name='bookcopy_branch_book_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} - {self.location}"
 
 # Reservation Model
-class Reservation(models.Model):
+class Reservation(VersionedModel):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('assigned', 'Assigned'),
@@ -76,11 +197,40 @@ class Reservation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
     book = models.ForeignKey('Book', on_delete=models.CASCADE, verbose_name="Book")
     copy = models.ForeignKey('BookCopy', on_delete=models.CASCADE, null=True, blank=True, verbose_name="Copy")
+    branch = models.ForeignKey(
+        Branch, on_delete=models.PROTECT, default=default_branch_id, verbose_name="Pickup Branch",
+        help_text="Only copies at this branch are assigned to the reservation"
+    )
     reservation_date = models.DateTimeField(auto_now_add=True, verbose_name="Reservation Date")
     expiration_date = models.DateTimeField(verbose_name="Expiration Date", help_text="e.g., 2025-03-13")
     status = models.CharField(
         max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Status"
     )
+    client_token = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, verbose_name="Client Token",
+        help_text="Idempotency key sent by the client that placed the reservation, if any."
+    )
+
+    ACTIVE_STATUSES = ('pending', 'assigned')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='reservation_user_status_idx'),
+            models.Index(fields=['book', 'status', 'reservation_date'], name='reservation_queue_idx'),
+            models.Index(fields=['reservation_date'], name='reservation_date_idx'),
+            models.Index(fields=['status', 'id'], name='reservation_status_id_idx'),
+            # Per-branch queues and hold expiry.
+            models.Index(fields=['branch', 'book', 'status', 'reservation_date'], name='reservation_branch_queue_idx'),
+            models.Index(fields=['branch', 'status', 'expiration_date'], name='reservation_branch_expiry_idx'),
+        ]
+        constraints = [
+            # A user can only hold one active reservation per book.
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(status__in=['pending', 'assigned']),
+                name='unique_active_reservation_per_book',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.status})"
@@ -101,18 +251,25 @@ class Reservation(models.Model):
         print(f"check_expiration: Reservation {self.id} not expired")
         return False
 
+    def hold_expiration(self, now=None):
+        """End of the pickup window for a copy put on the hold shelf ``now`` (the policy's hold_days)."""
+        return (now or timezone.now()) + timedelta(days=get_policy(self.user, self.book).hold_days)
+
     def assign_available_copy(self):
         print(f"assign_available_copy: Processing reservation {self.id} for book {self.book.title}, current status: {self.status}")
         if self.status == 'pending' and not self.copy:
-            # Find an available copy of the SAME book
-            available_copy = BookCopy.objects.filter(
-                book=self.book,
-                status='available'
-            ).first()
+            # Best available copy of the SAME book at the pickup branch (matching imports this module)
+            from .matching import copy_preference
+            origin = self.branch.hold_shelf_location or None
+            available_copy = min(
+                BookCopy.objects.filter(book=self.book, branch_id=self.branch_id, status='available'),
+                key=lambda copy: copy_preference(copy, origin), default=None
+            )
             if available_copy:
                 print(f"assign_available_copy: Found available copy {available_copy} for book {self.book.title}")
                 self.copy = available_copy
                 self.status = 'assigned'
+                self.expiration_date = self.hold_expiration()
                 available_copy.status = 'reserved'  # Match your BookCopy status choices
                 available_copy.save()
                 self.save()
@@ -134,10 +291,35 @@ class Reservation(models.Model):
         self.status = 'canceled'
         self.save()
 
-auditlog.register(Reservation)
+    def open_borrowing(self, now=None):
+        """
+        Return ``(borrowing, created)`` for this picked-up reservation, lending
+        the copy if no borrowing exists yet. Borrowing.reservation is one-to-one,
+        so concurrent callers all end up with the same row and only the one
+        that created it touches the copy.
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            borrowing, created = Borrowing.objects.get_or_create(
+                reservation=self,
+                defaults=dict(
+                    user=self.user,
+                    copy=self.copy,
+                    borrow_date=now,
+                    due_date=now + timedelta(days=get_policy(self.user, self.book).loan_days),
+                    renewal_count=0,
+                ),
+            )
+            if created and self.copy.status != 'borrowed':
+                self.copy.status = 'borrowed'
+                self.copy.save()
+        return borrowing, created
+
+# Only these fields are diffed; library/audit.py coalesces the entries per transaction.
+auditlog.register(Reservation, include_fields=['user', 'book', 'copy', 'expiration_date', 'status'])
 
 # Borrowing Model (unchanged)
-class Borrowing(models.Model):
+class Borrowing(VersionedModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
     copy = models.ForeignKey(BookCopy, on_delete=models.CASCADE, verbose_name="Copy")
     borrow_date = models.DateTimeField(auto_now_add=True, verbose_name="Borrow Date")
@@ -153,6 +335,19 @@ class Borrowing(models.Model):
         help_text="The reservation that initiated this borrowing, if applicable."
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['borrow_date'], name='borrowing_borrow_date_idx'),
+            models.Index(fields=['return_date'], name='borrowing_return_date_idx'),
+            # "Currently on loan" in the admin is return_date IS NULL, paged by primary key.
+            models.Index(fields=['id'], condition=models.Q(return_date__isnull=True), name='borrowing_open_id_idx'),
+            # Open loans per copy, ordered by due date, for waitlist estimates.
+            models.Index(
+                fields=['copy', 'due_date'], condition=models.Q(return_date__isnull=True),
+                name='borrowing_open_due_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.copy}"
 
@@ -160,9 +355,10 @@ class Borrowing(models.Model):
         if self.pk:
             old_instance = Borrowing.objects.get(pk=self.pk)
             if old_instance.due_date != self.due_date:
-                if old_instance.renewal_count >= 2:
+                max_renewals = get_policy(self.user, self.copy.book).max_renewals
+                if old_instance.renewal_count >= max_renewals:
                     raise ValidationError({
-                        'due_date': ["Cannot extend due date: Maximum number of renewals (2) reached."]
+                        'due_date': [f"Cannot extend due date: Maximum number of renewals ({max_renewals}) reached."]
                     })
                 if old_instance.return_date is not None:
                     raise ValidationError({
@@ -181,15 +377,435 @@ class Borrowing(models.Model):
             print(f"Return date set for Borrowing {self.id}")
 
     def renew(self):
-        if self.renewal_count >= 2:
-            raise ValidationError("Maximum number of renewals (2) reached.")
+        policy = get_policy(self.user, self.copy.book)
+        if self.renewal_count >= policy.max_renewals:
+            raise ValidationError(f"Maximum number of renewals ({policy.max_renewals}) reached.")
         if self.return_date is not None:
             raise ValidationError("Cannot renew a borrowing that has been returned.")
-        self.due_date += timedelta(days=14)
+        self.due_date += timedelta(days=policy.loan_days)
         self.renewal_count += 1
         self.save()
         return True
 
+# Circulation policy rules (resolved and cached by library/policies.py)
+class CirculationPolicy(models.Model):
+    role = models.CharField(
+        max_length=10, choices=User.ROLE_CHOICES, blank=True, verbose_name="User Role",
+        help_text="Leave empty to apply to every role"
+    )
+    genre = models.CharField(
+        max_length=50, blank=True, verbose_name="Genre", help_text="Leave empty to apply to every genre"
+    )
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Book",
+        help_text="Restrict the rule to a single title"
+    )
+    loan_days = models.PositiveIntegerField(null=True, blank=True, verbose_name="Loan Period (days)")
+    max_renewals = models.PositiveIntegerField(null=True, blank=True, verbose_name="Max Renewals")
+    hold_days = models.PositiveIntegerField(null=True, blank=True, verbose_name="Hold Window (days)")
+    max_loans = models.PositiveIntegerField(null=True, blank=True, verbose_name="Max Concurrent Loans")
+    max_holds = models.PositiveIntegerField(null=True, blank=True, verbose_name="Max Active Reservations")
+
+    class Meta:
+        verbose_name = "Circulation policy"
+        verbose_name_plural = "Circulation policies"
+        constraints = [
+            # Two partial constraints because book is NULL for role/genre rules
+            # and NULLs never collide (SQLite has no NULLS NOT DISTINCT).
+            models.UniqueConstraint(
+                fields=['role', 'genre'], condition=models.Q(book__isnull=True), name='unique_policy_scope',
+            ),
+            models.UniqueConstraint(
+                fields=['role', 'genre', 'book'], condition=models.Q(book__isnull=False), name='unique_book_policy_scope',
+            ),
+        ]
+
+    def clean(self):
+        super().clean()
+        if self.book_id and self.genre:
+            raise ValidationError({'genre': "A book rule applies to that title whatever its genre; leave the genre empty."})
+
+    def save(self, *args, **kwargs):
+        self.genre = genre_key(self.genre)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        scope = [part for part in (self.get_role_display(), self.genre, self.book and self.book.title) if part]
+        return " / ".join(scope) or "Default"
+
+# Daily circulation rollups (filled by the rollup_circulation command)
+class DailyCirculationStat(models.Model):
+    DIMENSION_CHOICES = (
+        ('book', 'Book'),
+        ('genre', 'Genre'),
+        ('role', 'User Role'),
+    )
+    date = models.DateField(verbose_name="Date")
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES, verbose_name="Dimension")
+    key = models.CharField(max_length=255, verbose_name="Key", help_text="Book id, genre or role")
+    label = models.CharField(max_length=255, blank=True, verbose_name="Label")
+    borrows = models.PositiveIntegerField(default=0, verbose_name="Borrows")
+    returns = models.PositiveIntegerField(default=0, verbose_name="Returns")
+    reservations = models.PositiveIntegerField(default=0, verbose_name="Reservations")
+    holds_filled = models.PositiveIntegerField(default=0, verbose_name="Holds Picked Up")
+    hold_wait_seconds = models.BigIntegerField(default=0, verbose_name="Total Hold Wait (s)")
+
+    class Meta:
+        verbose_name = "Daily circulation statistic"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'dimension', 'key'], name='unique_daily_stat'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'date'], name='daily_stat_dimension_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.dimension}: {self.label or self.key}"
+
+    @property
+    def average_hold_wait(self):
+        if not self.holds_filled:
+            return None
+        return timedelta(seconds=self.hold_wait_seconds / self.holds_filled)
+
+# Background job queue (claimed and run by library/jobs.py workers)
+class Job(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=50, verbose_name="Kind")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Payload")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    priority = models.SmallIntegerField(default=0, verbose_name="Priority", help_text="Higher runs first")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Run At")
+    dedupe_key = models.CharField(
+        max_length=100, null=True, blank=True, verbose_name="Dedupe Key",
+        help_text="At most one queued or running job may hold this key"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name="Max Attempts")
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Lease Expires At")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Last Heartbeat")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Started At")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+    last_error = models.TextField(blank=True, verbose_name="Last Error")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_claim_idx'),
+            # Also serves the last finished job per kind for /metrics.
+            models.Index(fields=['kind', 'status', 'finished_at'], name='job_kind_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_job_dedupe_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class LeaderLease(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="Name")
+    holder = models.CharField(max_length=100, verbose_name="Holder")
+    token = models.PositiveBigIntegerField(
+        default=1, verbose_name="Fencing Token", help_text="Incremented every time leadership changes hands"
+    )
+    expires_at = models.DateTimeField(verbose_name="Expires At")
+    acquired_at = models.DateTimeField(verbose_name="Acquired At")
+    renewed_at = models.DateTimeField(verbose_name="Renewed At")
+
+    def __str__(self):
+        return f"{self.name}: {self.holder} (token {self.token})"
+
+
+class ChangeSequence(models.Model):
+    """Counter handing out change feed sequence numbers, see library/changes.py."""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Name")
+    value = models.PositiveBigIntegerField(default=0, verbose_name="Last Value")
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ChangeRecord(models.Model):
+    ACTION_CHOICES = (
+        ('upsert', 'Created or Updated'),
+        ('delete', 'Deleted'),
+    )
+    # Assigned right after the writing transaction commits (see library/changes.py)
+    seq = models.PositiveBigIntegerField(unique=True, null=True, blank=True, verbose_name="Sequence")
+    model = models.CharField(max_length=20, verbose_name="Model")
+    object_id = models.PositiveBigIntegerField(verbose_name="Object ID")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="Action")
+    user_id = models.PositiveBigIntegerField(
+        null=True, blank=True, verbose_name="Owner",
+        help_text="Reader the record belongs to; only they and staff see it in the feed"
+    )
+    data = models.JSONField(encoder=DjangoJSONEncoder, default=dict, blank=True, verbose_name="Data")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Created At")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'seq'], name='change_object_idx'),
+            models.Index(fields=['created_at'], name='change_created_at_idx'),
+            models.Index(fields=['id'], condition=models.Q(seq__isnull=True), name='change_unsequenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.model} {self.object_id}"
+
+# Append-only copy event log (see library/copy_events.py)
+class CopyEvent(models.Model):
+    KIND_CHOICES = (
+        ('checkout', 'Checked Out'),
+        ('checkin', 'Checked In'),
+        ('condition', 'Condition Changed'),
+        ('relocation', 'Relocated'),
+        ('transfer', 'Transferred'),
+    )
+    copy = models.ForeignKey(BookCopy, on_delete=models.CASCADE, related_name='events', verbose_name="Copy")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Event")
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="Timestamp")
+    user_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Reader")
+    borrowing_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Borrowing")
+    old_value = models.CharField(max_length=50, blank=True, verbose_name="Old Value")
+    new_value = models.CharField(max_length=50, blank=True, verbose_name="New Value")
+    worsened = models.BooleanField(default=False, verbose_name="Condition Worsened")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['copy', 'timestamp'], name='copyevent_copy_time_idx'),
+            models.Index(fields=['timestamp'], condition=models.Q(worsened=True), name='copyevent_worsened_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.copy_id} at {self.timestamp:%Y-%m-%d %H:%M}"
+
+
+# Outgoing e-mail, collected into one digest per reader (see library/notifications.py)
+class NotificationDigest(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Recipient")
+    subject = models.CharField(max_length=200, verbose_name="Subject")
+    message = models.TextField(verbose_name="Message")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    last_error = models.TextField(blank=True, verbose_name="Last Error")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Created At")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Sent At")
+    # While 'sending': when the claim of the run sending it runs out
+    claimed_until = models.DateTimeField(null=True, blank=True, verbose_name="Claimed Until")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='digest_status_idx'),
+            models.Index(fields=['user', 'created_at'], name='digest_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.user_id} ({self.status})"
+
+
+class Notification(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', verbose_name="Recipient")
+    # No database constraint: archiving moves reservations out with a raw
+    # DELETE (library/history.py), and the notification keeps the old id.
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False,
+        verbose_name="Reservation"
+    )
+    subject = models.CharField(max_length=200, verbose_name="Subject")
+    message = models.TextField(verbose_name="Message")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    digest = models.ForeignKey(
+        NotificationDigest, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications',
+        verbose_name="Digest"
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Created At")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Sent At")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created_at'], condition=models.Q(digest__isnull=True), name='notification_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.user_id} ({self.status})"
+
+
+# Moving copies between branches (see library/transfers.py)
+class TransferRequest(models.Model):
+    STATUS_CHOICES = (
+        ('requested', 'Requested'),
+        ('in_transit', 'In Transit'),
+        ('received', 'Received'),
+        ('canceled', 'Canceled'),
+    )
+    OPEN_STATUSES = ('requested', 'in_transit')
+    copy = models.ForeignKey(BookCopy, on_delete=models.CASCADE, related_name='transfers', verbose_name="Copy")
+    from_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='+', verbose_name="From")
+    to_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='+', verbose_name="To")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='requested', verbose_name="Status")
+    # Without a database constraint, like Notification.reservation (see library/history.py).
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False,
+        verbose_name="For Reservation", help_text="The hold at the receiving branch this copy is meant for, if any"
+    )
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Requested By"
+    )
+    requested_at = models.DateTimeField(default=timezone.now, verbose_name="Requested At")
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name="Dispatched At")
+    received_at = models.DateTimeField(null=True, blank=True, verbose_name="Received At")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_branch', 'status'], name='transfer_from_status_idx'),
+            models.Index(fields=['to_branch', 'status'], name='transfer_to_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['copy'], condition=models.Q(status__in=['requested', 'in_transit']),
+                name='unique_open_transfer_per_copy',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.copy_id}: {self.from_branch_id} -> {self.to_branch_id} ({self.status})"
+
+
+# Stock-take sessions (see library/stocktake.py)
+class StockTake(models.Model):
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('applied', 'Applied'),
+    )
+    name = models.CharField(max_length=255, verbose_name="Name")
+    branch = models.ForeignKey(
+        Branch, on_delete=models.PROTECT, null=True, blank=True, related_name='+', verbose_name="Branch",
+        help_text="Branch whose shelves are counted; leave blank to count every branch"
+    )
+    location_prefix = models.CharField(
+        max_length=50, blank=True, verbose_name="Location Prefix",
+        help_text="Only copies whose location starts with this are expected on the shelves "
+                  "(e.g. L1- for one room); leave blank for the whole collection"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', verbose_name="Status")
+    started_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Started By"
+    )
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Started At")
+    applied_at = models.DateTimeField(null=True, blank=True, verbose_name="Applied At")
+    summary = models.JSONField(default=dict, blank=True, verbose_name="Summary")
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class StockTakeScan(models.Model):
+    stock_take = models.ForeignKey(StockTake, on_delete=models.CASCADE, related_name='scans', verbose_name="Stock-take")
+    barcode = models.CharField(max_length=32, verbose_name="Barcode")
+    location = models.CharField(max_length=50, verbose_name="Found At")
+    condition = models.CharField(max_length=50, blank=True, verbose_name="Condition")
+    scanned_at = models.DateTimeField(default=timezone.now, verbose_name="Scanned At")
+
+    class Meta:
+        constraints = [
+            # Scanning a copy again replaces the earlier scan.
+            models.UniqueConstraint(fields=['stock_take', 'barcode'], name='unique_stocktake_scan'),
+        ]
+
+    def __str__(self):
+        return f"{self.barcode} at {self.location}"
+
+
+# Archived circulation (see library/history.py). Rows keep their original
+# ids; the foreign keys have no database constraint so that archived rows
+# never block deleting a copy or a user.
+class ReservationHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name="User"
+    )
+    book = models.ForeignKey(
+        Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name="Book"
+    )
+    copy = models.ForeignKey(
+        BookCopy, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='+', verbose_name="Copy"
+    )
+    branch = models.ForeignKey(
+        Branch, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='+', verbose_name="Pickup Branch"
+    )
+    reservation_date = models.DateTimeField(verbose_name="Reservation Date")
+    expiration_date = models.DateTimeField(verbose_name="Expiration Date")
+    status = models.CharField(max_length=10, choices=Reservation.STATUS_CHOICES, verbose_name="Status")
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name="Archived At")
+
+    class Meta:
+        verbose_name_plural = "reservation history"
+        indexes = [
+            models.Index(fields=['user', 'reservation_date'], name='reservationhist_user_idx'),
+            models.Index(fields=['reservation_date'], name='reservationhist_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reservation {self.id} ({self.status})"
+
+
+class BorrowingHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID")
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name="User"
+    )
+    copy = models.ForeignKey(
+        BookCopy, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name="Copy"
+    )
+    borrow_date = models.DateTimeField(verbose_name="Borrow Date")
+    due_date = models.DateTimeField(verbose_name="Due Date")
+    return_date = models.DateTimeField(verbose_name="Return Date")
+    renewal_count = models.IntegerField(default=0, verbose_name="Renewal Count")
+    # A borrowing is archived together with its reservation, so this always
+    # points into ReservationHistory.
+    reservation = models.OneToOneField(
+        ReservationHistory, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='borrowing', verbose_name="Related Reservation"
+    )
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name="Archived At")
+
+    class Meta:
+        verbose_name_plural = "borrowing history"
+        indexes = [
+            models.Index(fields=['user', 'borrow_date'], name='borrowinghist_user_idx'),
+            models.Index(fields=['borrow_date'], name='borrowinghist_borrow_date_idx'),
+            models.Index(fields=['return_date'], name='borrowinghist_return_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Borrowing {self.id} (returned {self.return_date:%Y-%m-%d})"
+
 # Signals
 @receiver(pre_save, sender=Reservation)
 def capture_old_status(sender, instance, **kwargs):
@@ -204,25 +820,21 @@ def capture_old_status(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Reservation)
 def handle_picked_up(sender, instance, **kwargs):
+    # _old_status is only a hint: a concurrent save may have read the same
+    # old status, so the borrowing itself is get-or-create.
     if (instance.status == 'picked_up' and 
         instance.copy and 
         getattr(instance, '_old_status', None) != 'picked_up'):
-        Borrowing.objects.create(
-            user=instance.user,
-            copy=instance.copy,
-            borrow_date=timezone.now(),
-            due_date=timezone.now() + timezone.timedelta(days=14),
-            renewal_count=0,
-            reservation=instance
-        )
-        instance.copy.status = 'borrowed'
-        instance.copy.save()
-        print(f"Created borrowing for reservation {instance.id}, set copy {instance.copy.id} to borrowed")
+        borrowing, created = instance.open_borrowing()
+        if created:
+            print(f"Created borrowing for reservation {instance.id}, set copy {instance.copy.id} to borrowed")
 
 @receiver(post_save, sender=Reservation)
 def try_assign_copy(sender, instance, created, **kwargs):
     if kwargs.get('raw', False):  # Skip during migrations/fixtures
         return
+    if getattr(instance, '_defer_processing', False):  # Assigned later by the process_reservation job
+        return
     print(f"try_assign_copy: Running for reservation {instance.id}, created={created}, status={instance.status}")
     if instance.status == 'pending':  # Run whenever status is 'pending'
         assigned = instance.assign_available_copy()
@@ -0,0 +1,231 @@
+# File: library/notifications.py
+"""
+Reservation e-mail, sent as digests.
+
+Status changes do not send mail themselves: ``queue_reservation`` and
+``queue_reservations`` store a Notification row per event. ``send_digests``
+(the send_notifications job, queued every minute) collects a reader's
+queued notifications once the oldest has waited
+LIBRARY_NOTIFICATION_DIGEST_SECONDS, renders them into one
+NotificationDigest and sends all digests of the run over a single SMTP
+connection. A reservation that changed several times within the window
+(pending -> assigned in one save cascade) is only reported in its latest
+state.
+
+A reader gets at most LIBRARY_NOTIFICATION_HOURLY_LIMIT digests an hour;
+further notifications wait and go out together in the next digest.
+Delivery state is kept on both the digest and its notifications; digests
+that failed are retried on later runs up to ``MAX_ATTEMPTS`` times.
+
+Runs can overlap (a slow SMTP server, a job taken over by another worker),
+so a run claims the digests it sends: they move to 'sending' with a claim
+that lasts LIBRARY_NOTIFICATION_CLAIM_SECONDS, the same way workers lease
+jobs (library/jobs.py). Other runs skip claimed digests until the claim
+runs out, so a reader does not get the same digest twice.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .jobs import check_lease
+from .models import Borrowing, Notification, NotificationDigest
+
+FROM_EMAIL = 'from@example.com'
+MAX_ATTEMPTS = 3
+
+
+def reservation_event(reservation, created=False, borrowing=None):
+    """Return ``(subject, text)`` for the reservation's current status, or None."""
+    if created and reservation.status == 'pending':
+        return 'Reservation Confirmation', (
+            f'Your reservation for "{reservation.book.title}" has been received and is pending.\n'
+            f'We will notify you when a copy is available for pickup.'
+        )
+
+    elif reservation.status == 'assigned':
+        return 'Book Assigned - Ready for Pickup', (
+            f'A copy of "{reservation.book.title}" has been assigned to your reservation.\n'
+            f'Please pick it up by {reservation.expiration_date.strftime("%Y-%m-%d")}.'
+        )
+
+    elif reservation.status == 'picked_up':
+        if borrowing:
+            return 'Book Pickup Confirmation', (
+                f'You have successfully picked up "{reservation.book.title}".\n'
+                f'Please return it by {borrowing.due_date.strftime("%Y-%m-%d")}.'
+            )
+
+    elif reservation.status == 'expired':
+        return 'Reservation Expired', (
+            f'Your reservation for "{reservation.book.title}" has been expired as of '
+            f'{reservation.expiration_date.strftime("%Y-%m-%d")}.\n'
+            f'Please place a new reservation if you still need the book.'
+        )
+
+    return None
+
+
+def _notification(reservation, created=False, borrowing=None):
+    content = reservation_event(reservation, created=created, borrowing=borrowing)
+    if content:
+        return Notification(
+            user_id=reservation.user_id, reservation_id=reservation.pk, subject=content[0], message=content[1],
+        )
+    return None
+
+
+def queue_reservation(reservation, created=False, borrowing=None):
+    notification = _notification(reservation, created=created, borrowing=borrowing)
+    if notification:
+        notification.save()
+    return notification
+
+
+def queue_reservations(reservations):
+    """Queue the status e-mail for many reservations with one INSERT."""
+    reservations = list(reservations)
+    picked_up = [reservation.pk for reservation in reservations if reservation.status == 'picked_up']
+    borrowings = {
+        borrowing.reservation_id: borrowing
+        for borrowing in Borrowing.objects.filter(reservation__in=picked_up)
+    } if picked_up else {}
+    notifications = [_notification(reservation, borrowing=borrowings.get(reservation.pk)) for reservation in reservations]
+    return Notification.objects.bulk_create([notification for notification in notifications if notification])
+
+
+def render_digest(user, notifications):
+    """``(subject, message)`` of one e-mail covering ``notifications``, oldest first."""
+    latest = {}
+    for notification in notifications:
+        # A later state of a reservation replaces the earlier one and moves to its place in time.
+        key = notification.reservation_id or -notification.pk
+        latest.pop(key, None)
+        latest[key] = notification
+    items = list(latest.values())
+    if len(items) == 1:
+        subject = items[0].subject
+        body = items[0].message
+    else:
+        subject = f'{len(items)} updates on your reservations'
+        body = '\n\n'.join(f'{item.subject}\n{item.message}' for item in items)
+    return subject, f'Dear {user.username},\n\n{body}\n\nThank you!'
+
+
+def collect(now=None, window=None, batch_size=500):
+    """
+    Turn the queued notifications of up to ``batch_size`` readers whose
+    window (in seconds) has passed into digests. Returns the new digests.
+    """
+    now = now or timezone.now()
+    if window is None:
+        window = getattr(settings, 'LIBRARY_NOTIFICATION_DIGEST_SECONDS', 120)
+    limit = getattr(settings, 'LIBRARY_NOTIFICATION_HOURLY_LIMIT', 4)
+    with transaction.atomic():
+        pending = Notification.objects.filter(digest__isnull=True, status='queued')
+        throttled = (
+            NotificationDigest.objects.filter(created_at__gt=now - timedelta(hours=1))
+            .values('user_id').annotate(count=Count('id')).filter(count__gte=limit).values('user_id')
+        )
+        user_ids = list(
+            pending.exclude(user_id__in=throttled)
+            .values('user_id').annotate(first=Min('created_at')).filter(first__lte=now - timedelta(seconds=window))
+            .order_by('first').values_list('user_id', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return []
+        by_user = {}
+        for notification in (
+            pending.select_for_update().select_related('user').filter(user_id__in=user_ids).order_by('created_at', 'pk')
+        ):
+            by_user.setdefault(notification.user_id, []).append(notification)
+        digests = []
+        for items in by_user.values():
+            subject, message = render_digest(items[0].user, items)
+            digests.append(NotificationDigest(user=items[0].user, subject=subject, message=message, created_at=now))
+        NotificationDigest.objects.bulk_create(digests)
+        notifications = []
+        for digest, items in zip(digests, by_user.values()):
+            for notification in items:
+                notification.digest = digest
+                notifications.append(notification)
+        Notification.objects.bulk_update(notifications, ['digest'], batch_size=1000)
+    return digests
+
+
+def _claimable(now):
+    # Digests waiting to be sent, plus claimed ones whose run stopped before recording the outcome.
+    return (
+        Q(status__in=['queued', 'failed'], attempts__lt=MAX_ATTEMPTS)
+        | Q(status='sending', claimed_until__lt=now)
+    )
+
+
+def claim(batch_size=500, now=None):
+    """Claim up to ``batch_size`` digests that are due, oldest first, and return them."""
+    now = now or timezone.now()
+    queryset = NotificationDigest.objects.filter(_claimable(now)).order_by('created_at', 'pk')
+    claim_seconds = getattr(settings, 'LIBRARY_NOTIFICATION_CLAIM_SECONDS', 600)
+    lease = dict(status='sending', claimed_until=now + timedelta(seconds=claim_seconds))
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(queryset.select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+            NotificationDigest.objects.filter(pk__in=pks).update(**lease)
+    else:
+        # Compare-and-swap per digest: when two runs race, only one matches the row.
+        pks = [
+            pk for pk in list(queryset.values_list('pk', flat=True)[:batch_size])
+            if NotificationDigest.objects.filter(_claimable(now), pk=pk).update(**lease)
+        ]
+    return list(NotificationDigest.objects.select_related('user').filter(pk__in=pks).order_by('created_at', 'pk'))
+
+
+def deliver(digests):
+    """
+    Send the claimed ``digests`` over one SMTP connection and record the
+    outcome. Returns ``(sent, failed)`` digest counts. A connection that
+    cannot be opened raises; the digests are sent by a later run once their
+    claim runs out.
+    """
+    if not digests:
+        return 0, 0
+    connection = get_connection(fail_silently=False)
+    connection.open()
+    sent, failed = [], {}
+    try:
+        for digest in digests:
+            message = EmailMessage(
+                digest.subject, digest.message, FROM_EMAIL, [digest.user.email], connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                failed[digest.pk] = str(exc) or exc.__class__.__name__
+            else:
+                sent.append(digest.pk)
+    finally:
+        connection.close()
+
+    now = timezone.now()
+    with transaction.atomic():
+        NotificationDigest.objects.filter(pk__in=sent).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error='', claimed_until=None,
+        )
+        Notification.objects.filter(digest__in=sent).update(status='sent', sent_at=now)
+        for pk, error in failed.items():
+            NotificationDigest.objects.filter(pk=pk).update(
+                status='failed', attempts=F('attempts') + 1, last_error=error[-5000:], claimed_until=None,
+            )
+        Notification.objects.filter(digest__in=failed).update(status='failed')
+    return len(sent), len(failed)
+
+
+def send_digests(now=None, window=None, batch_size=500):
+    """Collect due notifications into digests and send them with the earlier failures. Returns ``(sent, failed)``."""
+    collect(now, window, batch_size=batch_size)
+    check_lease()
+    return deliver(claim(batch_size))
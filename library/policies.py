@@ -0,0 +1,92 @@
+# File: library/policies.py
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from django.apps import apps
+from django.conf import settings
+
+POLICY_FIELDS = ('loan_days', 'max_renewals', 'hold_days', 'max_loans', 'max_holds')
+
+
+def genre_key(genre):
+    """Genres match case-insensitively; rules are stored and looked up in this form."""
+    return (genre or '').strip().lower()
+
+
+@dataclass(frozen=True)
+class Policy:
+    loan_days: int = 14
+    max_renewals: int = 2
+    hold_days: int = 7
+    max_loans: int = 5
+    max_holds: int = 5
+
+
+class PolicyCache:
+    """
+    In-process copy of the CirculationPolicy table.
+
+    The table is read once and every resolved (role, genre, book) combination
+    is memoised, so evaluating a policy is a dict lookup. Saving or deleting a
+    policy clears the cache of the current process; other processes pick the
+    change up after LIBRARY_POLICY_CACHE_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = None
+        self._resolved = {}
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._rules = None
+            self._resolved = {}
+
+    def _load(self):
+        CirculationPolicy = apps.get_model('library', 'CirculationPolicy')
+        rules = {}
+        for row in CirculationPolicy.objects.values('role', 'genre', 'book_id', *POLICY_FIELDS):
+            overrides = {field: row[field] for field in POLICY_FIELDS if row[field] is not None}
+            rules[(row['role'] or '', genre_key(row['genre']), row['book_id'])] = overrides
+        self._rules = rules
+        self._resolved = {}
+        self._loaded_at = time.monotonic()
+
+    def get(self, role='', genre='', book_id=None):
+        key = (role or '', genre_key(genre), book_id)
+        ttl = getattr(settings, 'LIBRARY_POLICY_CACHE_SECONDS', 60)
+        with self._lock:
+            if self._rules is None or time.monotonic() - self._loaded_at > ttl:
+                self._load()
+            policy = self._resolved.get(key)
+            if policy is None:
+                policy = self._resolve(*key)
+                self._resolved[key] = policy
+        return policy
+
+    def _resolve(self, role, genre, book_id):
+        policy = Policy(**getattr(settings, 'LIBRARY_DEFAULT_POLICY', {}))
+        # Least to most specific; later rules override the fields they set.
+        # Book rules carry no genre (CirculationPolicy.clean), the book already has one.
+        candidates = [('', '', None), (role, '', None), ('', genre, None), (role, genre, None)]
+        if book_id is not None:
+            candidates += [('', '', book_id), (role, '', book_id)]
+        for candidate in candidates:
+            overrides = self._rules.get(candidate)
+            if overrides:
+                policy = replace(policy, **overrides)
+        return policy
+
+
+policy_cache = PolicyCache()
+
+
+def get_policy(user=None, book=None):
+    """Policy for ``user`` borrowing or reserving ``book``. Either may be None."""
+    return policy_cache.get(
+        role=getattr(user, 'role', ''),
+        genre=getattr(book, 'genre', ''),
+        book_id=getattr(book, 'pk', None),
+    )
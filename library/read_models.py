@@ -0,0 +1,97 @@
+# File: library/read_models.py
+"""
+Compact, read-only rows for lists.
+
+Model instances carry their full field set, state object and related-object
+caches, and ``__str__`` on Reservation, Borrowing and BookCopy walks foreign
+keys one query at a time. The helpers below read just the columns a list
+needs, with the joins resolved in the same query, into tuples.
+
+The admin changelists keep model instances: actions, change links and the
+ModelAdmin display machinery need them, and ``list_select_related`` already
+resolves their joins in the page query.
+"""
+from datetime import datetime
+from typing import NamedTuple
+
+from django.utils import timezone
+
+from .models import BookCopy, Borrowing, Reservation
+
+CHUNK_SIZE = 2000
+
+
+class CopyRow(NamedTuple):
+    id: int
+    book_id: int
+    title: str
+    barcode: str
+    condition: str
+    location: str
+    status: str
+
+    def __str__(self):
+        return f"{self.title} - {self.location}"
+
+
+class ReservationRow(NamedTuple):
+    id: int
+    username: str
+    book_id: int
+    title: str
+    copy_id: int
+    copy_location: str
+    reservation_date: datetime
+    expiration_date: datetime
+    status: str
+
+    def __str__(self):
+        return f"{self.username} - {self.title} ({self.status})"
+
+
+class BorrowingRow(NamedTuple):
+    id: int
+    username: str
+    copy_id: int
+    title: str
+    copy_location: str
+    borrow_date: datetime
+    due_date: datetime
+    return_date: datetime
+    renewal_count: int
+
+    def __str__(self):
+        return f"{self.username} - {self.title} - {self.copy_location}"
+
+    @property
+    def is_overdue(self):
+        return self.return_date is None and self.due_date < timezone.now()
+
+
+COPY_COLUMNS = ('id', 'book_id', 'book__title', 'barcode', 'condition', 'location', 'status')
+RESERVATION_COLUMNS = (
+    'id', 'user__username', 'book_id', 'book__title', 'copy_id', 'copy__location',
+    'reservation_date', 'expiration_date', 'status',
+)
+BORROWING_COLUMNS = (
+    'id', 'user__username', 'copy_id', 'copy__book__title', 'copy__location',
+    'borrow_date', 'due_date', 'return_date', 'renewal_count',
+)
+
+
+def _rows(queryset, columns, row_class):
+    for values in queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        yield row_class._make(values)
+
+
+def copy_rows(queryset=None):
+    return _rows(BookCopy.objects.all() if queryset is None else queryset, COPY_COLUMNS, CopyRow)
+
+
+def reservation_rows(queryset=None):
+    return _rows(Reservation.objects.all() if queryset is None else queryset, RESERVATION_COLUMNS, ReservationRow)
+
+
+def borrowing_rows(queryset=None):
+    return _rows(Borrowing.objects.all() if queryset is None else queryset, BORROWING_COLUMNS, BorrowingRow)
+
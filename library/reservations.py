@@ -0,0 +1,80 @@
+# File: library/reservations.py
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Reservation, User, default_branch_id
+from .jobs import enqueue
+from .policies import get_policy
+
+
+def place_reservation(user, book, client_token=None, branch=None):
+    """
+    Create a pending reservation for ``user`` on ``book``.
+
+    The copy is picked up at ``branch``, by default the reader's home branch
+    or the default branch. Returns ``(reservation, created)``. Replaying the same ``client_token``
+    returns the reservation created by the first call instead of a new one.
+    Assignment of a copy and the e-mail notification are not done here; they
+    are queued as a ``process_reservation`` job in the same transaction.
+    """
+    existing = _replayed(user, client_token)
+    if existing:
+        return existing, False
+
+    policy = get_policy(user, book)
+    branch_id = getattr(branch, 'pk', branch) or user.home_branch_id or default_branch_id()
+    conflict = None
+    with transaction.atomic():
+        # Lock the reader's row so that concurrent requests for different
+        # books count and insert one after another; the unique constraint
+        # only covers the same book.
+        User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True).get()
+        existing = _replayed(user, client_token)  # A concurrent replay may have committed while we waited
+        if existing:
+            return existing, False
+        active = Reservation.objects.filter(user=user, status__in=Reservation.ACTIVE_STATUSES)
+        if active.filter(book=book).exists():
+            raise ValidationError(f'You already have an active reservation for "{book.title}".')
+        limit = policy.max_holds
+        if active.count() >= limit:
+            raise ValidationError(f"Maximum number of active reservations ({limit}) reached.")
+
+        reservation = Reservation(
+            user=user,
+            book=book,
+            status='pending',
+            expiration_date=timezone.now() + timedelta(days=policy.hold_days),
+            client_token=client_token or None,
+            branch_id=branch_id,
+        )
+        reservation._defer_processing = True
+        try:
+            with transaction.atomic():
+                reservation.save()
+        except IntegrityError as e:
+            conflict = e
+        else:
+            enqueue('process_reservation', {'reservation': reservation.pk})
+    if conflict is not None:
+        # Lost a race: either the same token was replayed concurrently or the
+        # user already got an active hold for this book in the meantime.
+        existing = _replayed(user, client_token)
+        if existing:
+            return existing, False
+        if Reservation.objects.filter(user=user, book=book, status__in=Reservation.ACTIVE_STATUSES).exists():
+            raise ValidationError(f'You already have an active reservation for "{book.title}".')
+        raise conflict
+    return reservation, True
+
+
+def _replayed(user, client_token):
+    """The reservation an earlier request with ``client_token`` created, if any."""
+    if not client_token:
+        return None
+    existing = Reservation.objects.filter(client_token=client_token).first()
+    if existing and existing.user_id != user.pk:
+        raise ValidationError("This client token was already used by another user.")
+    return existing
@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save, post_delete
+from django.apps import apps as global_apps
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from .models import Reservation, BookCopy, Borrowing
+from .models import (
+    Reservation, Book, BookCopy, Borrowing, Branch, CirculationPolicy, default_branch_id, reset_default_branch,
+)
+from .notifications import queue_reservation
+from .policies import policy_cache
+from . import changes, copy_events, waitlist
+from .matching import match_books
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -12,21 +18,11 @@ def check_pending_reservations(sender, instance, **kwargs):
         return
     print(f"Signal triggered for copy {instance.id}, status: {instance.status}, created: {kwargs.get('created', False)}")
     if instance.status == 'available':
-        pending_reservations = Reservation.objects.filter(
-            book=instance.book, status='pending'
-        ).order_by('reservation_date')
-        print(f"Found {pending_reservations.count()} pending reservations for book {instance.book.title}")
-        if pending_reservations.exists():
-            reservation = pending_reservations.first()
-            print(f"Assigning copy {instance.id} to reservation {reservation.id} for user {reservation.user.username}")
-            reservation.copy = instance
-            reservation.status = 'assigned'
-            reservation.save(update_fields=['copy', 'status'])
-            instance.status = 'reserved'
-            instance.save(update_fields=['status'])
-            print(f"Successfully assigned copy {instance.id} to reservation {reservation.id}")
-        else:
-            print(f"No pending reservations found for book {instance.book.title}")
+        # Matches every available copy of the book at this branch, not just this one.
+        for reservation, copy in match_books([instance.book_id], branch=instance.branch_id):
+            print(f"Assigned copy {copy.id} to reservation {reservation.id} for user {reservation.user.username}")
+            if copy.pk == instance.pk:
+                instance.status = copy.status = 'reserved'
     else:
         print(f"Copy {instance.id} status is {instance.status}, not processing")
 
@@ -37,6 +33,8 @@ def check_pending_reservations(sender, instance, **kwargs):
 def try_assign_copy(sender, instance, created, **kwargs):
     if kwargs.get('raw', False):  # Skip during migrations/fixtures
         return
+    if getattr(instance, '_defer_processing', False):
+        return
     if created or instance.status == 'pending':
         instance.assign_available_copy()
 
@@ -45,80 +43,124 @@ def try_assign_copy(sender, instance, created, **kwargs):
 def try_assign_after_return(sender, instance, **kwargs):
     if kwargs.get('raw', False):  # Skip during migrations/fixtures
         return
-    if instance.return_date and instance.copy:  # Only trigger if the book has been returned
+    # Only a copy still marked as lent goes back; saving it as available
+    # hands it to the waiting readers through check_pending_reservations.
+    if instance.return_date and instance.copy and instance.copy.status == 'borrowed':
         print(f"try_assign_after_return: Borrowing {instance.id} returned, copy {instance.copy} set to available")
-        # Ensure the copy is available
         instance.copy.status = 'available'
         instance.copy.save()
-        # Try to assign the copy to a pending reservation
-        pending_reservations = Reservation.objects.filter(status='pending').order_by('reservation_date')
-        for reservation in pending_reservations:
-            print(f"try_assign_after_return: Attempting to assign copy to reservation {reservation.id} for book {reservation.book.title}")
-            if reservation.assign_available_copy():
-                print(f"try_assign_after_return: Assigned copy to reservation {reservation.id}")
-                break  # Assign to the first eligible pending reservation
-
-
-# Optional: Add a signal for when a Borrowing is saved to trigger reassignment
-@receiver(post_save, sender=Borrowing)
-def handle_borrowing_return(sender, instance, **kwargs):
-    if instance.return_date and not kwargs.get('raw', False):  # Only trigger on return
-        print(f"handle_borrowing_return: Borrowing {instance.id} returned, triggering reassignment")
-        pending_reservations = Reservation.objects.filter(status='pending').order_by('reservation_date')
-        for reservation in pending_reservations:
-            if reservation.assign_available_copy():
-                print(f"handle_borrowing_return: Assigned copy to reservation {reservation.id}")
-                break
 
 
+# E-mail goes out as a digest per reader, see library/notifications.py.
 @receiver(post_save, sender=Reservation)
-def send_reservation_email(sender, instance, created, **kwargs):
-    if created and instance.status == 'pending':
-        subject = 'Reservation Confirmation'
-        message = (
-            f'Dear {instance.user.username},\n\n'
-            f'Your reservation for "{instance.book.title}" has been received and is pending.\n'
-            f'We will notify you when a copy is available for pickup.\n\n'
-            f'Thank you!'
-        )
-        send_mail(subject, message, 'from@example.com', [instance.user.email], fail_silently=True)
-
-    elif instance.status == 'assigned':
-        subject = 'Book Assigned - Ready for Pickup'
-        message = (
-            f'Dear {instance.user.username},\n\n'
-            f'A copy of "{instance.book.title}" has been assigned to your reservation.\n'
-            f'Please pick it up by {instance.expiration_date.strftime("%Y-%m-%d")}.\n'
-            f'Thank you!'
-        )
-        send_mail(subject, message, 'from@example.com', [instance.user.email], fail_silently=True)
-
-    elif instance.status == 'picked_up':
+def queue_reservation_email(sender, instance, created, **kwargs):
+    if getattr(instance, '_defer_processing', False):
+        return
+    borrowing = None
+    if instance.status == 'picked_up':
         borrowing = Borrowing.objects.filter(reservation=instance).first()
-        if borrowing:
-            due_date = borrowing.due_date.strftime('%Y-%m-%d')
-            subject = 'Book Pickup Confirmation'
-            message = (
-                f'Dear {instance.user.username},\n\n'
-                f'You have successfully picked up "{instance.book.title}".\n'
-                f'Please return it by {due_date}.\n\n'
-                f'Thank you!'
-            )
-            send_mail(subject, message, 'from@example.com', [instance.user.email], fail_silently=True)
-
-    elif instance.status == 'expired':
-        subject = 'Reservation Expired'
-        message = (
-            f'Dear {instance.user.username},\n\n'
-            f'Your reservation for "{instance.book.title}" has been expired as of '
-            f'{instance.expiration_date.strftime("%Y-%m-%d")}.\n'
-            f'Please place a new reservation if you still need the book.\n\n'
-            f'Thank you!'
-        )
-        send_mail(subject, message, 'from@example.com', [instance.user.email], fail_silently=True)
+    queue_reservation(instance, created=created, borrowing=borrowing)
 
 @receiver(post_delete, sender=User)
 def cancel_user_reservations(sender, instance, **kwargs):
     reservations = Reservation.objects.filter(user=instance)
     for reservation in reservations:
         reservation.cancel()
+
+
+@receiver(post_save, sender=CirculationPolicy)
+@receiver(post_delete, sender=CirculationPolicy)
+def invalidate_policy_cache(sender, **kwargs):
+    policy_cache.invalidate()
+
+
+# default_branch_id() is resolved once per process. A flush (between
+# transactional tests) ends with post_migrate, so recreate the branch there.
+@receiver(post_migrate)
+def resolve_default_branch(sender, apps=global_apps, **kwargs):
+    if sender.label != 'library':
+        return
+    reset_default_branch()
+    try:
+        apps.get_model('library', 'Branch')
+    except LookupError:  # Migrated back to before branches existed
+        return
+    default_branch_id()
+
+
+@receiver(post_delete, sender=Branch)
+def forget_default_branch(sender, **kwargs):
+    reset_default_branch()
+
+
+# Queue positions and availability estimates are cached per book; drop them on
+# every transition. The bulk desk paths call waitlist.invalidate themselves.
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+def invalidate_waitlist(sender, instance, **kwargs):
+    waitlist.invalidate(instance.book_id)
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_waitlist_for_loan(sender, instance, **kwargs):
+    if instance.copy_id:
+        waitlist.invalidate(instance.copy.book_id)
+
+
+# Change feed. Records are written in the transaction of the change itself;
+# the bulk desk paths record what they touched with changes.record_ids.
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookCopy)
+@receiver(post_save, sender=Reservation)
+@receiver(post_save, sender=Borrowing)
+def record_change(sender, instance, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    changes.record([instance])
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookCopy)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_delete, sender=Borrowing)
+def record_deletion(sender, instance, **kwargs):
+    changes.record([instance], action='delete')
+
+
+# Copy event log. The bulk desk and stock-take paths write their events
+# themselves (see library/copy_events.py).
+@receiver(pre_save, sender=BookCopy)
+def capture_copy_state(sender, instance, **kwargs):
+    instance._old_copy_state = (
+        BookCopy.objects.filter(pk=instance.pk).values('condition', 'location').first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=BookCopy)
+def log_copy_change(sender, instance, **kwargs):
+    old = getattr(instance, '_old_copy_state', None)
+    if kwargs.get('raw', False) or old is None:
+        return
+    copy_events.write(copy_events.change_events(
+        instance.pk, old, {'condition': instance.condition, 'location': instance.location}
+    ))
+
+
+@receiver(pre_save, sender=Borrowing)
+def capture_return_date(sender, instance, **kwargs):
+    instance._old_return_date = (
+        Borrowing.objects.filter(pk=instance.pk).values_list('return_date', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Borrowing)
+def log_loan(sender, instance, created, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    if created:
+        copy_events.write(copy_events.loan_events('checkout', [instance]))
+    if instance.return_date and getattr(instance, '_old_return_date', None) is None:
+        copy_events.write(copy_events.loan_events('checkin', [instance]))
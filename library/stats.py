@@ -0,0 +1,96 @@
+# File: library/stats.py
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .history import all_borrowings, all_reservations
+from .models import DailyCirculationStat
+
+COUNTERS = ('borrows', 'returns', 'reservations', 'holds_filled', 'hold_wait_seconds')
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end, time.min), tz),
+    )
+
+
+def _local_date(value):
+    return timezone.localtime(value).date()
+
+
+def _compute(start, end):
+    """
+    Build the rollup rows for the days in ``[start, end)``.
+
+    Each source table is read once with a range filter on an indexed date
+    column, so the cost is proportional to the activity in the window and
+    never to the size of the history. Archived rows count too, so old days
+    can still be recomputed after archival.
+    """
+    start_dt, end_dt = _day_bounds(start, end)
+    buckets = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    labels = {}
+
+    def bump(day, book_id, title, genre, role, counter, amount=1):
+        for dimension, key, label in (
+            ('book', str(book_id), title),
+            ('genre', genre or 'Unknown', genre or 'Unknown'),
+            ('role', role or 'unknown', role or 'unknown'),
+        ):
+            buckets[(day, dimension, key)][counter] += amount
+            labels[(dimension, key)] = label
+
+    for row in all_borrowings(
+        'borrow_date', 'copy__book_id', 'copy__book__title', 'copy__book__genre', 'user__role',
+        'reservation__reservation_date', borrow_date__gte=start_dt, borrow_date__lt=end_dt,
+    ).iterator(chunk_size=2000):
+        day = _local_date(row['borrow_date'])
+        book = (row['copy__book_id'], row['copy__book__title'], row['copy__book__genre'], row['user__role'])
+        bump(day, *book, 'borrows')
+        if row['reservation__reservation_date']:
+            wait = (row['borrow_date'] - row['reservation__reservation_date']).total_seconds()
+            bump(day, *book, 'holds_filled')
+            bump(day, *book, 'hold_wait_seconds', max(int(wait), 0))
+
+    for row in all_borrowings(
+        'return_date', 'copy__book_id', 'copy__book__title', 'copy__book__genre', 'user__role',
+        return_date__gte=start_dt, return_date__lt=end_dt,
+    ).iterator(chunk_size=2000):
+        bump(_local_date(row['return_date']), row['copy__book_id'], row['copy__book__title'],
+             row['copy__book__genre'], row['user__role'], 'returns')
+
+    for row in all_reservations(
+        'reservation_date', 'book_id', 'book__title', 'book__genre', 'user__role',
+        reservation_date__gte=start_dt, reservation_date__lt=end_dt,
+    ).iterator(chunk_size=2000):
+        bump(_local_date(row['reservation_date']), row['book_id'], row['book__title'],
+             row['book__genre'], row['user__role'], 'reservations')
+
+    return [
+        DailyCirculationStat(date=day, dimension=dimension, key=key,
+                             label=(labels[(dimension, key)] or '')[:255], **counters)
+        for (day, dimension, key), counters in buckets.items()
+    ]
+
+
+def rollup_range(start, end):
+    """Recompute the rollups for ``[start, end)``. Safe to run again for the same days."""
+    rows = _compute(start, end)
+    with transaction.atomic():
+        DailyCirculationStat.objects.filter(date__gte=start, date__lt=end).delete()
+        DailyCirculationStat.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def backfill(start, end, chunk_days=30):
+    """Recompute ``[start, end)`` in chunks of ``chunk_days`` days, yielding progress per chunk."""
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        yield chunk_start, chunk_end, rollup_range(chunk_start, chunk_end)
+        chunk_start = chunk_end
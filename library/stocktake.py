@@ -0,0 +1,198 @@
+# File: library/stocktake.py
+"""
+Stock-take: reconcile what is on the shelves with BookCopy.
+
+Scans (barcode, shelf location and optionally condition) are collected into
+a StockTake session, from one file or many; scanning a copy again replaces
+the earlier scan. ``reconcile`` then reads the session's scans and the whole
+collection with one query each and compares them as sets:
+
+* missing: on the open shelves (available) in the session's branch and
+  area, not scanned;
+* misplaced: scanned somewhere other than their recorded location, or at
+  the session's branch while recorded at another one;
+* unexpected: scanned barcodes no copy has;
+* off shelf: scanned although recorded as lent or on the hold shelf;
+* condition: scanned with a condition different from the recorded one.
+
+``apply_corrections`` writes the locations, branches and conditions the
+scans found with bulk updates and, like receiving a transfer, runs matching
+for the copies that moved. Missing and off-shelf copies are only reported:
+they need someone to look.
+"""
+import csv
+import re
+from itertools import islice
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import record_ids
+from .copy_events import change_events, write as write_events
+from .matching import match_books
+from .models import BookCopy, CopyEvent, StockTake, StockTakeScan
+from .waitlist import invalidate as invalidate_waitlist
+
+LOCATION_RE = re.compile(r'^[A-Z0-9]+-[A-Z]-[0-9]{2}$')
+CATEGORIES = ('missing', 'misplaced', 'unexpected', 'off_shelf', 'condition')
+
+
+class Discrepancy(NamedTuple):
+    barcode: str
+    copy_id: int
+    title: str
+    recorded_location: str
+    found_location: str
+    recorded: str  # status or condition, depending on the category
+    found: str
+
+
+def read_scans(text_stream):
+    """
+    Yield ``(line, barcode, location, condition)`` from a scanner export: CSV
+    rows of barcode, location and an optional condition, with or without a
+    ``barcode,location,...`` header.
+    """
+    for line, row in enumerate(csv.reader(text_stream), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if line == 1 and row[0].strip().lower() == 'barcode':
+            continue
+        barcode = row[0].strip()
+        location = row[1].strip().upper() if len(row) > 1 else ''
+        condition = row[2].strip().lower() if len(row) > 2 else ''
+        yield line, barcode, location, condition
+
+
+def add_scans(stock_take, scans, batch_size=5000):
+    """
+    Store ``scans`` as produced by ``read_scans`` in the session, one bulk
+    upsert per batch. Returns ``(stored, errors)`` with ``(line, message)``
+    errors for rows that were skipped.
+    """
+    if stock_take.status != 'open':
+        raise ValidationError(f"Stock-take {stock_take} has already been applied.")
+    stored, errors = 0, []
+    scans = iter(scans)
+    while batch := list(islice(scans, batch_size)):
+        rows = {}
+        now = timezone.now()
+        for line, barcode, location, condition in batch:
+            if not barcode:
+                errors.append((line, "Missing barcode"))
+            elif not LOCATION_RE.match(location):
+                errors.append((line, f"Invalid location {location!r}"))
+            else:
+                # Within a batch the later scan of a copy wins, as across batches.
+                rows[barcode] = StockTakeScan(
+                    stock_take=stock_take, barcode=barcode, location=location, condition=condition, scanned_at=now,
+                )
+        StockTakeScan.objects.bulk_create(
+            rows.values(), update_conflicts=True, unique_fields=['stock_take', 'barcode'],
+            update_fields=['location', 'condition', 'scanned_at'],
+        )
+        stored += len(rows)
+    return stored, errors
+
+
+def reconcile(stock_take):
+    """Compare the session's scans with the collection. Returns ``{category: [Discrepancy, ...]}``."""
+    scans = {
+        barcode: (location, condition)
+        for barcode, location, condition in stock_take.scans.values_list('barcode', 'location', 'condition')
+    }
+    copies = {
+        row[1]: row
+        for row in BookCopy.objects.filter(barcode__isnull=False)
+        .values_list('id', 'barcode', 'book__title', 'location', 'condition', 'status', 'branch_id')
+        .iterator(chunk_size=5000)
+    }
+    prefix, branch_id = stock_take.location_prefix, stock_take.branch_id
+    expected = {
+        barcode for barcode, (_, _, _, location, _, status, copy_branch) in copies.items()
+        if status == 'available' and location.startswith(prefix) and branch_id in (None, copy_branch)
+    }
+    scanned = set(scans)
+    found = scanned & copies.keys()
+    off_shelf = {barcode for barcode in found if copies[barcode][5] != 'available'}
+    on_shelf = found - off_shelf
+
+    def moved(barcode):
+        _, _, _, location, _, _, copy_branch = copies[barcode]
+        return scans[barcode][0] != location or branch_id not in (None, copy_branch)
+
+    def discrepancy(barcode, recorded='', found_value=''):
+        copy_id, _, title, location, _, _, _ = copies.get(barcode, (None, barcode, '', '', '', '', None))
+        found_location = scans[barcode][0] if barcode in scans else ''
+        return Discrepancy(barcode, copy_id, title, location, found_location, recorded, found_value)
+
+    report = {
+        'missing': [discrepancy(barcode, 'available') for barcode in expected - scanned],
+        'misplaced': [discrepancy(barcode) for barcode in on_shelf if moved(barcode)],
+        'unexpected': [discrepancy(barcode) for barcode in scanned - copies.keys()],
+        'off_shelf': [discrepancy(barcode, copies[barcode][5], 'on shelf') for barcode in off_shelf],
+        'condition': [
+            discrepancy(barcode, copies[barcode][4], scans[barcode][1])
+            for barcode in found if scans[barcode][1] and scans[barcode][1] != copies[barcode][4]
+        ],
+    }
+    for rows in report.values():
+        rows.sort(key=lambda row: (row.recorded_location, row.barcode))
+    return report
+
+
+def apply_corrections(stock_take, batch_size=1000):
+    """
+    Write the scanned locations and conditions back to the copies and close
+    the session. Copies found at another branch or location are offered to
+    the pending reservations there. Returns the report the corrections were
+    based on.
+    """
+    with transaction.atomic():
+        stock_take = StockTake.objects.select_for_update().select_related('branch').get(pk=stock_take.pk)
+        if stock_take.status != 'open':
+            raise ValidationError(f"Stock-take {stock_take} has already been applied.")
+        report = reconcile(stock_take)
+        corrections = {}
+        for row in report['misplaced']:
+            corrections.setdefault(row.copy_id, {})['location'] = row.found_location
+        for row in report['condition']:
+            corrections.setdefault(row.copy_id, {})['condition'] = row.found
+        copies = list(
+            BookCopy.objects.filter(pk__in=corrections).select_related('branch').only('book', 'location', 'condition', 'branch')
+        )
+        events = []
+        for copy in copies:
+            old = {'condition': copy.condition, 'location': copy.location}
+            for field, value in corrections[copy.pk].items():
+                setattr(copy, field, value)
+            events += change_events(copy.pk, old, {'condition': copy.condition, 'location': copy.location})
+            if stock_take.branch_id and 'location' in corrections[copy.pk] and copy.branch_id != stock_take.branch_id:
+                events.append(CopyEvent(
+                    copy_id=copy.pk, kind='transfer', old_value=copy.branch.code, new_value=stock_take.branch.code,
+                ))
+                copy.branch_id = stock_take.branch_id
+        BookCopy.objects.bulk_update(copies, ['location', 'condition', 'branch'], batch_size=batch_size)
+        write_events(events)
+        record_ids(BookCopy, [copy.pk for copy in copies])
+        # As in transfers.receive: a moved copy changes its branch's waitlist
+        # and may be the nearest one for a hold waiting there.
+        moved = [copy for copy in copies if 'location' in corrections[copy.pk]]
+        invalidate_waitlist(*(copy.book_id for copy in moved))
+        by_branch = {}
+        for copy in moved:
+            by_branch.setdefault(copy.branch_id, set()).add(copy.book_id)
+        for branch_id, book_ids in by_branch.items():
+            match_books(book_ids, branch=branch_id)
+
+        stock_take.status = 'applied'
+        stock_take.applied_at = timezone.now()
+        stock_take.summary = {
+            'scanned': stock_take.scans.count(),
+            'corrected': len(copies),
+            **{category: len(report[category]) for category in CATEGORIES},
+        }
+        stock_take.save(update_fields=['status', 'applied_at', 'summary'])
+    return report
@@ -0,0 +1,72 @@
+# File: library/tasks.py
+import os
+
+from django.core.management import call_command
+
+from . import changes
+
+from .concurrency import retry_on_conflict
+from .jobs import check_lease, job
+from .models import Reservation
+from .notifications import queue_reservation, queue_reservations
+
+
+@job('expire_reservations')
+def expire_reservations(payload):
+    # Scheduled runs carry the leader's fencing token; a run queued by a
+    # timer that has since lost leadership stops instead of racing the new one.
+    call_command(
+        'expire_reservations', branch=payload.get('branch'),
+        lease=payload.get('lease'), fencing_token=payload.get('fencing_token'),
+    )
+
+
+@job('rollup_circulation')
+def rollup_circulation(payload):
+    call_command('rollup_circulation')
+
+
+@job('compact_changes')
+def compact_changes(payload):
+    call_command('compact_changes')
+
+
+@job('sequence_changes')
+def sequence_changes(payload):
+    changes.sequence_pending()
+
+
+@job('archive_circulation')
+def archive_circulation(payload):
+    call_command('archive_circulation')
+
+
+@job('send_notifications')
+def send_notifications(payload):
+    call_command('send_notifications')
+
+
+@job('process_reservation')
+def process_reservation(payload):
+    """Assign a copy to a reservation placed through the intake API and confirm it."""
+    reservation = Reservation.objects.select_related('user', 'book').filter(pk=payload['reservation']).first()
+    if reservation is None or reservation.status != 'pending':
+        return
+    check_lease()
+    # On success the save signal queues the "ready for pickup" e-mail.
+    if not retry_on_conflict(reservation, Reservation.assign_available_copy):
+        queue_reservation(reservation, created=True)
+
+
+@job('notify_reservations')
+def queue_reservation_notifications(payload):
+    queue_reservations(
+        Reservation.objects.select_related('user', 'book').filter(pk__in=payload['reservations'])
+    )
+
+
+@job('import_users')
+def import_users(payload):
+    # Rosters uploaded through the admin; a rerun skips the users already created.
+    call_command('import_users', payload['path'], unusable_passwords=payload.get('unusable_passwords', False))
+    os.remove(payload['path'])
@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import csv
+import gzip
+import html
+import importlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import changes, copy_events, notifications, transfers
+from .admin import (
+    BookCopyAdmin, BorrowingForm, CopyEventAdmin, NotificationAdmin, ReservationAdmin, ReservationHistoryAdmin,
+)
+from .circulation import checkin, checkout
+from .concurrency import ConcurrentUpdateError, retry_on_conflict
+from .dedupe import book_keys
+from .exports import export_rows
+from .history import archive_reservations
+from .hold_shelf import confirm_pickups, pick_up
+from .jobs import HANDLERS, Worker, check_lease, claim, enqueue
+from .leadership import LeaderElector, LeadershipLost, acquire, check_token, release
+from .models import (
+    Book, BookCopy, Borrowing, Branch, ChangeRecord, CirculationPolicy, CopyEvent, DailyCirculationStat, Job,
+    LeaderLease, Notification, NotificationDigest, Reservation, ReservationHistory, StockTake, TransferRequest, User,
+)
+from .reservations import place_reservation
+from .stocktake import add_scans, apply_corrections
+from .user_import import import_users
+from .waitlist import CACHE_KEY as WAITLIST_CACHE_KEY, waitlist_status
+
+
+class OptimisticConcurrencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.copy = BookCopy.objects.create(book=self.book, location='L1-A-01')
+        self.borrowing = Borrowing.objects.create(
+            user=self.user, copy=self.copy, due_date=timezone.now() + timedelta(days=14)
+        )
+
+    def test_second_writer_with_stale_version_is_rejected(self):
+        first = Borrowing.objects.get(pk=self.borrowing.pk)
+        second = Borrowing.objects.get(pk=self.borrowing.pk)
+
+        first.renewal_count = 1
+        first.save()
+        second.renewal_count = 2
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            second.save()
+
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.renewal_count, 1)
+        self.assertEqual(self.borrowing.version, first.version)
+
+    def test_update_fields_save_bumps_version(self):
+        reservation = Reservation.objects.create(
+            user=self.user, book=self.book, status='canceled', expiration_date=timezone.now()
+        )
+        stale = Reservation.objects.get(pk=reservation.pk)
+        reservation.status = 'expired'
+        reservation.save(update_fields=['status'])
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            stale.save(update_fields=['status'])
+
+    def test_admin_form_reports_conflict(self):
+        stale = Borrowing.objects.get(pk=self.borrowing.pk)
+        data = {
+            'user': self.user.pk, 'copy': self.copy.pk, 'due_date': stale.due_date,
+            'renewal_count': 0, 'loaded_version': stale.version,
+        }
+        Borrowing.objects.get(pk=self.borrowing.pk).renew()
+
+        form = BorrowingForm(data=data, instance=stale)
+        self.assertFalse(form.is_valid())
+        self.assertIn('changed by someone else', str(form.non_field_errors()))
+
+    def test_retry_on_conflict_reloads_and_retries(self):
+        stale = Borrowing.objects.get(pk=self.borrowing.pk)
+        Borrowing.objects.get(pk=self.borrowing.pk).renew()
+
+        retry_on_conflict(stale, Borrowing.renew)
+
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.renewal_count, 2)
+
+
+class LeaderElectionTests(TestCase):
+    def test_only_one_holder_leads(self):
+        token = acquire('timer', 'host-a', ttl=10)
+        self.assertEqual(token, 1)
+        self.assertIsNone(acquire('timer', 'host-b', ttl=10))
+        self.assertEqual(acquire('timer', 'host-a', ttl=10), token)
+
+    def test_lapsed_lease_fails_over_with_new_token(self):
+        old_token = acquire('timer', 'host-a', ttl=10)
+        LeaderLease.objects.filter(name='timer').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        new_token = acquire('timer', 'host-b', ttl=10)
+
+        self.assertEqual(new_token, old_token + 1)
+        self.assertIsNone(acquire('timer', 'host-a', ttl=10))
+        check_token('timer', new_token)
+        with self.assertRaises(LeadershipLost):
+            check_token('timer', old_token)
+
+    def test_release_hands_over_immediately(self):
+        leader = LeaderElector('timer', holder='host-a', ttl=10)
+        follower = LeaderElector('timer', holder='host-b', ttl=10)
+        self.assertIsNotNone(leader.ensure())
+        self.assertIsNone(follower.ensure())
+
+        leader.release()
+
+        self.assertIsNotNone(follower.ensure())
+        self.assertTrue(follower.is_leader)
+        self.assertFalse(release('timer', 'host-a'))
+
+
+class ParallelTestCase(TransactionTestCase):
+    THREADS = 8
+
+    def run_in_parallel(self, func):
+        """Call ``func`` from THREADS threads at once. Returns ``(results, errors)``."""
+        barrier = threading.Barrier(self.THREADS)
+        results, errors = [], []
+
+        def run():
+            try:
+                barrier.wait()
+                for attempt in range(100):
+                    try:
+                        results.append(func())
+                        break
+                    except OperationalError:  # SQLite: another writer holds the lock
+                        time.sleep(0.01)
+                else:
+                    errors.append('gave up waiting for the database lock')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+
+class ParallelPickupTests(ParallelTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.copy = BookCopy.objects.create(book=self.book, location='L1-A-01')
+        self.reservation = Reservation.objects.create(
+            user=self.user, book=self.book, expiration_date=timezone.now() + timedelta(days=7)
+        )
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'assigned')
+
+    def assert_picked_up_once(self):
+        self.reservation.refresh_from_db()
+        self.copy.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'picked_up')
+        self.assertEqual(self.copy.status, 'borrowed')
+        self.assertEqual(Borrowing.objects.filter(reservation=self.reservation).count(), 1)
+        self.assertEqual(Borrowing.objects.filter(copy=self.copy).count(), 1)
+
+    def test_parallel_pickups_open_one_borrowing(self):
+        results, errors = self.run_in_parallel(lambda: pick_up(self.reservation.pk))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertEqual(len({borrowing.pk for borrowing, _ in results}), 1)
+        self.assert_picked_up_once()
+
+    def test_parallel_saves_to_picked_up_open_one_borrowing(self):
+        def save():
+            reservation = Reservation.objects.get(pk=self.reservation.pk)
+            reservation.status = 'picked_up'
+            try:
+                reservation.save()
+            except ConcurrentUpdateError:
+                return False
+            return True
+
+        results, errors = self.run_in_parallel(save)
+
+        self.assertEqual(errors, [])
+        self.assertGreaterEqual(sum(results), 1)
+        self.assert_picked_up_once()
+
+    def test_repeated_pickup_returns_the_same_borrowing(self):
+        borrowing, created = pick_up(self.reservation.pk)
+        again, created_again = pick_up(self.reservation.pk)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, borrowing.pk)
+        self.assert_picked_up_once()
+
+
+class ParallelVersionTests(ParallelTestCase):
+    def setUp(self):
+        user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        copy = BookCopy.objects.create(book=Book.objects.create(title='1984', author='George Orwell'))
+        self.borrowing = Borrowing.objects.create(user=user, copy=copy, due_date=timezone.now() + timedelta(days=14))
+
+    def test_one_of_many_stale_writers_wins(self):
+        # Every thread read the row before any of them writes.
+        stale = iter([Borrowing.objects.get(pk=self.borrowing.pk) for _ in range(self.THREADS)])
+        mine = {}
+
+        def save():
+            if threading.get_ident() not in mine:  # Not again when retrying after a lock timeout
+                mine[threading.get_ident()] = next(stale)
+            borrowing = mine[threading.get_ident()]
+            borrowing.renewal_count = len(mine)
+            try:
+                borrowing.save()
+            except ConcurrentUpdateError:
+                return None
+            return borrowing.renewal_count
+
+        results, errors = self.run_in_parallel(save)
+
+        self.assertEqual(errors, [])
+        [winner] = [result for result in results if result is not None]
+        self.borrowing.refresh_from_db()
+        self.assertEqual((self.borrowing.renewal_count, self.borrowing.version), (winner, 1))
+
+    def test_retried_increments_are_not_lost(self):
+        def increment(borrowing):
+            borrowing.renewal_count += 1
+            borrowing.save()
+
+        results, errors = self.run_in_parallel(lambda: retry_on_conflict(
+            Borrowing.objects.get(pk=self.borrowing.pk), increment, attempts=self.THREADS,
+        ))
+
+        self.assertEqual(errors, [])
+        self.borrowing.refresh_from_db()
+        self.assertEqual(self.borrowing.renewal_count, self.THREADS)
+
+
+@override_settings(LIBRARY_JOB_CONCURRENCY={'limited': 2})
+class ParallelClaimTests(ParallelTestCase):
+    def setUp(self):
+        for n in range(self.THREADS):
+            enqueue('limited', {'n': n})
+
+    def test_parallel_claims_respect_the_concurrency_limit(self):
+        results, errors = self.run_in_parallel(lambda: claim(f'worker-{threading.get_ident()}', kinds=['limited']))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len([job for job in results if job is not None]), 2)
+        self.assertEqual(Job.objects.filter(kind='limited', status='running').count(), 2)
+
+
+class PlaceReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.books = [Book.objects.create(title=f'Book {n}', author='Author') for n in range(3)]
+
+    def test_hold_limit(self):
+        CirculationPolicy.objects.create(role='student', max_holds=2)
+        place_reservation(self.user, self.books[0])
+        place_reservation(self.user, self.books[1])
+        with self.assertRaisesMessage(ValidationError, 'Maximum number of active reservations (2)'):
+            place_reservation(self.user, self.books[2])
+
+    def test_client_token_replay_returns_the_first_reservation(self):
+        first, created = place_reservation(self.user, self.books[0], client_token='t-1')
+        again, created_again = place_reservation(self.user, self.books[0], client_token='t-1')
+        self.assertEqual((again.pk, created, created_again), (first.pk, True, False))
+        other = User.objects.create_user('other', email='other@example.com', password='x')
+        with self.assertRaisesMessage(ValidationError, 'another user'):
+            place_reservation(other, self.books[0], client_token='t-1')
+
+    def test_duplicate_book_is_rejected(self):
+        place_reservation(self.user, self.books[0])
+        with self.assertRaisesMessage(ValidationError, 'already have an active reservation'):
+            place_reservation(self.user, self.books[0])
+
+    def test_integrity_error_from_enqueue_is_not_reported_as_duplicate(self):
+        with mock.patch('library.reservations.enqueue', side_effect=IntegrityError('job constraint')):
+            with self.assertRaises(IntegrityError):
+                place_reservation(self.user, self.books[0])
+        self.assertFalse(Reservation.objects.exists())
+
+
+class ParallelReservationTests(ParallelTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+
+    def test_parallel_replays_create_one_reservation(self):
+        results, errors = self.run_in_parallel(lambda: place_reservation(self.user, self.book, client_token='t-1'))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(created for _, created in results), 1)
+        self.assertEqual(len({reservation.pk for reservation, _ in results}), 1)
+
+    def test_parallel_requests_for_one_book_create_one_reservation(self):
+        results, errors = self.run_in_parallel(lambda: place_reservation(self.user, self.book))
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(errors), self.THREADS - 1)
+        self.assertTrue(all(isinstance(error, ValidationError) for error in errors))
+        self.assertEqual(Reservation.objects.filter(user=self.user, book=self.book).count(), 1)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+
+    def test_archives_reservation_that_is_still_referenced(self):
+        reservation = Reservation.objects.create(
+            user=self.user, book=self.book, expiration_date=timezone.now() + timedelta(days=7)
+        )
+        reservation.cancel()
+        Reservation.objects.filter(pk=reservation.pk).update(expiration_date=timezone.now() - timedelta(days=1))
+        self.assertTrue(Notification.objects.filter(reservation_id=reservation.pk).exists())
+        east = Branch.objects.create(code='EAST', name='East')
+        TransferRequest.objects.create(
+            copy=BookCopy.objects.create(book=self.book, location='E1-A-01', branch=east),
+            from_branch=east, to_branch=reservation.branch, reservation=reservation, status='canceled',
+        )
+
+        self.assertEqual(sum(archive_reservations(timezone.now())), 1)
+
+        self.assertFalse(Reservation.objects.filter(pk=reservation.pk).exists())
+        self.assertTrue(ReservationHistory.objects.filter(pk=reservation.pk).exists())
+        self.assertTrue(Notification.objects.filter(reservation_id=reservation.pk).exists())
+        self.assertTrue(TransferRequest.objects.filter(reservation_id=reservation.pk).exists())
+        # The references are checked when the transaction would commit.
+        connection.check_constraints()
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.east = Branch.objects.create(code='EAST', name='East')
+        self.copy = BookCopy.objects.create(book=self.book, location='L1-A-05', barcode='c1')
+        [self.transfer] = transfers.request_transfers([self.copy], self.east)
+        transfers.dispatch([self.transfer.pk])
+
+    def test_copy_in_transit_cannot_be_lent_or_shelved(self):
+        with self.assertRaises(ValidationError):
+            checkout('c1', self.user)
+        results, _ = checkin(['c1'])
+        self.assertEqual(results[0]['action'], 'in_transit')
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'in_transit')
+
+    def test_receive_skips_copies_no_longer_in_transit(self):
+        BookCopy.objects.filter(pk=self.copy.pk).update(status='borrowed')
+
+        self.assertEqual(transfers.receive([self.transfer.pk]), ([], [self.transfer.pk]))
+
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'borrowed')
+
+    def test_receive_shelves_copy_at_destination(self):
+        self.assertEqual(transfers.receive([self.transfer.pk]), ([self.transfer.pk], []))
+
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.branch_id), ('available', self.east.pk))
+
+    def test_receive_assigns_the_copy_to_the_hold_it_was_requested_for(self):
+        other = User.objects.create_user('other', email='other@example.com')
+        first, requested = [
+            Reservation.objects.create(
+                user=user, book=self.book, branch=self.east, expiration_date=timezone.now() + timedelta(days=7),
+            )
+            for user in (other, self.user)
+        ]
+        TransferRequest.objects.filter(pk=self.transfer.pk).update(reservation=requested)
+
+        transfers.receive([self.transfer.pk])
+
+        first.refresh_from_db()
+        requested.refresh_from_db()
+        self.assertEqual((requested.status, requested.copy_id), ('assigned', self.copy.pk))
+        self.assertEqual(first.status, 'pending')
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.main = Branch.objects.get(code='MAIN')
+        self.east = Branch.objects.create(code='EAST', name='East')
+        self.readers = [
+            User.objects.create_user(f'reader{n}', email=f'reader{n}@example.com') for n in range(3)
+        ]
+
+    def reserve(self, user, branch):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reservation.objects.create(
+                user=user, book=self.book, branch=branch, expiration_date=timezone.now() + timedelta(days=7),
+            )
+
+    def test_each_branch_has_its_own_queue(self):
+        self.reserve(self.readers[0], self.main)
+        self.reserve(self.readers[1], self.main)
+        self.reserve(self.readers[2], self.east)
+
+        status = waitlist_status(self.book, user=self.readers[1])
+        self.assertEqual((status['branch'], status['queue_length'], status['position']), (self.main.pk, 2, 2))
+        status = waitlist_status(self.book, branch_id=self.east.pk)
+        self.assertEqual((status['queue_length'], status['position']), (1, 2))
+
+    def test_repeated_lookup_is_served_from_the_cache(self):
+        waitlist_status(self.book, branch_id=self.main.pk)
+        with self.assertNumQueries(0):
+            waitlist_status(self.book, branch_id=self.east.pk)
+
+    def test_new_reservation_drops_the_snapshot(self):
+        self.assertEqual(waitlist_status(self.book, branch_id=self.main.pk)['queue_length'], 0)
+        self.reserve(self.readers[0], self.main)
+        self.assertEqual(waitlist_status(self.book, branch_id=self.main.pk)['queue_length'], 1)
+
+    def test_copy_in_transit_counts_at_the_receiving_branch(self):
+        copy = BookCopy.objects.create(book=self.book, branch=self.main, barcode='c1')
+        [transfer] = transfers.request_transfers([copy], self.east)
+        with self.captureOnCommitCallbacks(execute=True):
+            transfers.dispatch([transfer.pk])
+        self.reserve(self.readers[0], self.east)
+
+        status = waitlist_status(self.book, user=self.readers[0])
+        self.assertEqual((status['branch'], status['position']), (self.east.pk, 1))
+        self.assertIsNotNone(status['estimated_available'])
+        self.assertIsNone(waitlist_status(self.book, branch_id=self.main.pk)['estimated_available'])
+
+
+class StockTakeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.main = Branch.objects.get(code='MAIN')
+        self.east = Branch.objects.create(code='EAST', name='East')
+        self.copy = BookCopy.objects.create(book=self.book, branch=self.main, location='L1-A-05', barcode='c1')
+        self.reader = User.objects.create_user('reader', email='reader@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reservation = Reservation.objects.create(
+                user=self.reader, book=self.book, branch=self.east, expiration_date=timezone.now() + timedelta(days=7),
+            )
+
+    def apply(self, stock_take, location):
+        add_scans(stock_take, [(1, 'c1', location, '')])
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_corrections(stock_take)
+
+    def test_copy_found_at_another_branch_is_matched_there(self):
+        self.assertEqual(waitlist_status(self.book, branch_id=self.east.pk)['queue_length'], 1)
+
+        self.apply(StockTake.objects.create(name='East shelves', branch=self.east), 'E1-A-01')
+
+        self.copy.refresh_from_db()
+        self.reservation.refresh_from_db()
+        self.assertEqual((self.copy.branch_id, self.copy.status), (self.east.pk, 'reserved'))
+        self.assertEqual((self.reservation.status, self.reservation.copy_id), ('assigned', self.copy.pk))
+        self.assertEqual(waitlist_status(self.book, branch_id=self.east.pk)['queue_length'], 0)
+
+    def test_copy_moved_within_its_branch_drops_the_waitlist(self):
+        waitlist_status(self.book, branch_id=self.main.pk)
+        self.assertIsNotNone(cache.get(WAITLIST_CACHE_KEY % self.book.pk))
+
+        self.apply(StockTake.objects.create(name='Main shelves', branch=self.main), 'L2-B-01')
+
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.location, self.copy.status), ('L2-B-01', 'available'))
+        self.assertIsNone(cache.get(WAITLIST_CACHE_KEY % self.book.pk))
+
+
+class HoldWindowTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', email='reader@example.com')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        CirculationPolicy.objects.create(hold_days=3)
+        self.later = timezone.now() + timedelta(days=30)
+
+    def assertHeldForThreeDays(self, reservation):
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'assigned')
+        self.assertAlmostEqual(
+            reservation.expiration_date, timezone.now() + timedelta(days=3), delta=timedelta(minutes=1),
+        )
+
+    def test_assignment_on_placing_starts_the_hold_window(self):
+        BookCopy.objects.create(book=self.book)
+        reservation = Reservation.objects.create(user=self.reader, book=self.book, expiration_date=self.later)
+        self.assertHeldForThreeDays(reservation)
+
+    def test_assignment_by_the_matcher_starts_the_hold_window(self):
+        reservation = Reservation.objects.create(user=self.reader, book=self.book, expiration_date=self.later)
+        BookCopy.objects.create(book=self.book)
+        self.assertHeldForThreeDays(reservation)
+
+
+class MatchingAuditTests(TestCase):
+    def test_assignment_by_the_matcher_is_audited(self):
+        from auditlog.models import LogEntry
+
+        user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        book = Book.objects.create(title='1984', author='George Orwell')
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = Reservation.objects.create(
+                user=user, book=book, expiration_date=timezone.now() + timedelta(days=7)
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            BookCopy.objects.create(book=book, location='L1-A-01')
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'assigned')
+        entry = LogEntry.objects.get_for_object(reservation).filter(action=LogEntry.Action.UPDATE).get()
+        self.assertEqual(entry.changes_dict['status'], ['pending', 'assigned'])
+
+
+class AuditLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reservations = [
+                Reservation.objects.create(
+                    user=self.user, book=self.book, status='canceled', expiration_date=timezone.now(),
+                )
+                for _ in range(2)
+            ]
+
+    def test_saves_in_one_transaction_give_one_entry_per_object(self):
+        from auditlog.models import LogEntry
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            for reservation in self.reservations:
+                for status in ('expired', 'canceled', 'expired'):
+                    reservation.status = status
+                    reservation.save()
+
+        for reservation in self.reservations:
+            [entry] = LogEntry.objects.get_for_object(reservation).filter(action=LogEntry.Action.UPDATE)
+            self.assertEqual(entry.changes_dict['status'], ['canceled', 'expired'])
+
+    def test_rolled_back_transaction_writes_nothing(self):
+        from auditlog.models import LogEntry
+
+        before = LogEntry.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.reservations[0].status = 'expired'
+                self.reservations[0].save()
+                raise RuntimeError
+        self.assertEqual(LogEntry.objects.count(), before)
+
+    def test_archive_rerun_after_interruption_archives_each_entry_once(self):
+        from auditlog.models import LogEntry
+
+        LogEntry.objects.update(timestamp=timezone.now() - timedelta(days=400))
+        ids = set(LogEntry.objects.values_list('id', flat=True))
+        with tempfile.TemporaryDirectory() as archive_dir:
+            # Stops after writing the first file, before its entries are deleted.
+            with mock.patch('library.management.commands.archive_auditlog.transaction.atomic', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    call_command('archive_auditlog', output_dir=archive_dir, batch_size=1, stdout=StringIO())
+            call_command('archive_auditlog', output_dir=archive_dir, batch_size=1, stdout=StringIO())
+
+            archived = []
+            for name in os.listdir(archive_dir):
+                with gzip.open(os.path.join(archive_dir, name), 'rt') as archive:
+                    archived += [json.loads(line)['id'] for line in archive]
+        self.assertEqual(sorted(archived), sorted(ids))
+        self.assertFalse(LogEntry.objects.exists())
+
+
+class JobLeaseTests(TestCase):
+    def setUp(self):
+        self.side_effects = []
+        self.job = enqueue('lease_test')
+        self.addCleanup(HANDLERS.pop, 'lease_test', None)
+
+    def take_over(self):
+        # What another worker does once this worker's lease has run out.
+        Job.objects.filter(pk=self.job.pk).update(
+            locked_by='other-worker', lease_expires_at=timezone.now() + timedelta(seconds=60)
+        )
+
+    def run_job(self, handler):
+        HANDLERS['lease_test'] = handler
+        self.assertTrue(Worker(worker_id='this-worker', kinds=['lease_test']).run_one())
+        self.job.refresh_from_db()
+
+    def test_handler_stops_after_losing_the_lease(self):
+        def handler(payload):
+            check_lease()
+            self.take_over()
+            check_lease()
+            self.side_effects.append('sent')
+
+        self.run_job(handler)
+
+        self.assertEqual(self.side_effects, [])
+        self.assertEqual((self.job.status, self.job.locked_by), ('running', 'other-worker'))
+
+    def test_lost_lease_is_not_reported_as_done_or_failed(self):
+        self.run_job(lambda payload: self.take_over())
+        self.assertEqual((self.job.status, self.job.locked_by), ('running', 'other-worker'))
+
+        self.job = enqueue('lease_test')
+
+        def handler(payload):
+            self.take_over()
+            raise RuntimeError('boom')
+
+        self.run_job(handler)
+        self.assertEqual((self.job.status, self.job.locked_by, self.job.last_error), ('running', 'other-worker', ''))
+
+    def test_check_lease_outside_a_job_does_nothing(self):
+        check_lease()
+
+
+class CirculationPolicyTests(TestCase):
+    def test_scope_without_book_is_unique(self):
+        CirculationPolicy.objects.create(role='student', loan_days=7)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CirculationPolicy.objects.create(role='student', loan_days=21)
+
+    def test_book_scope_is_unique(self):
+        book = Book.objects.create(title='1984', author='George Orwell')
+        CirculationPolicy.objects.create(role='student', loan_days=7)
+        CirculationPolicy.objects.create(role='student', book=book, loan_days=3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CirculationPolicy.objects.create(role='student', book=book, loan_days=5)
+
+
+    def test_genre_is_stored_in_lookup_form(self):
+        policy = CirculationPolicy.objects.create(genre=' Fiction ', loan_days=3)
+        policy.refresh_from_db()
+        self.assertEqual(policy.genre, 'fiction')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CirculationPolicy.objects.create(genre='FICTION', loan_days=5)
+
+    def test_book_rule_cannot_name_a_genre(self):
+        book = Book.objects.create(title='1984', author='George Orwell', genre='Fiction')
+        with self.assertRaises(ValidationError):
+            CirculationPolicy(book=book, genre='fiction', loan_days=3).full_clean()
+
+class UserImportTests(TestCase):
+    def test_existing_email_matches_regardless_of_case(self):
+        User.objects.create_user(username='alice', email='Alice@Example.com')
+        created, skipped, errors = import_users(
+            [{'username': 'alice2', 'email': 'ALICE@example.com'}], unusable_passwords=True,
+        )
+        self.assertEqual((created, skipped, errors), (0, 1, []))
+        self.assertFalse(User.objects.filter(username='alice2').exists())
+
+    def test_user_created_after_lookup_fails_only_its_row(self):
+        def taken_meanwhile():
+            User.objects.create_user(username='bob', email='bob@example.com')
+        rows = [
+            {'username': 'alice', 'email': 'alice@example.com'},
+            {'username': 'bob', 'email': 'bob@example.com'},
+        ]
+        with mock.patch('library.user_import.check_lease', side_effect=taken_meanwhile):
+            created, skipped, errors = import_users(rows, unusable_passwords=True)
+        self.assertEqual((created, skipped), (1, 0))
+        self.assertEqual([line for line, _ in errors], [3])
+        self.assertTrue(User.objects.filter(username='alice').exists())
+
+    def test_admin_upload_is_imported_by_a_job(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        roster = SimpleUploadedFile('roster.csv', b'username,email\ncarol,carol@example.com\n', content_type='text/csv')
+        with tempfile.TemporaryDirectory() as upload_dir, override_settings(LIBRARY_USER_IMPORT_DIR=upload_dir):
+            response = self.client.post(reverse('admin:library_user_import'), {'roster_file': roster})
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(User.objects.filter(username='carol').exists())
+            queued = Job.objects.get(kind='import_users')
+            HANDLERS['import_users'](queued.payload)
+            self.assertTrue(User.objects.filter(username='carol').exists())
+            self.assertEqual(os.listdir(upload_dir), [])
+
+
+class BookCsvImportTests(TestCase):
+    HEADER = 'title,author,isbn,publisher,publication_year,genre\n'
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def upload(self, body):
+        csv_file = SimpleUploadedFile('books.csv', (self.HEADER + body).encode(), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('import_books_csv'), {'csv_file': csv_file})
+
+    def test_stores_canonical_isbn_and_rejects_overlong_ones(self):
+        self.upload(
+            '1984,George Orwell,0-451-52493-4,Signet,1950,Fiction\n'
+            'Animal Farm,George Orwell,978-0-452-28424-X,Signet,1946,Fiction\n'
+        )
+        self.assertEqual(list(Book.objects.values_list('title', 'isbn')), [('1984', '9780451524935')])
+
+    def test_row_failing_on_insert_skips_only_that_row(self):
+        Book.objects.create(title='Brave New World', author='Aldous Huxley', isbn='9780060850524')
+        rows = [
+            ('Dune', 'Frank Herbert', '9780441172719'),
+            ('Brave New World (Reissue)', 'Aldous Huxley', '9780060850524'),
+        ]
+        # As if the second ISBN had been catalogued after the duplicate check ran.
+        matches = [(book_keys(*row), None, []) for row in rows]
+        with mock.patch('library.views.find_duplicates', return_value=matches):
+            response = self.upload(''.join(f'{title},{author},{isbn},,,\n' for title, author, isbn in rows))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Book.objects.filter(title='Dune').exists())
+        self.assertFalse(Book.objects.filter(title__contains='Reissue').exists())
+
+
+class ImportBookTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def test_typed_isbn_is_stored_in_canonical_form(self):
+        found = mock.Mock(status_code=200)
+        found.json.return_value = {'totalItems': 1, 'items': [{'volumeInfo': {
+            'title': '1984', 'authors': ['George Orwell'], 'publisher': 'Signet', 'publishedDate': '1950',
+        }}]}
+        with mock.patch('requests.get', return_value=found) as get:
+            self.client.post(reverse('import_book'), {'isbn': ' 0-451-52493-4 '})
+        self.assertEqual(get.call_args.kwargs['params'], {'q': 'isbn:9780451524935'})
+
+        self.client.post(reverse('confirm_import'), {'num_copies': 1})
+
+        self.assertEqual(list(Book.objects.values_list('title', 'isbn')), [('1984', '9780451524935')])
+
+
+class DigestClaimTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com')
+        self.digest = NotificationDigest.objects.create(user=self.user, subject='Ready', message='Pick it up.')
+
+    def test_claimed_digest_is_not_sent_by_another_run(self):
+        self.assertEqual([digest.pk for digest in notifications.claim()], [self.digest.pk])
+        self.assertEqual(notifications.send_digests(window=0), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_digest_is_claimed_again_once_the_claim_runs_out(self):
+        notifications.claim()
+        NotificationDigest.objects.filter(pk=self.digest.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(notifications.send_digests(window=0), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.digest.refresh_from_db()
+        self.assertEqual((self.digest.status, self.digest.claimed_until), ('sent', None))
+
+
+    def test_admin_pages_through_notifications(self):
+        Notification.objects.bulk_create([
+            Notification(user=self.user, subject=f'Update {n}', message='...') for n in range(5)
+        ])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = reverse('admin:library_notification_changelist')
+        with mock.patch.object(NotificationAdmin, 'list_per_page', 3):
+            first = self.client.get(url)
+            older = re.search(r'<a href="([^"]*)">Older', first.content.decode())
+            second = self.client.get(url + html.unescape(older.group(1)))
+        self.assertEqual([n.subject for n in second.context['cl'].result_list], ['Update 1', 'Update 0'])
+
+
+class ConfirmPickupsTests(TestCase):
+    def test_values_that_are_not_ids_are_skipped(self):
+        self.assertEqual(confirm_pickups(['abc', '', '-1']), ([], ['abc', '', '-1']))
+
+    def test_pickup_is_audited(self):
+        from auditlog.models import LogEntry
+
+        user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        book = Book.objects.create(title='1984', author='George Orwell')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookCopy.objects.create(book=book, location='L1-A-01')
+            reservation = Reservation.objects.create(user=user, book=book, expiration_date=timezone.now())
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'assigned')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowings, skipped = confirm_pickups([reservation.pk])
+
+        self.assertEqual((len(borrowings), skipped), (1, []))
+        entry = LogEntry.objects.get_for_object(reservation).filter(action=LogEntry.Action.UPDATE).latest('pk')
+        self.assertEqual(entry.changes_dict['status'], ['assigned', 'picked_up'])
+
+
+    def test_single_pickup_is_audited_once(self):
+        from auditlog.models import LogEntry
+
+        user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        book = Book.objects.create(title='1984', author='George Orwell')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookCopy.objects.create(book=book, location='L1-A-01')
+            reservation = Reservation.objects.create(user=user, book=book, expiration_date=timezone.now())
+
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                pick_up(reservation.pk)
+
+        entries = LogEntry.objects.get_for_object(reservation).filter(action=LogEntry.Action.UPDATE)
+        pickups = [entry.changes_dict['status'] for entry in entries if 'picked_up' in entry.changes_dict['status']]
+        self.assertEqual(pickups, [['assigned', 'picked_up']])
+
+class CirculationRollupTests(TestCase):
+    def setUp(self):
+        self.day = timezone.localdate() - timedelta(days=1)
+        noon = timezone.make_aware(datetime.combine(self.day, datetime.min.time())) + timedelta(hours=12)
+        user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell', genre='Fiction')
+        copies = [BookCopy.objects.create(book=self.book, barcode=f'c{n}') for n in range(2)]
+        placed, held = [
+            Reservation.objects.create(user=user, book=self.book, status='canceled', expiration_date=noon)
+            for _ in range(2)
+        ]
+        Reservation.objects.filter(pk=placed.pk).update(reservation_date=noon)
+        Reservation.objects.filter(pk=held.pk).update(reservation_date=noon - timedelta(days=1))
+        walk_in = Borrowing.objects.create(user=user, copy=copies[0], due_date=noon + timedelta(days=14))
+        pickup = Borrowing.objects.create(
+            user=user, copy=copies[1], reservation=held, due_date=noon + timedelta(days=14),
+        )
+        Borrowing.objects.filter(pk=walk_in.pk).update(borrow_date=noon, return_date=noon + timedelta(hours=2))
+        Borrowing.objects.filter(pk=pickup.pk).update(borrow_date=noon)
+
+    def rollup(self):
+        call_command('rollup_circulation', since=str(self.day), until=str(self.day), stdout=StringIO())
+        return {
+            (row.dimension, row.key):
+                (row.borrows, row.returns, row.reservations, row.holds_filled, row.hold_wait_seconds)
+            for row in DailyCirculationStat.objects.filter(date=self.day)
+        }
+
+    def test_daily_totals_per_dimension(self):
+        expected = (2, 1, 1, 1, 86400)
+        self.assertEqual(self.rollup(), {
+            ('book', str(self.book.pk)): expected, ('genre', 'Fiction'): expected, ('role', 'student'): expected,
+        })
+
+    def test_rerun_replaces_the_rows(self):
+        first = self.rollup()
+        self.assertEqual(self.rollup(), first)
+        self.assertEqual(DailyCirculationStat.objects.count(), 3)
+
+
+class ReadinessTests(TestCase):
+    def test_database_error_is_logged_not_returned(self):
+        error = OperationalError('unable to open database file /srv/library/db.sqlite3')
+        with mock.patch('library.metrics.ping', side_effect=error), self.assertLogs('library.views', 'ERROR'):
+            response = self.client.get(reverse('readyz'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'status': 'unavailable'})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.user = User.objects.create_user(username='reader', email='reader@example.com')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+
+    def follow_pages(self, url, link='Older', between_pages=None):
+        """The pks shown on each page, following the rendered ``link`` links from ``url``."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row.pk for row in response.context['cl'].result_list])
+            following = re.search(rf'<a href="([^"]*)">[^<]*{link}', response.content.decode())
+            url = following and url.split('?')[0] + html.unescape(following.group(1))
+            if between_pages:
+                between_pages()
+        return pages
+
+    def archive(self, pks, **fields):
+        now = timezone.now()
+        ReservationHistory.objects.bulk_create([
+            ReservationHistory(**{
+                'id': pk, 'user': self.user, 'book': self.book, 'reservation_date': now, 'expiration_date': now,
+                'status': 'canceled', **fields,
+            })
+            for pk in pks
+        ])
+
+    def test_history_pages_past_the_first(self):
+        self.archive(range(1, 6))
+        with mock.patch.object(ReservationHistoryAdmin, 'list_per_page', 2):
+            pages = self.follow_pages(reverse('admin:library_reservationhistory_changelist'))
+        self.assertEqual(pages, [[5, 4], [3, 2], [1]])
+
+    def test_admin_with_its_own_template_keeps_it(self):
+        for _ in range(3):
+            Reservation.objects.create(user=self.user, book=self.book, status='canceled', expiration_date=timezone.now())
+        with mock.patch.object(ReservationAdmin, 'list_per_page', 2):
+            response = self.client.get(reverse('admin:library_reservation_changelist'))
+            pages = self.follow_pages(reverse('admin:library_reservation_changelist'))
+        self.assertContains(response, 'Hold shelf')
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+    def test_newer_links_walk_back_to_the_newest_row(self):
+        self.archive(range(1, 6))
+        url = reverse('admin:library_reservationhistory_changelist')
+        with mock.patch.object(ReservationHistoryAdmin, 'list_per_page', 2):
+            pages = self.follow_pages(f'{url}?after=3', link='Newer')
+        self.assertEqual(pages, [[2, 1], [4, 3], [5]])
+
+    def test_rows_added_while_paging_do_not_shift_the_pages(self):
+        self.archive(range(1, 6))
+        added = iter(range(6, 100))
+        with mock.patch.object(ReservationHistoryAdmin, 'list_per_page', 2):
+            pages = self.follow_pages(
+                reverse('admin:library_reservationhistory_changelist'),
+                between_pages=lambda: self.archive([next(added)]),
+            )
+        self.assertEqual(pages, [[5, 4], [3, 2], [1]])
+
+    def test_ties_on_another_sort_column_are_neither_skipped_nor_repeated(self):
+        self.archive(range(1, 6))
+        url = reverse('admin:library_reservationhistory_changelist')
+        seen = []
+        with mock.patch.object(ReservationHistoryAdmin, 'list_per_page', 2):
+            for page in range(1, 4):
+                response = self.client.get(url, {'o': '5', 'p': page})  # Reservation date, the same for all
+                self.assertFalse(response.context['cl'].keyset)
+                seen += [row.pk for row in response.context['cl'].result_list]
+        self.assertEqual(sorted(seen), [1, 2, 3, 4, 5])
+
+    def test_other_sort_order_falls_back_to_numbered_pages(self):
+        response = self.client.get(reverse('admin:library_reservationhistory_changelist') + '?o=4')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['cl'].keyset)
+        self.assertContains(response, 'class="paginator"')
+
+
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        book = Book.objects.create(title='1984', author='George Orwell', isbn='9780451524935')
+        for n in range(5):
+            BookCopy.objects.create(book=book, barcode=f'c{n}', location=f'L1-A-0{n}')
+        BookCopy.objects.filter(barcode='c4').update(status='borrowed')
+        self.url = reverse('admin:library_bookcopy_export_stream', args=['csv'])
+
+    def test_csv_honours_the_changelist_filters(self):
+        response = self.client.get(self.url, {'status__exact': 'available'})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bookcopy.csv"')
+        rows = list(csv.reader(line.decode() for line in response.streaming_content))
+        self.assertEqual(rows[0], [header for header, _ in BookCopyAdmin.export_columns])
+        self.assertEqual(sorted(row[3] for row in rows[1:]), ['c0', 'c1', 'c2', 'c3'])
+        self.assertEqual(rows[1][1:3], ['1984', '9780451524935'])
+
+    def test_joined_columns_need_no_query_per_row(self):
+        # Several chunks, still the one query: foreign key columns are joined into it.
+        with mock.patch('library.exports.CHUNK_SIZE', 2), self.assertNumQueries(1):
+            rows = list(export_rows(BookCopy.objects.order_by('pk'), BookCopyAdmin.export_columns))
+        self.assertEqual(len(rows), 6)
+
+    def test_xlsx_export(self):
+        response = self.client.get(reverse('admin:library_bookcopy_export_stream', args=['xlsx']))
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bookcopy.xlsx"')
+        self.assertEqual(b''.join(response.streaming_content)[:2], b'PK')
+
+
+class CopyEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        self.copy = BookCopy.objects.create(book=self.book, location='L1-A-05', barcode='c1')
+
+    def test_loans_and_changes_are_recorded(self):
+        borrowing = checkout('c1', self.user)
+        checkin(['c1'])
+        self.copy.refresh_from_db()
+        self.copy.condition, self.copy.location = 'damaged', 'L2-B-01'
+        self.copy.save()
+
+        events = list(copy_events.copy_history(self.copy.pk))
+        self.assertEqual(
+            [(event['kind'], event['borrowing_id'], event['new_value']) for event in events],
+            [('checkout', borrowing.pk, ''), ('checkin', borrowing.pk, ''), ('condition', None, 'damaged'),
+             ('relocation', None, 'L2-B-01')],
+        )
+        self.assertEqual([row['copy_id'] for row in copy_events.worsening_copies()], [self.copy.pk])
+
+    def test_backfill_migration_creates_loan_events(self):
+        borrowing = checkout('c1', self.user)
+        checkin(['c1'])
+        CopyEvent.objects.all().delete()
+        migration = importlib.import_module('library.migrations.0026_backfill_copy_events')
+        migration.backfill_loan_events(django_apps, None)
+        self.assertEqual(
+            sorted(CopyEvent.objects.values_list('kind', 'borrowing_id')),
+            [('checkin', borrowing.pk), ('checkout', borrowing.pk)],
+        )
+
+    def test_admin_lists_events_page_by_page(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        copy_events.write([CopyEvent(copy=self.copy, kind='relocation', new_value=f'L1-A-{n:02}') for n in range(5)])
+        url = reverse('admin:library_copyevent_changelist')
+        with mock.patch.object(CopyEventAdmin, 'list_per_page', 3):
+            first = self.client.get(url)
+            older = re.search(r'<a href="([^"]*)">Older', first.content.decode())
+            second = self.client.get(url + html.unescape(older.group(1)))
+        self.assertContains(first, 'L1-A-04')
+        self.assertEqual(len(first.context['cl'].result_list), 3)
+        self.assertEqual([event.new_value for event in second.context['cl'].result_list], ['L1-A-01', 'L1-A-00'])
+
+
+class HeldCopyCheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='x', role='student')
+        self.other = User.objects.create_user('other', email='other@example.com', password='x', role='student')
+        self.book = Book.objects.create(title='1984', author='George Orwell')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy = BookCopy.objects.create(book=self.book, location='L1-A-01', barcode='c1')
+            self.reservation = Reservation.objects.create(
+                user=self.user, book=self.book, expiration_date=timezone.now() + timedelta(days=7)
+            )
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'assigned')
+
+    def test_holder_checkout_picks_up_audits_and_notifies(self):
+        from auditlog.models import LogEntry
+
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowing = checkout('c1', self.user)
+
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'picked_up')
+        self.assertEqual(borrowing.reservation_id, self.reservation.pk)
+        entry = LogEntry.objects.get_for_object(self.reservation).filter(action=LogEntry.Action.UPDATE).latest('pk')
+        self.assertEqual(entry.changes_dict['status'], ['assigned', 'picked_up'])
+
+        job = Job.objects.filter(kind='notify_reservations').latest('pk')
+        self.assertEqual(job.payload, {'reservations': [self.reservation.pk]})
+        HANDLERS['notify_reservations'](job.payload)
+        self.assertTrue(Notification.objects.filter(
+            reservation_id=self.reservation.pk, subject='Book Pickup Confirmation',
+        ).exists())
+
+    def test_other_reader_cannot_take_the_held_copy(self):
+        with self.assertRaises(ValidationError):
+            checkout('c1', self.other)
+        self.reservation.refresh_from_db()
+        self.copy.refresh_from_db()
+        self.assertEqual((self.reservation.status, self.copy.status), ('assigned', 'reserved'))
+
+
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', email='reader@example.com', password='x')
+        cls.other = User.objects.create_user('other', email='other@example.com', password='x')
+        cls.staff = User.objects.create_user('staff', email='staff@example.com', password='x', is_staff=True)
+
+    def write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='1984', author='George Orwell')
+            reservation = Reservation.objects.create(
+                user=self.reader, book=book, status='canceled', expiration_date=timezone.now(),
+            )
+        return book, reservation
+
+    def test_records_are_numbered_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            book = Book.objects.create(title='1984', author='George Orwell')
+        record = ChangeRecord.objects.get(model='book', object_id=book.pk)
+        self.assertIsNone(record.seq)
+        self.assertEqual(changes.changes_since(0)[0], [])
+
+        for callback in callbacks:
+            callback()
+        record.refresh_from_db()
+        self.assertEqual(record.seq, changes.latest_seq())
+        self.assertEqual([r['object_id'] for r in changes.changes_since(0)[0]], [book.pk])
+
+    def test_unsequenced_records_are_picked_up(self):
+        with self.captureOnCommitCallbacks():  # The writer stops before its callbacks run
+            Book.objects.create(title='1984', author='George Orwell')
+        self.assertEqual(changes.sequence_pending(older_than=timedelta(0)), 1)
+        self.assertEqual(changes.sequence_pending(older_than=timedelta(0)), 0)
+        self.assertFalse(ChangeRecord.objects.filter(seq__isnull=True).exists())
+
+    def test_readers_see_catalog_and_their_own_records_in_order(self):
+        book, reservation = self.write()
+
+        records, cursor, has_more = changes.changes_since(0, user=self.reader)
+        self.assertEqual([(r['model'], r['object_id']) for r in records], [('book', book.pk), ('reservation', reservation.pk)])
+        self.assertEqual([r['seq'] for r in records], sorted(r['seq'] for r in records))
+        self.assertEqual((cursor, has_more), (changes.latest_seq(), False))
+        self.assertEqual([r['model'] for r in changes.changes_since(0, user=self.other)[0]], ['book'])
+        self.assertEqual(len(changes.changes_since(0, user=self.staff)[0]), len(records))
+
+    def test_cursor_pages_through_the_feed(self):
+        self.write()
+        first, cursor, has_more = changes.changes_since(0, limit=1)
+        self.assertTrue(has_more)
+        rest, _, has_more = changes.changes_since(cursor, limit=10)
+        self.assertFalse(has_more)
+        self.assertEqual([r['seq'] for r in first + rest], list(
+            ChangeRecord.objects.order_by('seq').values_list('seq', flat=True)
+        ))
+
+    def test_compaction_keeps_the_latest_record_per_object(self):
+        book, _ = self.write()
+        with self.captureOnCommitCallbacks(execute=True):
+            book.title = 'Nineteen Eighty-Four'
+            book.save()
+        latest = ChangeRecord.objects.filter(model='book', object_id=book.pk).latest('seq')
+
+        self.assertEqual(changes.compact(timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(list(ChangeRecord.objects.filter(model='book', object_id=book.pk)), [latest])
+        self.assertEqual(latest.data['title'], 'Nineteen Eighty-Four')
 
-# Create your tests here.
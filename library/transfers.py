@@ -0,0 +1,133 @@
+# File: library/transfers.py
+"""
+Moving copies between branches.
+
+A TransferRequest goes requested -> in_transit -> received. Dispatching
+takes the copy out of circulation at the sending branch ('in_transit', so
+neither branch's matching sees it); receiving moves it to the receiving
+branch and puts it on the shelf. A copy requested for a particular hold
+(``TransferRequest.reservation``) goes straight to that hold if it is still
+waiting; the others go through that branch's matching for their book.
+
+All steps work on batches, with one UPDATE per table, like the desk paths.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .changes import record_ids
+from .copy_events import write as write_events
+from .matching import assign, match_books
+from .models import BookCopy, CopyEvent, Reservation, TransferRequest
+from .waitlist import invalidate as invalidate_waitlist
+
+
+def request_transfers(copies, to_branch, user=None, reservation=None):
+    """
+    Request ``copies`` at ``to_branch``. Copies already there or already in
+    an open transfer are skipped. Returns the new requests.
+    """
+    copies = [copy for copy in copies if copy.branch_id != to_branch.pk]
+    busy = set(
+        TransferRequest.objects.filter(copy__in=copies, status__in=TransferRequest.OPEN_STATUSES)
+        .values_list('copy_id', flat=True)
+    )
+    return TransferRequest.objects.bulk_create([
+        TransferRequest(
+            copy=copy, from_branch_id=copy.branch_id, to_branch=to_branch, requested_by=user, reservation=reservation,
+        )
+        for copy in copies if copy.pk not in busy
+    ])
+
+
+def dispatch(transfer_ids):
+    """
+    Send requested transfers whose copy is on the shelf at the sending
+    branch. Returns ``(dispatched, skipped)`` transfer ids.
+    """
+    transfer_ids = list(dict.fromkeys(int(pk) for pk in transfer_ids))
+    with transaction.atomic():
+        transfers = list(
+            TransferRequest.objects.select_for_update().select_related('copy')
+            .filter(pk__in=transfer_ids, status='requested', copy__status='available', copy__branch=F('from_branch'))
+        )
+        ready = [transfer.pk for transfer in transfers]
+        skipped = [pk for pk in transfer_ids if pk not in set(ready)]
+        if not transfers:
+            return [], skipped
+        copy_ids = [transfer.copy_id for transfer in transfers]
+        # Conditional on the status, in case a copy was assigned or lent meanwhile.
+        if BookCopy.objects.filter(pk__in=copy_ids, status='available').update(status='in_transit') != len(copy_ids):
+            raise ValidationError("Some copies changed while dispatching; nothing was sent.")
+        TransferRequest.objects.filter(pk__in=ready).update(status='in_transit', dispatched_at=timezone.now())
+        record_ids(BookCopy, copy_ids)
+        invalidate_waitlist(*(transfer.copy.book_id for transfer in transfers))
+    return ready, skipped
+
+
+def receive(transfer_ids, location=None):
+    """
+    Check in transfers that arrived: their copies join the receiving branch
+    (at ``location``, if given) and waiting readers there are matched.
+    Transfers whose copy is no longer in transit are skipped. Returns
+    ``(received, skipped)`` transfer ids.
+    """
+    transfer_ids = list(dict.fromkeys(int(pk) for pk in transfer_ids))
+    now = timezone.now()
+    with transaction.atomic():
+        transfers = list(
+            TransferRequest.objects.select_for_update()
+            .select_related('copy', 'from_branch', 'to_branch')
+            .filter(pk__in=transfer_ids, status='in_transit', copy__status='in_transit')
+        )
+        received = [transfer.pk for transfer in transfers]
+        skipped = [pk for pk in transfer_ids if pk not in set(received)]
+        if not transfers:
+            return [], skipped
+        copy_ids = [transfer.copy_id for transfer in transfers]
+        # Conditional on the status, like dispatch: a copy that left transit
+        # some other way (lent, checked in) must not go back on the shelf.
+        if BookCopy.objects.filter(pk__in=copy_ids, status='in_transit').update(status='available') != len(copy_ids):
+            raise ValidationError("Some copies changed while receiving; nothing was received.")
+        copies, events = [], []
+        for transfer in transfers:
+            copy = transfer.copy
+            copy.branch = transfer.to_branch
+            copy.status = 'available'
+            if location:
+                copy.location = location
+            copies.append(copy)
+            events.append(CopyEvent(
+                copy_id=copy.pk, kind='transfer', timestamp=now,
+                old_value=transfer.from_branch.code, new_value=transfer.to_branch.code,
+            ))
+        BookCopy.objects.bulk_update(copies, ['branch', 'location'])
+        TransferRequest.objects.filter(pk__in=received).update(status='received', received_at=now)
+        write_events(events)
+        record_ids(BookCopy, [copy.pk for copy in copies])
+        invalidate_waitlist(*(copy.book_id for copy in copies))
+        # Copies requested for a hold go to it first, ahead of the branch's queue.
+        wanted = {transfer.reservation_id: transfer.copy for transfer in transfers if transfer.reservation_id}
+        waiting = Reservation.objects.select_for_update().select_related('user', 'book').filter(
+            pk__in=wanted, status='pending', copy__isnull=True,
+        )
+        pairs = []
+        for reservation in waiting:
+            copy = wanted[reservation.pk]
+            if (reservation.book_id, reservation.branch_id) == (copy.book_id, copy.branch_id):
+                pairs.append((reservation, copy))
+        assign(pairs, now)
+        by_branch = {}
+        held = {copy.pk for _, copy in pairs}
+        for copy in copies:
+            if copy.pk not in held:
+                by_branch.setdefault(copy.branch_id, set()).add(copy.book_id)
+        for branch_id, book_ids in by_branch.items():
+            match_books(book_ids, now=now, branch=branch_id)
+    return received, skipped
+
+
+def cancel(transfer_ids):
+    """Cancel transfers that have not been dispatched yet. Returns how many were canceled."""
+    return TransferRequest.objects.filter(pk__in=transfer_ids, status='requested').update(status='canceled')
@@ -0,0 +1,138 @@
+# File: library/user_import.py
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .jobs import check_lease
+from .models import User
+
+REQUIRED_COLUMNS = ('username', 'email')
+ROLES = dict(User.ROLE_CHOICES)
+
+
+def _init_worker():
+    # Needed when the pool spawns fresh interpreters instead of forking.
+    import django
+    django.setup()
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def read_roster(text_stream):
+    """Return a DictReader over a roster CSV after checking its header."""
+    reader = csv.DictReader(text_stream)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Roster is missing column(s): {', '.join(missing)}")
+    return reader
+
+
+def import_users(rows, batch_size=1000, unusable_passwords=False, workers=None):
+    """
+    Create the users described by ``rows`` (dicts with at least username and
+    email; first_name, last_name, role and password are optional).
+
+    Rows are processed in batches: existing usernames/emails are looked up
+    with one ``__in`` query per batch (e-mail compared case-insensitively,
+    through the ``user_email_lower_idx`` index), passwords are hashed in
+    parallel in a process pool and new users are written with
+    ``bulk_create``. A batch whose insert still fails (an account created
+    meanwhile) is retried row by row and only the failing rows are reported.
+    Rows without a password, or all rows when ``unusable_passwords`` is set
+    (SSO accounts), get an unusable password and skip hashing entirely.
+
+    The pool makes this unsuitable for a web request; the admin queues an
+    ``import_users`` job instead.
+
+    Returns ``(created, skipped, errors)`` where ``errors`` is a list of
+    ``(line_number, message)``.
+    """
+    created, skipped, errors = 0, 0, []
+    seen_usernames, seen_emails = set(), set()
+    executor = None
+    try:
+        for batch in _batched(enumerate(rows, start=2), batch_size):  # Line 1 is the header
+            candidates = []
+            for line, row in batch:
+                username = (row.get('username') or '').strip()
+                email = (row.get('email') or '').strip().lower()
+                role = (row.get('role') or 'student').strip().lower()
+                if not username or not email:
+                    errors.append((line, "username and email are required"))
+                    continue
+                if role not in ROLES:
+                    errors.append((line, f"unknown role '{role}'"))
+                    continue
+                if username in seen_usernames or email in seen_emails:
+                    skipped += 1
+                    continue
+                seen_usernames.add(username)
+                seen_emails.add(email)
+                candidates.append((line, username, email, role, row))
+
+            # Stored addresses may predate lower-casing on import, so compare on Lower(email).
+            existing = User.objects.alias(email_lower=Lower('email')).filter(
+                Q(username__in=[c[1] for c in candidates]) | Q(email_lower__in=[c[2] for c in candidates])
+            ).values_list('username', 'email')
+            taken_usernames, taken_emails = set(), set()
+            for username, email in existing:
+                taken_usernames.add(username)
+                taken_emails.add(email.lower())
+            new = [c for c in candidates if c[1] not in taken_usernames and c[2] not in taken_emails]
+            skipped += len(candidates) - len(new)
+
+            raw_passwords = [
+                None if unusable_passwords else (row.get('password') or None)
+                for _, _, _, _, row in new
+            ]
+            to_hash = [password for password in raw_passwords if password]
+            hashed = iter([])
+            if len(to_hash) > 1 and workers != 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker)
+                hashed = executor.map(make_password, to_hash, chunksize=max(1, len(to_hash) // 64))
+            elif to_hash:
+                hashed = map(make_password, to_hash)
+            hashed = iter(list(hashed))
+
+            users = []
+            for (_, username, email, role, row), raw in zip(new, raw_passwords):
+                users.append(User(
+                    username=username,
+                    email=email,
+                    role=role,
+                    first_name=(row.get('first_name') or '').strip(),
+                    last_name=(row.get('last_name') or '').strip(),
+                    password=next(hashed) if raw else make_password(None),
+                ))
+            check_lease()  # Under a worker: stop once another worker has taken the import over
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users, batch_size=batch_size)
+                created += len(users)
+            except (IntegrityError, DataError):
+                # Somebody took a username or address after the lookup above (or a value
+                # does not fit its column): keep the rest of the batch.
+                for (line, *_), user in zip(new, users):
+                    user.pk = None
+                    try:
+                        with transaction.atomic():
+                            User.objects.bulk_create([user])
+                    except (IntegrityError, DataError) as e:
+                        errors.append((line, f"could not be saved ({e})"))
+                    else:
+                        created += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return created, skipped, errors
@@ -1,21 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-import requests
-from .models import Reservation, Borrowing, Book, BookCopy
-from django.db import IntegrityError
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
+import csv
+import json
+import logging
+from io import TextIOWrapper
+from .models import Reservation, Borrowing, Book, BookCopy, Branch, User
+from .reservations import place_reservation
+from .circulation import checkout, checkin
+from .hold_shelf import pick_up
+from .concurrency import ConcurrentUpdateError
+from .waitlist import waitlist_status
+from .changes import changes_since, record_ids
+from django.db import DatabaseError, DataError, IntegrityError, transaction
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from . import metrics
+from .dedupe import canonical_isbn, find_duplicates
+
+logger = logging.getLogger(__name__)
 
 
 def import_book(request):
     if request.method == 'POST':
-        isbn = request.POST.get('isbn')
+        isbn = (request.POST.get('isbn') or '').strip()
         if not isbn:
             messages.error(request, "Please enter an ISBN.")
             return render(request, 'admin/import_book.html')
+        # Stored in ISBN-13 form, like the CSV import; anything else must still fit the column.
+        isbn = canonical_isbn(isbn) or isbn
+        if len(isbn) > 13:
+            messages.error(request, f"Invalid ISBN {isbn!r}.")
+            return render(request, 'admin/import_book.html')
         
         # Fetch book data from Google Books API
-        url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-        response = requests.get(url)
+        import requests  # Only needed here; keeps it out of every process that loads the URLconf
+
+        url = "https://www.googleapis.com/books/v1/volumes"
+        response = requests.get(url, params={'q': f'isbn:{isbn}'})
         if response.status_code == 200:
             data = response.json()
             if data['totalItems'] > 0:
@@ -29,7 +55,12 @@ def import_book(request):
                 }
                 # Store book data in session for the next step
                 request.session['book_data'] = book_data
-                return render(request, 'admin/confirm_import.html', {'book_data': book_data})
+                keys, isbn_match, near = find_duplicates([(book_data['title'], book_data['author'], isbn)])[0]
+                return render(request, 'admin/confirm_import.html', {
+                    'book_data': book_data,
+                    'isbn_match': isbn_match,
+                    'near_duplicates': [book for book in near if book != isbn_match],
+                })
             else:
                 messages.error(request, "No book found for this ISBN.")
         else:
@@ -46,19 +77,22 @@ def confirm_import(request):
         num_copies = int(request.POST.get('num_copies', 1))
         condition = request.POST.get('condition', 'good')
         
-        # Check if book with this ISBN already exists
-        book, created = Book.objects.get_or_create(
-            isbn=book_data['isbn'],
-            defaults={
-                'title': book_data['title'],
-                'author': book_data['author'],
-                'publisher': book_data['publisher'],
-                'publication_year': book_data['publication_year']
-            }
-        )
-        
-        if not created:
-            messages.warning(request, f"Book with ISBN {book_data['isbn']} already exists. Adding copies only.")
+        # Add the copies to a record picked on the confirmation page, to the
+        # book with the same ISBN in either ISBN-10 or ISBN-13 form, or create it.
+        target = request.POST.get('book', '')
+        book = Book.objects.filter(pk=target).first() if target.isdigit() else None
+        if book is None:
+            keys, book, near = find_duplicates([(book_data['title'], book_data['author'], book_data['isbn'])])[0]
+        if book is None:
+            book = Book.objects.create(
+                isbn=book_data['isbn'],
+                title=book_data['title'],
+                author=book_data['author'],
+                publisher=book_data['publisher'],
+                publication_year=book_data['publication_year'],
+            )
+        else:
+            messages.warning(request, f"'{book.title}' (ISBN {book.isbn}) already exists. Adding copies only.")
         
         # Create BookCopy instances
         for _ in range(num_copies):
@@ -73,44 +107,255 @@ def confirm_import(request):
     
     return redirect('import_book')
 
+MAX_IMPORT_MESSAGES = 20
+
+
+def _describe_match(match, lines):
+    # Matches are catalog books, or indexes of earlier rows of the same file.
+    if isinstance(match, int):
+        return f"line {lines[match]} of this file"
+    return f"'{match.title}' by {match.author} (#{match.pk})"
+
+
+@staff_member_required
 def import_books_csv(request):
     if request.method == 'POST':
-        csv_file = TextIOWrapper(request.FILES['csv_file'].file, encoding='utf-8')
+        csv_file = TextIOWrapper(request.FILES['csv_file'].file, encoding='utf-8-sig')
         reader = csv.DictReader(csv_file)
         required_fields = ['title', 'author', 'isbn', 'publisher', 'publication_year', 'genre']
         
-        if not all(field in reader.fieldnames for field in required_fields):
+        if not reader.fieldnames or not all(field in reader.fieldnames for field in required_fields):
             messages.error(request, "CSV must contain 'title', 'author', 'isbn', 'publisher', 'publication_year', and 'genre' columns.")
             return render(request, 'admin/import_books_csv.html')
-        
-        created_count = 0
-        for row in reader:
+        import_near_duplicates = bool(request.POST.get('import_near_duplicates'))
+
+        problems = []
+        rows = []
+        for line, row in enumerate(reader, start=2):
             try:
-                book, created = Book.objects.get_or_create(
-                    isbn=row['isbn'],
-                    defaults={
-                        'title': row['title'],
-                        'author': row['author'],
-                        'publisher': row['publisher'],
-                        'publication_year': int(row['publication_year']) if row['publication_year'] else None,
-                        'genre': row['genre']
-                    }
-                )
-                if created:
-                    created_count += 1
-                else:
-                    messages.warning(request, f"Book with ISBN {row['isbn']} already exists. Skipping.")
-            except KeyError as e:
-                messages.error(request, f"Missing field {e} in row for book {row.get('title', 'unknown')}.")
+                year = int(row['publication_year']) if row['publication_year'] else None
+            except ValueError:
+                problems.append(f"Line {line}: invalid publication year {row['publication_year']!r}.")
                 continue
-            except ValueError as e:
-                messages.error(request, f"Invalid data in row for book {row.get('title', 'unknown')}: {str(e)}")
+            # Valid ISBN-10s are stored in their ISBN-13 form; anything else must still fit the column.
+            isbn = canonical_isbn(row['isbn']) or (row['isbn'] or '').strip() or None
+            if isbn and len(isbn) > 13:
+                problems.append(f"Line {line}: invalid ISBN {row['isbn']!r}. Skipped.")
                 continue
-            except Exception as e:
-                messages.error(request, f"Error importing book {row.get('title', 'unknown')}: {str(e)}")
+            row['isbn'] = isbn
+            rows.append((line, row, year))
+
+        # One catalog query for the whole file; see library/dedupe.py.
+        lines = [line for line, _, _ in rows]
+        matches = find_duplicates([(row['title'], row['author'], row['isbn']) for _, row, _ in rows])
+        books, book_lines = [], []
+        for (line, row, year), (keys, isbn_match, near) in zip(rows, matches):
+            if isbn_match is not None:
+                problems.append(f"Line {line}: ISBN {row['isbn']} is already used by {_describe_match(isbn_match, lines)}. Skipped.")
                 continue
-        
-        messages.success(request, f"Successfully imported {created_count} books!")
+            if near and not import_near_duplicates:
+                problems.append(f"Line {line}: '{row['title']}' looks like a duplicate of {_describe_match(near[0], lines)}. Skipped.")
+                continue
+            books.append(Book(
+                title=row['title'],
+                author=row['author'],
+                isbn=row['isbn'],
+                publisher=row['publisher'],
+                publication_year=year,
+                genre=row['genre'],
+                **keys,
+            ))
+            book_lines.append(line)
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    created = Book.objects.bulk_create(books, batch_size=1000)
+            except (IntegrityError, DataError):
+                # A row the checks above let through (a value too long, an ISBN added meanwhile)
+                # must not cost the whole file: insert row by row and report the ones that fail.
+                created = []
+                for line, book in zip(book_lines, books):
+                    book.pk = None
+                    try:
+                        with transaction.atomic():
+                            Book.objects.bulk_create([book])
+                    except (IntegrityError, DataError) as e:
+                        problems.append(f"Line {line}: could not be saved ({e}). Skipped.")
+                    else:
+                        created.append(book)
+            record_ids(Book, [book.pk for book in created])
+
+        for problem in problems[:MAX_IMPORT_MESSAGES]:
+            messages.warning(request, problem)
+        if len(problems) > MAX_IMPORT_MESSAGES:
+            messages.warning(request, f"... and {len(problems) - MAX_IMPORT_MESSAGES} more rows skipped.")
+        messages.success(request, f"Successfully imported {len(created)} books!")
         return redirect('admin:library_book_changelist')
     
-    return render(request, 'admin/import_books_csv.html')
\ No newline at end of file
+    return render(request, 'admin/import_books_csv.html')
+
+
+def _json_body(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@require_POST
+def reserve_book(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+
+    book = Book.objects.filter(pk=data.get('book')).first() if str(data.get('book', '')).isdigit() else None
+    if book is None:
+        return JsonResponse({'error': 'Unknown book.'}, status=404)
+
+    branch = None
+    if data.get('branch'):
+        branch = Branch.objects.filter(code=data['branch']).first()
+        if branch is None:
+            return JsonResponse({'error': 'Unknown branch.'}, status=404)
+
+    client_token = request.headers.get('Idempotency-Key') or data.get('client_token')
+    try:
+        reservation, created = place_reservation(request.user, book, client_token=client_token, branch=branch)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=409)
+
+    return JsonResponse({
+        'id': reservation.id,
+        'book': reservation.book_id,
+        'branch': reservation.branch.code,
+        'status': reservation.status,
+        'reservation_date': reservation.reservation_date.isoformat(),
+        'expiration_date': reservation.expiration_date.isoformat(),
+    }, status=201 if created else 200)
+
+
+def book_waitlist(request, book_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None:
+        return JsonResponse({'error': 'Unknown book.'}, status=404)
+    branch_id = None
+    if request.GET.get('branch'):
+        branch_id = Branch.objects.filter(code=request.GET['branch']).values_list('pk', flat=True).first()
+        if branch_id is None:
+            return JsonResponse({'error': 'Unknown branch.'}, status=404)
+    status = waitlist_status(book, request.user, branch_id=branch_id)
+    if status['estimated_available'] is not None:
+        status['estimated_available'] = status['estimated_available'].isoformat()
+    return JsonResponse(status)
+
+
+def change_feed(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = min(int(request.GET.get('limit', 500)), 1000)
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers.'}, status=400)
+    records, cursor, has_more = changes_since(since, request.user, limit=max(limit, 1))
+    return JsonResponse({'changes': records, 'cursor': cursor, 'has_more': has_more})
+
+
+@staff_member_required
+@require_POST
+def circulation_checkout(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    user = User.objects.filter(username=data.get('user')).first()
+    if user is None:
+        return JsonResponse({'error': 'Unknown reader.'}, status=404)
+    try:
+        borrowing = checkout(data.get('barcode', ''), user)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=409)
+    except ConcurrentUpdateError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({
+        'borrowing': borrowing.id,
+        'barcode': borrowing.copy.barcode,
+        'user': user.username,
+        'due_date': borrowing.due_date.isoformat(),
+        'reservation': borrowing.reservation_id,
+    }, status=201)
+
+
+@staff_member_required
+@require_POST
+def circulation_checkin(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    # Batch scan mode: a list of barcodes (JSON) or one barcode per line (form).
+    barcodes = data.get('barcodes') or data.get('barcode') or []
+    if isinstance(barcodes, str):
+        barcodes = barcodes.splitlines()
+    results, unknown = checkin(barcodes)
+    return JsonResponse({'results': results, 'unknown': unknown})
+
+
+@staff_member_required
+@require_POST
+def circulation_pickup(request):
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    reservation_id = data.get('reservation')
+    if not str(reservation_id or '').isdigit() or not Reservation.objects.filter(pk=reservation_id).exists():
+        return JsonResponse({'error': 'Unknown reservation.'}, status=404)
+    try:
+        borrowing, created = pick_up(int(reservation_id))
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=409)
+    # Repeating a pickup (a retried request, a double scan) returns the same loan.
+    return JsonResponse({
+        'borrowing': borrowing.id,
+        'reservation': borrowing.reservation_id,
+        'barcode': borrowing.copy.barcode,
+        'user': borrowing.user.username,
+        'due_date': borrowing.due_date.isoformat(),
+    }, status=201 if created else 200)
+
+
+def metrics_view(request):
+    token = getattr(settings, 'LIBRARY_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    allowed = request.user.is_authenticated and request.user.is_staff
+    if token and authorization.startswith('Bearer '):
+        allowed = allowed or constant_time_compare(authorization[len('Bearer '):], token)
+    if not allowed:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    try:
+        body = metrics.exposition()
+    except DatabaseError:
+        logger.exception("Metrics unavailable: database error")
+        return HttpResponse('Database unavailable\n', status=503, content_type='text/plain')
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def healthz(request):
+    # Liveness: the process answers. The database is the readiness probe's
+    # business; restarting the web process would not bring it back.
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    # Probes are unauthenticated: the error (hosts, paths, driver details) goes to the log only.
+    try:
+        seconds = metrics.ping()
+    except DatabaseError:
+        logger.exception("Readiness check failed: database error")
+        return JsonResponse({'status': 'unavailable'}, status=503)
+    return JsonResponse({'status': 'ok', 'database_seconds': round(seconds, 6)})
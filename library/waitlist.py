@@ -0,0 +1,142 @@
+# File: library/waitlist.py
+"""
+Queue position and estimated availability for a book's waitlist.
+
+Every branch has its own queue, served only by its own copies. Both come
+from a snapshot held in the Django cache under one key per book, covering
+all of its branches: per branch, the pending reservations in queue order
+(from ``reservation_queue_idx``) and the dates on which each copy is
+expected back on the shelf (from the open loans' due dates). Copies in
+transit count towards the branch they are travelling to. Building a
+snapshot costs four indexed queries; afterwards a lookup is a dict access.
+Every transition that changes a book's queue, loans or transfers drops its
+snapshot, see ``invalidate``.
+
+With the default per-process cache, other processes notice a change only
+after LIBRARY_WAITLIST_CACHE_SECONDS; configure a shared cache backend to
+make invalidation immediate everywhere.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import BookCopy, Borrowing, Reservation, TransferRequest, default_branch_id
+from .policies import get_policy
+
+CACHE_KEY = 'library:waitlist:branches:%s'
+
+
+def _cache_seconds():
+    return getattr(settings, 'LIBRARY_WAITLIST_CACHE_SECONDS', 300)
+
+
+def _snapshot(book):
+    key = CACHE_KEY % book.pk
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    now = timezone.now()
+    branches = {}
+
+    def branch(branch_id):
+        return branches.setdefault(branch_id, {'positions': {}, 'supply': []})
+
+    queue = Reservation.objects.filter(book=book, status='pending').order_by('reservation_date', 'id')
+    for pk, branch_id in queue.values_list('pk', 'branch_id'):
+        positions = branch(branch_id)['positions']
+        positions[pk] = len(positions) + 1
+
+    # One entry per copy: the moment it is expected to be free for the next reader.
+    loan_days = get_policy(book=book).loan_days
+    copies = BookCopy.objects.filter(book=book).values_list('branch_id', 'status').annotate(count=Count('id'))
+    due_dates = Borrowing.objects.filter(
+        copy__book=book, return_date__isnull=True
+    ).order_by('due_date').values_list('copy__branch_id', 'due_date')
+    for branch_id, status, count in copies:
+        if status == 'available':
+            branch(branch_id)['supply'] += [now] * count
+        elif status == 'reserved':
+            # Copies on the hold shelf go out on loan first, then come back.
+            branch(branch_id)['supply'] += [now + timedelta(days=loan_days)] * count
+    for branch_id, due_date in due_dates:
+        branch(branch_id)['supply'].append(max(due_date, now))
+    # An in-transit copy still belongs to the sending branch, but it goes on the
+    # receiving branch's shelf (or straight to its hold shelf) when it arrives.
+    arriving = TransferRequest.objects.filter(
+        copy__book=book, status='in_transit', copy__status='in_transit'
+    ).values_list('to_branch_id', flat=True)
+    for branch_id in arriving:
+        branch(branch_id)['supply'].append(now)
+    for queue in branches.values():
+        queue['supply'].sort()
+
+    snapshot = {'branches': branches, 'loan_days': loan_days}
+    cache.set(key, snapshot, _cache_seconds())
+    return snapshot
+
+
+def estimate(snapshot, branch_id, position):
+    """
+    When the reader at ``position`` (1-based) of the branch's queue should
+    get a copy, assuming every copy comes back on time and each later reader
+    keeps it for a full loan. None for a branch without copies of the book.
+    """
+    supply = snapshot['branches'].get(branch_id, {}).get('supply')
+    if not supply:
+        return None
+    rounds, slot = divmod(position - 1, len(supply))
+    return supply[slot] + timedelta(days=snapshot['loan_days'] * rounds)
+
+
+def waitlist_status(book, user=None, branch_id=None):
+    """
+    Queue length for ``book`` at a branch and, for ``user``, their position
+    and the estimated availability date. An active reservation decides the
+    branch; otherwise ``branch_id``, the reader's home branch or the default
+    branch does, and the reader gets the position they would have if they
+    reserved there now.
+    """
+    snapshot = _snapshot(book)
+    reservation = None
+    if user is not None:
+        reservation = Reservation.objects.filter(
+            user=user, book=book, status__in=Reservation.ACTIVE_STATUSES
+        ).values('pk', 'status', 'branch_id').first()
+    if reservation is not None:
+        branch_id = reservation['branch_id']
+    elif branch_id is None:
+        branch_id = getattr(user, 'home_branch_id', None) or default_branch_id()
+
+    positions = snapshot['branches'].get(branch_id, {}).get('positions', {})
+    queue_length = len(positions)
+    result = {
+        'book': book.pk,
+        'branch': branch_id,
+        'queue_length': queue_length,
+        'reservation': None,
+        'status': None,
+        'position': queue_length + 1,
+        'estimated_available': None,
+    }
+    if reservation is not None:
+        result.update(reservation=reservation['pk'], status=reservation['status'])
+        if reservation['status'] == 'assigned':
+            # Waiting on the hold shelf right now.
+            result.update(position=0, estimated_available=timezone.now())
+            return result
+        # Placed after the snapshot was cached: it is at the back of the queue.
+        result['position'] = positions.get(reservation['pk'], queue_length + 1)
+    result['estimated_available'] = estimate(snapshot, branch_id, result['position'])
+    return result
+
+
+def invalidate(*book_ids):
+    """Drop the cached snapshots of ``book_ids`` once the current transaction commits."""
+    keys = [CACHE_KEY % book_id for book_id in set(book_ids) if book_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
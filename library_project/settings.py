@@ -132,4 +132,55 @@ AUTH_USER_MODEL = 'library.User'
 # Import-Export settings
 IMPORT_EXPORT_USE_TRANSACTIONS = True
 
+# Library circulation settings
+# Fallback policy; CirculationPolicy rows override it per role, genre or book.
+LIBRARY_DEFAULT_POLICY = {
+    'loan_days': 14,  # Loan period and length of each renewal
+    'max_renewals': 2,
+    'hold_days': 7,  # Days a reservation stays valid
+    'max_loans': 5,  # Concurrent open loans per user
+    'max_holds': 5,  # Pending + assigned reservations per user
+}
+LIBRARY_POLICY_CACHE_SECONDS = 60  # Reload interval for policy changes made by other processes
+LIBRARY_WAITLIST_CACHE_SECONDS = 300  # Lifetime of cached queue positions; transitions invalidate them sooner
+LIBRARY_DEFAULT_BRANCH = 'MAIN'  # Branch code for copies and reservations created without one
+LIBRARY_HOLD_SHELF_LOCATION = 'L1-A-01'  # Copies are matched to holds nearest to here first, unless the branch sets its own
+LIBRARY_ADMIN_COUNT_CACHE_SECONDS = 60  # Reuse changelist row counts for this long (see library/admin_changelist.py)
+
+# Background jobs (see library/jobs.py and the run_worker command)
+LIBRARY_JOB_CONCURRENCY = {  # Max jobs of a kind running at once across all workers
+    'expire_reservations': 4,  # Queued once per branch; branches are independent
+    'rollup_circulation': 1,
+    'compact_changes': 1,
+    'archive_circulation': 1,
+    'send_notifications': 1,  # A second run would send the same queued digests again
+    'import_users': 1,
+}
+LIBRARY_JOB_RETRY_BASE_SECONDS = 10  # Backoff before the first retry, doubled per attempt
+LIBRARY_LEADER_LEASE_SECONDS = 10  # How long run_timer.py keeps leadership without renewing (failover time)
+
+# Change feed (see library/changes.py and the compact_changes command)
+LIBRARY_CHANGE_RETENTION_DAYS = 30  # Older records are compacted to the latest one per object
+
+# Closed reservations and returned borrowings move to the history tables after this many days
+# (see library/history.py and the archive_circulation command)
+LIBRARY_CIRCULATION_ARCHIVE_DAYS = 180
+
+# Reservation e-mail (see library/notifications.py and the send_notifications command)
+LIBRARY_NOTIFICATION_DIGEST_SECONDS = 120  # Collect a reader's notifications this long into one digest
+LIBRARY_NOTIFICATION_HOURLY_LIMIT = 4  # Digests per reader per hour; later notifications wait for the next one
+LIBRARY_NOTIFICATION_CLAIM_SECONDS = 600  # A run that stopped mid-send leaves its digests to other runs after this long
+
+# Operations endpoints: /metrics, /healthz, /readyz (see library/metrics.py)
+LIBRARY_METRICS_CACHE_SECONDS = 15  # Reuse the computed aggregates for this long; the DB round trip is measured every scrape
+LIBRARY_METRICS_EXPIRY_HOURS = 24  # Holds whose pickup window ends within this many hours count as expiring
+LIBRARY_METRICS_TOKEN = os.environ.get('LIBRARY_METRICS_TOKEN')  # Bearer token for scrapers; staff can always read /metrics
+
+# Audit log retention (see the archive_auditlog command)
+LIBRARY_AUDIT_RETENTION_DAYS = 365
+LIBRARY_AUDIT_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Rosters uploaded in the admin wait here for the import_users job
+LIBRARY_USER_IMPORT_DIR = BASE_DIR / 'imports'
+
 DEBUG = True
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Lean settings for background processes: run_timer.py, run_worker and other
+short-lived management commands.
+
+Leaves out the admin and its add-ons (admin_interface, colorfield,
+import_export), whose app loading pulls in the admin site, openpyxl and
+tablib, plus sessions, messages and static files. Everything else comes
+from settings.py. Use it with:
+
+    python manage.py run_worker --settings=library_project.settings_worker
+
+Run migrations with the full settings; this profile does not know the
+admin's tables. The background commands also skip Django's system checks
+(``requires_system_checks = []``): the URL checks import the URLconf and,
+through it, the whole admin even under the full settings.
+"""
+from .settings import *  # noqa: F401,F403
+
+WORKER_EXCLUDED_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'admin_interface',
+    'colorfield',
+    'import_export',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WORKER_EXCLUDED_APPS]
+
+MIDDLEWARE = []
+# No HTTP in these processes; the URLconf would import the admin site.
+ROOT_URLCONF = None
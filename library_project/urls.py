@@ -17,10 +17,25 @@ Including another URLconf
 # library_project/urls.py
 from django.contrib import admin
 from django.urls import path, include
-from library.views import import_book,confirm_import, import_books_csv
+from library.views import (
+    import_book,confirm_import, import_books_csv, reserve_book, book_waitlist,
+    change_feed,
+    circulation_checkout, circulation_checkin, circulation_pickup,
+    metrics_view, healthz, readyz,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('import-book/', import_book, name='import_book'),
     path('confirm-import/', confirm_import, name='confirm_import'),
+    path('import-books-csv/', import_books_csv, name='import_books_csv'),
+    path('api/reservations/', reserve_book, name='reserve_book'),
+    path('api/books/<int:book_id>/waitlist/', book_waitlist, name='book_waitlist'),
+    path('api/changes/', change_feed, name='change_feed'),
+    path('circulation/checkout/', circulation_checkout, name='circulation_checkout'),
+    path('circulation/checkin/', circulation_checkin, name='circulation_checkin'),
+    path('circulation/pickup/', circulation_pickup, name='circulation_pickup'),
+    path('metrics', metrics_view, name='metrics'),
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
 ]
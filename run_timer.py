@@ -3,29 +3,72 @@ import os
 import schedule
 import time
 import django
-from django.core.management import call_command
 
 # Add the project root to the Python path
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(project_root)
 
 # Set up Django environment
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')  # Adjust if your settings module differs
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings_worker')  # Lean profile without the admin
 django.setup()
 
-def run_expire_reservations():
-    print("Running expire_reservations at", time.ctime())
+from library.jobs import enqueue
+from library.leadership import LeaderElector
+from library.models import Branch
+
+# Several timers may run for availability; only the holder of this lease
+# queues anything. Jobs carry its fencing token so that work queued by a
+# timer that has since lost the lease stops instead of racing the new leader.
+LEASE_NAME = 'run_timer'
+elector = LeaderElector(LEASE_NAME)
+
+# The timer only schedules work; `python manage.py run_worker` processes it.
+# The dedupe key keeps a slow run from piling up copies of the same job.
+def schedule_job(kind, branch=None):
+    name = f"{kind}:{branch}" if branch else kind
+    print(f"Queueing {name} at", time.ctime())
     try:
-        call_command('expire_reservations')
-        print("expire_reservations completed successfully")
+        payload = {'lease': LEASE_NAME, 'fencing_token': elector.token}
+        if branch:
+            payload['branch'] = branch
+        job = enqueue(kind, payload=payload, dedupe_key=name)
+        print(f"{name} queued as job {job.pk}")
     except Exception as e:
-        print(f"Error running expire_reservations: {e}")
+        print(f"Error queueing {name}: {e}")
+
+# One job per branch, so the workers can process the branches in parallel
+def schedule_per_branch(kind):
+    for code in Branch.objects.order_by('code').values_list('code', flat=True):
+        schedule_job(kind, code)
 
 # Schedule the task to run every minute
-schedule.every(1).minutes.do(run_expire_reservations)
+schedule.every(1).minutes.do(schedule_per_branch, 'expire_reservations')
+# Send the e-mail digests that are due every minute
+schedule.every(1).minutes.do(schedule_job, 'send_notifications')
+# Number change feed records whose writer stopped before it could
+schedule.every(1).minutes.do(schedule_job, 'sequence_changes')
+# Refresh yesterday's and today's statistics every night
+schedule.every().day.at("01:00").do(schedule_job, 'rollup_circulation')
+# Compact the change feed every night
+schedule.every().day.at("02:00").do(schedule_job, 'compact_changes')
+# Move old closed reservations and loans to the history tables every night
+schedule.every().day.at("03:00").do(schedule_job, 'archive_circulation')
 
 # Keep the script running
-print("Timer started. Press Ctrl+C to stop.")
-while True:
-    schedule.run_pending()
-    time.sleep(1)
\ No newline at end of file
+print(f"Timer started as {elector.holder}. Press Ctrl+C to stop.")
+try:
+    while True:
+        was_leader = elector.is_leader
+        try:
+            elector.ensure()
+        except Exception as e:
+            print(f"Error renewing leadership: {e}")
+        if elector.is_leader != was_leader:
+            state = f"leader (token {elector.token})" if elector.is_leader else "follower"
+            print(f"Now {state} at", time.ctime())
+        if elector.is_leader:
+            schedule.run_pending()
+        time.sleep(1)
+except KeyboardInterrupt:
+    # Hand over right away instead of making the next leader wait out the lease
+    elector.release()